@@ -0,0 +1,78 @@
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from synthetic_emr import PHRASES
+from common.boilerplate import learn_boilerplate, strip_boilerplate, report_boilerplate, boilerplate_stats
+from common.text_clean import clean_content
+
+# 合成病程中的固定套话（应学习为模板行并删除）
+TEMPLATES = ["以上病情已向患者及家属交代清楚，表示理解并同意。", "继续观察病情变化，随诊。"]
+# 每份记录各不相同的内容（不应删除）
+FINDINGS = ["右膝关节压痛（+）。", "浮髌试验（-）。", "双下肢未见明显水肿。"]
+
+
+def make_documents(n_patients=200, seed=0):
+    """
+    生成两种形态的日常病程（每位患者一个文件）：
+    hucm1st：经 clean_content 处理后只有一行；cstcm："列名: 值"字段行，套话在字段值中
+    :return: {中心: {患者ID: 文本}}
+    """
+    rng = random.Random(seed)
+    documents = {'hucm1st': {}, 'cstcm': {}}
+    for i in range(n_patients):
+        body = "".join(rng.sample(PHRASES, 4)) + rng.choice(FINDINGS) + f"患者今日第{i}次查房。"
+        stamp = f"2021-03-{i % 28 + 1:02d} 08:{i % 60:02d}"
+        documents['hucm1st'][f"H{i:05d}"] = clean_content(f"{stamp}\n{body}\n{TEMPLATES[0]}\n{TEMPLATES[1]}\n")
+        documents['cstcm'][f"C{i:05d}"] = f"记录时间: {stamp}\n病程内容: {body}{TEMPLATES[0]}{TEMPLATES[1]}\n"
+    return documents
+
+
+def write_tree(root, documents):
+    """写成输入目录结构：{患者ID}/日常病程记录.txt"""
+    for patient_id, text in documents.items():
+        os.makedirs(os.path.join(root, patient_id))
+        with open(os.path.join(root, patient_id, '日常病程记录.txt'), 'w', encoding='utf-8') as f:
+            f.write(text)
+
+
+def check_center(center, root, documents):
+    """学习并删除模板行：固定套话全部删除，检查所见、字段名和每份记录特有的内容保留"""
+    start = time.perf_counter()
+    table = learn_boilerplate(root)
+    learn_time = time.perf_counter() - start
+    learned = {item['line'] for item in table.get('日常病程记录', {}).get('lines', [])}
+    assert set(TEMPLATES) <= learned, f"{center}: 没有学习到固定套话（学习到 {sorted(learned)}）"
+    assert not any(finding in learned for finding in FINDINGS), f"{center}: 检查所见被当作模板行"
+
+    stats = {}
+    for patient_id, text in documents.items():
+        stripped, removed = strip_boilerplate(text, learned)
+        boilerplate_stats(stats, '日常病程记录', removed)
+        assert not any(template in stripped for template in TEMPLATES), f"{center}: 患者 {patient_id} 的套话未删除"
+        assert f"第{int(patient_id[1:])}次查房" in stripped, f"{center}: 患者 {patient_id} 的内容被删除"
+        assert all(phrase.strip() in learned for phrase in removed.split('\n')), f"{center}: 删除了非模板内容"
+    print(f"{center}: {len(documents)} 位患者，学习 {learn_time * 1e3:.0f} ms，得到 {len(learned)} 条模板行")
+    report_boilerplate(stats)
+
+
+def run(n_patients=200):
+    workspace = tempfile.mkdtemp(prefix='bench_boilerplate_')
+    try:
+        for center, documents in make_documents(n_patients).items():
+            root = os.path.join(workspace, center)
+            write_tree(root, documents)
+            check_center(center, root, documents)
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    # 用法：python bench_boilerplate.py [患者数]
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
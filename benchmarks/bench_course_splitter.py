@@ -0,0 +1,96 @@
+import os
+import random
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from common.course_splitter import TIMESTAMP_FORMATS, split_records, timestamp_pattern, timestamp_starts
+
+# 各格式时间戳的生成方式
+STAMP_TEMPLATES = {
+    'dash': "{y}-{m:02d}-{d:02d} {H:02d}:{M:02d}",
+    'dot_title': "{y}.{m:02d}.{d:02d} {H:02d}:{M:02d} 主治医师查房记录",
+    'slash': "{y}/{m}/{d} {H}:{M:02d}",
+    'chinese': "{y}年{m}月{d}日 {H:02d}:{M:02d}",
+}
+
+
+def legacy_split(content, pattern):
+    """原各中心手写的拆分循环（finditer 结果先全部放入列表再切片），作为对照"""
+    matches = list(re.finditer(pattern, content))
+    records = []
+    for i in range(len(matches)):
+        start = matches[i].start()
+        end = matches[i + 1].start() if i < len(matches) - 1 else len(content)
+        records.append(content[start:end].strip())
+    return records
+
+
+def make_course_documents(format_name, n_documents=2000, max_records=20, seed=0):
+    """生成合成的病程文本：每篇 1~max_records 条乱序的病程，开头带有一段前言"""
+    rng = random.Random(seed)
+    phrases = ["患者诉右膝关节疼痛较前缓解，", "夜间睡眠可，纳可，二便调。", "查体：右膝关节压痛（+），",
+               "浮髌试验（-），活动度可。", "继续目前治疗方案，密切观察病情变化。"]
+    documents = []
+    for _ in range(n_documents):
+        parts = ["病程记录\n"]
+        for _ in range(rng.randint(1, max_records)):
+            stamp = STAMP_TEMPLATES[format_name].format(y=2022, m=rng.randint(1, 12), d=rng.randint(1, 28),
+                                                        H=rng.randint(0, 23), M=rng.randint(0, 59))
+            parts.append(stamp + "\n" + "".join(rng.choice(phrases) for _ in range(rng.randint(3, 12))) + "\n\n")
+        documents.append("".join(parts))
+    return documents
+
+
+def check_timestamp_starts(n_samples=20000, seed=0):
+    """
+    由时间戳片段（数字、分隔符、全角/阿拉伯-印度数字、完整时间戳）随机拼接的文本上，
+    timestamp_starts 与完整正则的结果逐一对照
+    """
+    rng = random.Random(seed)
+    pieces = list("0123456789-/.年月日 :：\nx") + ["2022", "12", "２０", "٢", "09:12"] + \
+             [template.format(y=2022, m=1, d=2, H=3, M=4) for template in STAMP_TEMPLATES.values()]
+    formats = list(TIMESTAMP_FORMATS) + [None, ['dash', 'slash']]
+    found = 0
+    for _ in range(n_samples):
+        text = "".join(rng.choice(pieces) for _ in range(rng.randint(0, 30)))
+        for format_name in formats:
+            expected = [match.start() for match in timestamp_pattern(format_name).finditer(text)]
+            assert timestamp_starts(text, format_name) == expected, f"{format_name}: {text!r} 时间戳位置不一致"
+            found += len(expected)
+    print(f"时间戳位置: {n_samples} 段随机文本 x {len(formats)} 种格式组合与完整正则一致（共 {found} 处时间戳）")
+
+
+def measure(func, documents, repeat=3):
+    """多次运行取最短耗时，返回秒数"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for document in documents:
+            func(document)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(n_documents=2000):
+    check_timestamp_starts()
+    for format_name, pattern in TIMESTAMP_FORMATS.items():
+        documents = make_course_documents(format_name, n_documents)
+        size_mb = sum(len(document.encode('utf-8')) for document in documents) / 1e6
+        assert [split_records(document, format_name) for document in documents] == \
+               [legacy_split(document, pattern) for document in documents], f"{format_name} 拆分结果与原实现不一致"
+
+        legacy_time = measure(lambda document: legacy_split(document, pattern), documents)
+        hinted_time = measure(lambda document: split_records(document, format_name), documents)
+        any_time = measure(split_records, documents)
+        sorted_time = measure(lambda document: split_records(document, format_name, sort=True), documents)
+        print(f"{format_name:<10} {size_mb:5.1f} MB   原循环 {size_mb / legacy_time:7.1f} MB/s   "
+              f"指定格式 {size_mb / hinted_time:7.1f} MB/s   全部格式 {size_mb / any_time:7.1f} MB/s   "
+              f"排序 {size_mb / sorted_time:7.1f} MB/s")
+
+
+if __name__ == "__main__":
+    run()
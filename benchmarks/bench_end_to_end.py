@@ -0,0 +1,244 @@
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from synthetic_emr import generate_cstcm, generate_hucm1st, generate_hutcm2nd
+from llm_stub import start_stub
+from common.profiling import profile_stage, profiling_requested
+
+# 结果记录文件：每次运行追加一行，供回归对比
+RESULTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results', 'end_to_end.jsonl')
+
+# 带 --profile 运行时对每个阶段做性能分析（结果保存在 results/profiles，分析本身会使计时变慢）
+PROFILE_STAGES = False
+PROFILE_DIR = os.path.join(os.path.dirname(RESULTS_FILE), 'profiles')
+
+# cstcm 各导出表对应的提取脚本、函数和输出目录
+CSTCM_SCRIPTS = [
+    ('入院记录', '入院记录.py', 'summarize_medical_records', '入院记录'),
+    ('出院记录', '出院记录.py', 'summarize_medical_records', '出院记录'),
+    ('首次病程', '首次病程.py', 'summarize_medical_records', '首次病程'),
+    ('日常病程', '日常病程记录.py', 'summarize_medical_records', '日常病程记录'),
+    ('检查项', '检查项.py', 'process_examination_records', '检查项'),
+    ('检验项', '检验项.py', 'process_examination_records', '检验项'),
+]
+
+
+def load_center_script(center_dir, filename, module_name):
+    """
+    加载某个中心目录下的脚本：脚本所在目录加入 sys.path（以便导入 lab_tables、name_matcher 等同目录模块），
+    模块注册到 sys.modules（多进程处理时工作进程需要按模块名找到函数）
+    """
+    script_dir = os.path.join(ROOT, center_dir)
+    if script_dir not in sys.path:
+        sys.path.insert(0, script_dir)
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(script_dir, filename))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def timed(timings, stage, func, *args, **kwargs):
+    """运行一个阶段（屏蔽其中的逐文件打印）并记录耗时；缺少依赖时记为跳过"""
+    start = time.perf_counter()
+    try:
+        with profile_stage(stage, PROFILE_STAGES, PROFILE_DIR), contextlib.redirect_stdout(io.StringIO()):
+            result = func(*args, **kwargs)
+    except ImportError as e:
+        print(f"  {stage:<24} 跳过（缺少依赖: {e}）")
+        return None
+    timings[stage] = time.perf_counter() - start
+    print(f"  {stage:<24} {timings[stage]:8.2f}s")
+    return result
+
+
+def count_files(root):
+    """目录下的文件数（目录不存在时为 0）"""
+    return sum(len(files) for _, _, files in os.walk(root)) if os.path.isdir(root) else 0
+
+
+def run_llm_stage(timings, stage, center_dir, workspace, url):
+    """
+    以子进程运行中心的批处理程序（与实际部署相同，每个 API 密钥一个实例并行运行），接口指向本地模拟服务
+    :param workspace: 批处理程序的工作目录，其中应已有 config.INPUT_DIR 对应的输入
+    """
+    try:
+        import requests  # noqa: F401  批处理程序依赖 requests
+    except ImportError as e:
+        print(f"  {stage:<24} 跳过（缺少依赖: {e}）")
+        return
+    config = load_center_script(center_dir, 'config.py', f"{center_dir.replace('-', '_')}_config")
+    if not os.path.isdir(os.path.join(workspace, config.INPUT_DIR)):
+        print(f"  {stage:<24} 跳过（没有输入: {config.INPUT_DIR}）")
+        return
+    shutil.copytree(os.path.join(ROOT, center_dir, config.PROMPT_DIR), os.path.join(workspace, config.PROMPT_DIR),
+                    dirs_exist_ok=True)
+    script = os.path.join(ROOT, center_dir, 'txttojointtoLLM-own-Batchprocessing.py')
+    env = dict(os.environ, LLM_API_URL=url, LLM_API_DELAY='0')
+    start = time.perf_counter()
+    processes = [subprocess.Popen([sys.executable, script, str(instance)], cwd=workspace, env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+                 for instance in range(len(config.API_TOKENS))]
+    errors = [process.communicate()[1] for process in processes]
+    timings[stage] = time.perf_counter() - start
+    failed = [error.decode('utf-8', 'replace').strip() for process, error in zip(processes, errors) if process.returncode]
+    if failed:
+        print(f"  {stage:<24} 失败: {failed[0][-300:]}")
+        del timings[stage]
+        return
+    print(f"  {stage:<24} {timings[stage]:8.2f}s（{count_files(os.path.join(workspace, config.OUTPUT_DIR))} 个返回文件）")
+
+
+def run_cstcm(timings, workspace, n_patients, text_scale, url):
+    """cstcm：生成导出表 -> 六个提取脚本 -> 整理（链接）-> LLM"""
+    os.makedirs(workspace, exist_ok=True)
+    tables = timed(timings, 'cstcm 生成数据', generate_cstcm, os.path.join(workspace, 'export'), n_patients, text_scale)
+    if tables is None:
+        return
+    folders = []
+    for table, filename, func_name, output_dir in CSTCM_SCRIPTS:
+        module = load_center_script('cstcm-norm-code', filename, f"cstcm_{func_name}_{output_dir}")
+        output_dir = os.path.join(workspace, output_dir)
+        kwargs = {'admission_file': tables['出院记录']} if func_name == 'process_examination_records' else {}
+        timed(timings, f"cstcm 提取 {table}", getattr(module, func_name), tables[table], output_dir,
+              incremental=False, **kwargs)
+        folders.append(output_dir)
+    integration = load_center_script('cstcm-norm-code', 'Integration.py', 'cstcm_integration')
+    timed(timings, 'cstcm 整理', integration.organize_patient_files, folders,
+          os.path.join(workspace, 'step1-totxt_integration'), 'link')
+    run_llm_stage(timings, 'cstcm LLM', 'cstcm-norm-code', workspace, url)
+
+
+def run_hucm1st(timings, workspace, n_patients, text_scale, url):
+    """hucm1st：生成宽表 -> totxt-own -> LLM -> 合并"""
+    os.makedirs(workspace, exist_ok=True)
+    file_path = timed(timings, 'hucm1st 生成数据', generate_hucm1st, workspace, n_patients, text_scale)
+    if file_path is None:
+        return
+    totxt = load_center_script('hucm1st-norm-code', 'totxt-own.py', 'hucm1st_totxt_own')
+    timed(timings, 'hucm1st 提取', totxt.summarize_medical_records, file_path,
+          os.path.join(workspace, 'step1-totxt'), incremental=False)
+    run_llm_stage(timings, 'hucm1st LLM', 'hucm1st-norm-code', workspace, url)
+    input_dir = os.path.join(workspace, 'step2-tojoint')
+    if os.path.isdir(input_dir):
+        integrate = load_center_script('hucm1st-norm-code', 'Integrate_a_txt_file.py', 'hucm1st_integrate')
+        timed(timings, 'hucm1st 合并', integrate.merge_patient_records, input_dir,
+              os.path.join(workspace, 'step3-merged'), incremental=False)
+
+
+# 去隐私化后入院记录中不应再出现的基本信息字段
+ADMISSION_HEADER_FIELDS = ('性别：', '年龄：', '入院日期：', '发病节气：')
+
+
+def check_admission_headers(deid_dir):
+    """校验去隐私化结果：所有入院记录（包括 \r\n 换行的文件）的基本信息段都已删除"""
+    leaked = []
+    for patient_id in sorted(os.listdir(deid_dir)):
+        file_path = os.path.join(deid_dir, patient_id, '入院.txt')
+        if not os.path.exists(file_path):
+            continue
+        with open(file_path, 'r', encoding='utf-8') as f:
+            text = f.read()
+        if any(field in text for field in ADMISSION_HEADER_FIELDS):
+            leaked.append(patient_id)
+    assert not leaked, f"{len(leaked)} 位患者的入院记录仍含基本信息: {leaked[:5]}"
+
+
+def run_hutcm2nd(timings, workspace, n_patients, text_scale, url):
+    """hutcm2nd：生成患者文件夹 -> 去隐私化 -> 拆分提取 -> 泄漏扫描 -> LLM"""
+    os.makedirs(workspace, exist_ok=True)
+    input_root = timed(timings, 'hutcm2nd 生成数据', generate_hutcm2nd, os.path.join(workspace, 'export'),
+                       n_patients, text_scale)
+    if input_root is None:
+        return
+    deprivacy = load_center_script('hutcm2nd-norm-code', 'De-privacization.py', 'de_privacization')
+    records = load_center_script('hutcm2nd-norm-code', 'process_records.py', 'process_records')
+    scanner = load_center_script('hutcm2nd-norm-code', 'leak_scanner.py', 'leak_scanner')
+    deid_dir = os.path.join(workspace, 'step1-De_privacy')
+    extracted_dir = os.path.join(workspace, 'step2-Extracted')
+    names_dir = os.path.join(workspace, 'step1-names')
+    timed(timings, 'hutcm2nd 去隐私化', deprivacy.process_admission_files, input_root, deid_dir,
+          report_file=os.path.join(workspace, 'step1-De_privacy-timing.csv'), names_dir=names_dir)
+    check_admission_headers(deid_dir)
+    os.makedirs(extracted_dir, exist_ok=True)
+    timed(timings, 'hutcm2nd 拆分提取', records.process_directory, deid_dir, extracted_dir)
+    timed(timings, 'hutcm2nd 泄漏扫描', scanner.scan_outputs, [extracted_dir], names_dir,
+          os.path.join(workspace, 'leak_report.csv'))
+    run_llm_stage(timings, 'hutcm2nd LLM', 'hutcm2nd-norm-code', workspace, url)
+
+
+def load_previous(params):
+    """读取参数相同的上一次运行结果"""
+    if not os.path.exists(RESULTS_FILE):
+        return None
+    previous = None
+    with open(RESULTS_FILE, 'r', encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            if record['params'] == params:
+                previous = record
+    return previous
+
+
+def report(timings, previous):
+    """打印与上一次运行的对比"""
+    if previous is None:
+        print("\n没有参数相同的历史结果，本次结果作为基线")
+        return
+    print(f"\n与上一次运行（{previous['time']}）对比:")
+    for stage, seconds in timings.items():
+        before = previous['timings'].get(stage)
+        if before:
+            print(f"  {stage:<24} {before:8.2f}s -> {seconds:8.2f}s  {(seconds - before) / before:+7.1%}")
+        else:
+            print(f"  {stage:<24} {'':>8}   -> {seconds:8.2f}s  （新阶段）")
+
+
+def run(n_patients=100, text_scale=1.0, llm_latency=0.0, keep=None):
+    """
+    生成三个中心的合成数据，依次运行各阶段并计时；结果追加到 RESULTS_FILE，并与参数相同的上一次运行对比
+    :param llm_latency: 模拟服务每个请求的耗时（秒），0 表示只测量批处理程序本身的开销
+    :param keep: 保留中间结果的目录；None 表示使用临时目录并在结束后删除
+    """
+    params = {'patients': n_patients, 'text_scale': text_scale, 'llm_latency': llm_latency, 'profile': PROFILE_STAGES}
+    work_dir = keep or tempfile.mkdtemp(prefix='bench_e2e_')
+    server, url = start_stub(llm_latency)
+    timings = {}
+    print(f"合成数据: {n_patients} 位患者/中心，文本长度 x{text_scale}，工作目录 {work_dir}")
+    try:
+        run_cstcm(timings, os.path.join(work_dir, 'cstcm'), n_patients, text_scale, url)
+        run_hucm1st(timings, os.path.join(work_dir, 'hucm1st'), n_patients, text_scale, url)
+        run_hutcm2nd(timings, os.path.join(work_dir, 'hutcm2nd'), n_patients, text_scale, url)
+    finally:
+        server.shutdown()
+        if keep is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    print(f"模拟 LLM 服务: {server.requests} 个请求，{server.request_bytes / 1e6:.1f} MB")
+
+    previous = load_previous(params)
+    report(timings, previous)
+    os.makedirs(os.path.dirname(RESULTS_FILE), exist_ok=True)
+    with open(RESULTS_FILE, 'a', encoding='utf-8') as f:
+        record = {'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'params': params, 'timings': timings,
+                  'llm_requests': server.requests}
+        f.write(json.dumps(record, ensure_ascii=False) + '\n')
+    return timings
+
+
+if __name__ == "__main__":
+    # 用法：python bench_end_to_end.py [患者数] [文本长度倍数] [模拟 LLM 每个请求的耗时（秒）] [--profile]
+    PROFILE_STAGES = profiling_requested()
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 100,
+        float(sys.argv[2]) if len(sys.argv) > 2 else 1.0,
+        float(sys.argv[3]) if len(sys.argv) > 3 else 0.0)
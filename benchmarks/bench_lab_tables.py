@@ -0,0 +1,126 @@
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "cstcm-norm-code"))
+
+from bench_daily_course_split import load_script
+from common.dedupe import DEDUPE_SUMMARY_FILE
+
+
+def make_lab_table(n_patients=2000, records=20, out_of_window_ratio=0.2, seed=0):
+    """
+    生成检验项表和住院时间窗表：每位患者 records 条检验记录，其中 out_of_window_ratio 比例在住院期间以外；
+    最后一位患者的记录全部在住院期间以外（过滤后没有任何记录）
+    :return: (检验项 DataFrame, 住院时间窗 DataFrame)
+    """
+    rng = random.Random(seed)
+    labs, windows = [], []
+    for i in range(n_patients):
+        patient_id = str(2021000 + i)
+        admit = pd.Timestamp(2021, 1, 1) + pd.Timedelta(days=rng.randint(0, 300))
+        windows.append({'住院号': patient_id, '入院时间': admit, '出院时间': admit + pd.Timedelta(days=10)})
+        for record in range(records):
+            outside = i == n_patients - 1 or rng.random() < out_of_window_ratio
+            # 分钟取记录序号，保证记录互不相同（不受去重影响）
+            stamp = admit + pd.Timedelta(days=rng.randint(30, 60) if outside else rng.randint(0, 9), hours=8,
+                                         minutes=record)
+            labs.append({'病案号': patient_id, '住院号': patient_id, '参考范围': '3.9-6.1',
+                         '报告时间': stamp.strftime('%Y-%m-%d %H:%M'), '检验结果': f"{rng.uniform(1, 10):.1f}",
+                         '单位': 'mmol/L', '检验套名称': '生化全项', '标本名称': '血液', '异常提示': '',
+                         '检验项名称': '血糖', '接收时间': stamp.strftime('%Y-%m-%d %H:%M')})
+    return pd.DataFrame(labs), pd.DataFrame(windows)
+
+
+def run_twice(process, table_path, output_dir, admission_path, **kwargs):
+    """先不过滤生成完整输出，再开启住院时间窗过滤在已有输出上重新运行 :return: 第二次运行的耗时"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        process(table_path, output_dir, **kwargs)
+        start = time.perf_counter()
+        process(table_path, output_dir, admission_file=admission_path, **kwargs)
+    return time.perf_counter() - start
+
+
+def check_output(output_dir, labs, windows):
+    """校验开启过滤后的输出：没有住院期间以外的记录，过滤后无记录的患者不保留旧文件"""
+    window = windows.set_index('住院号')
+    emptied = 0
+    for patient_id, rows in labs.groupby('病案号'):
+        path = os.path.join(output_dir, patient_id, '检验项.txt')
+        times = pd.to_datetime(rows['报告时间'])
+        inside = (times >= window.loc[patient_id, '入院时间']) & \
+                 (times < window.loc[patient_id, '出院时间'].normalize() + pd.Timedelta(days=1))
+        if not inside.any():
+            assert not os.path.exists(path), f"患者 {patient_id} 过滤后没有记录，但旧文件仍然存在"
+            emptied += 1
+            continue
+        with open(path, 'r', encoding='utf-8') as f:
+            text = f.read()
+        assert text.count('检验项名称: ') == inside.sum(), f"患者 {patient_id} 的记录数与住院时间窗不一致"
+    return emptied
+
+
+def check_dedupe_summary(process, workspace, labs):
+    """
+    两张含重复行的导出表分别运行（其中一张运行两次）：中心汇总文件按导出表记录，
+    合计等于两张表之和，重新运行不重复累计
+    """
+    center_dir = os.path.join(workspace, 'center')
+    os.makedirs(center_dir)
+    duplicates = {'检验项A.csv': 100, '检验项B.csv': 250}
+    for name, count in list(duplicates.items()) + [('检验项A.csv', 100)]:
+        path = os.path.join(workspace, name)
+        pd.concat([labs, labs.head(count)]).to_csv(path, index=False)
+        with contextlib.redirect_stdout(io.StringIO()):
+            process(path, os.path.join(center_dir, os.path.splitext(name)[0]), chunksize=10000)
+    with open(os.path.join(center_dir, DEDUPE_SUMMARY_FILE), 'r', encoding='utf-8') as f:
+        summary = json.load(f)
+    assert sorted(summary) == sorted(duplicates), f"去重汇总中的导出表不正确: {sorted(summary)}"
+    total = sum(entry['duplicate_rows'] for entry in summary.values())
+    assert total == sum(duplicates.values()), f"中心去重合计 {total} 行，应为 {sum(duplicates.values())} 行"
+    print(f"中心去重汇总: {len(summary)} 张导出表，合计删除 {total} 行重复记录（重新运行不重复累计）")
+
+
+def run(n_patients=2000):
+    labs, windows = make_lab_table(n_patients)
+    print(f"合成检验项: {n_patients} 位患者，{len(labs)} 行")
+    module = load_script(os.path.join("cstcm-norm-code", "检验项.py"), "lab_items")
+    workspace = tempfile.mkdtemp(prefix='bench_lab_')
+    try:
+        csv_path = os.path.join(workspace, '检验项.csv')
+        admission_path = os.path.join(workspace, '出院记录.csv')
+        labs.to_csv(csv_path, index=False)
+        windows.to_csv(admission_path, index=False)
+
+        targets = [('分块处理（CSV）', csv_path, {'chunksize': 10000})]
+        if importlib.util.find_spec('openpyxl'):
+            xlsx_path = os.path.join(workspace, '检验项.xlsx')
+            labs.to_excel(xlsx_path, index=False)
+            targets.append(('整表处理（Excel）', xlsx_path, {}))
+        else:
+            print("未安装 openpyxl，跳过整表处理")
+
+        for name, table_path, kwargs in targets:
+            output_dir = os.path.join(workspace, name)
+            seconds = run_twice(module.process_examination_records, table_path, output_dir, admission_path, **kwargs)
+            emptied = check_output(output_dir, labs, windows)
+            print(f"{name}: 开启住院时间窗后重新运行 {seconds:.2f}s，输出与时间窗一致（{emptied} 位患者的旧文件已删除）")
+        check_dedupe_summary(module.process_examination_records, workspace, labs)
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    # 用法：python bench_lab_tables.py [患者数]
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
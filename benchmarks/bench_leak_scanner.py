@@ -0,0 +1,112 @@
+import contextlib
+import io
+import json
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "hutcm2nd-norm-code"))
+
+from synthetic_emr import PHRASES, person_name
+from name_matcher import NameMatcher
+import leak_scanner
+
+
+def legacy_finditer(names, text):
+    """原正则交替实现（对照基准）：sre 在每个位置逐一尝试每个姓名，耗时随姓名数量增长"""
+    pattern = re.compile('|'.join(map(re.escape, sorted(set(names), key=lambda n: (-len(n), n)))))
+    return [(match.start(), match.end(), match.group()) for match in pattern.finditer(text)]
+
+
+def make_workspace(workspace, n_names, n_files, file_chars=2000, leak_ratio=0.01, seed=0):
+    """
+    生成姓名目录（每位患者 2 个姓名）和待扫描的输出目录（每位患者 4 个文件，leak_ratio 比例的文件残留一个姓名）
+    :return: (输出目录, 姓名目录, 全部姓名)
+    """
+    rng = random.Random(seed)
+    names = set()
+    while len(names) < n_names:
+        names.add(person_name(rng))
+    names = sorted(names)
+    names_dir = os.path.join(workspace, 'step1-names')
+    output_dir = os.path.join(workspace, 'step2-Extracted')
+    os.makedirs(names_dir)
+    for i in range(0, n_names, 2):
+        with open(os.path.join(names_dir, f"P{i // 2:05d}.json"), 'w', encoding='utf-8') as f:
+            json.dump({'signature': names[i:i + 2], 'guessed': []}, f, ensure_ascii=False)
+    for i in range(n_files):
+        patient_dir = os.path.join(output_dir, f"P{i // 4:05d}")
+        os.makedirs(patient_dir, exist_ok=True)
+        text = "".join(rng.choice(PHRASES) for _ in range(file_chars // 12))
+        if rng.random() < leak_ratio:
+            position = rng.randrange(len(text))
+            text = text[:position] + rng.choice(names) + text[position:]
+        with open(os.path.join(patient_dir, f"记录{i % 4}.txt"), 'w', encoding='utf-8') as f:
+            f.write(text)
+    return output_dir, names_dir, names
+
+
+def check_levels(workspace):
+    """
+    签名行中的姓名记为残留；推测的姓名只记为疑似；STOP_WORDS 中的普通词语不报告；
+    旧版本保存的姓名列表（不区分来源）全部按推测的姓名处理
+    """
+    names_dir = os.path.join(workspace, 'names')
+    output_dir = os.path.join(workspace, 'output')
+    os.makedirs(names_dir)
+    os.makedirs(os.path.join(output_dir, 'P1'))
+    with open(os.path.join(names_dir, 'P1.json'), 'w', encoding='utf-8') as f:
+        json.dump({'signature': ['张伟'], 'guessed': ['李娜', '正常']}, f, ensure_ascii=False)
+    with open(os.path.join(names_dir, 'P2.json'), 'w', encoding='utf-8') as f:
+        json.dump(['王芳', '同前'], f, ensure_ascii=False)
+    with open(os.path.join(output_dir, 'P1', '记录.txt'), 'w', encoding='utf-8') as f:
+        f.write("医师张伟查房，体温正常，病情同前。李娜陪同，王芳探视。")
+    with contextlib.redirect_stdout(io.StringIO()):
+        hits = leak_scanner.scan_outputs([output_dir], names_dir, report_file=None, workers=1)
+    levels = {hit['name']: hit['level'] for hit in hits}
+    assert levels == {'张伟': 'leak', '李娜': 'warning', '王芳': 'warning'}, f"命中级别错误: {levels}"
+    print("命中级别: 签名行姓名记为残留，推测的姓名记为疑似，STOP_WORDS 不报告")
+
+
+def run(n_files=20000, name_counts=(1000, 5000, 20000)):
+    workspace = tempfile.mkdtemp(prefix='bench_leak_')
+    try:
+        check_levels(workspace)
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+    print(f"每次扫描 {n_files} 个文件（约 2000 字/文件），单进程\n")
+    for n_names in name_counts:
+        workspace = tempfile.mkdtemp(prefix='bench_leak_')
+        try:
+            output_dir, names_dir, names = make_workspace(workspace, n_names, n_files)
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                hits = leak_scanner.scan_outputs([output_dir], names_dir, report_file=None, workers=1)
+            elapsed = time.perf_counter() - start
+
+            # 取一部分文本与原正则交替实现对照结果和耗时
+            sample = "".join(open(os.path.join(root, filename), encoding='utf-8').read()
+                             for root, _, files in os.walk(output_dir) for filename in files[:1])[:200000]
+            matcher = NameMatcher(names)
+            start = time.perf_counter()
+            matches = list(matcher.finditer(sample))
+            new_time = time.perf_counter() - start
+            start = time.perf_counter()
+            legacy = legacy_finditer(names, sample)
+            legacy_time = time.perf_counter() - start
+            assert matches == legacy, "匹配结果与正则交替实现不一致"
+            print(f"{n_names:>6} 个姓名: 扫描 {elapsed:6.2f}s，命中 {len(hits)} 处；"
+                  f"{len(sample)} 字样本 {new_time * 1e3:7.1f} ms，正则交替 {legacy_time * 1e3:8.1f} ms")
+        finally:
+            shutil.rmtree(workspace, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    # 用法：python bench_leak_scanner.py [文件数]
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
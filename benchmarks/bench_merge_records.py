@@ -0,0 +1,155 @@
+import contextlib
+import io
+import json
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+import unicodedata
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_end_to_end import load_center_script
+from common import logging_utils
+
+# 合并时出现在 LLM 返回结果中的特殊字符：控制字符、零宽字符、BOM、私用区字符和 "^"
+SPECIAL_CHARS = ["\x00", "\x07", "\x1b", "\u200b", "\u200e", "\ufeff", "\ue000", "^", "\u3000", "\t"]
+
+
+def legacy_clean_response(content):
+    """原 merge_patient_records 中逐字符过滤的清理方式（对照基准）"""
+    content = content.strip()
+    content = re.sub(r'\s+', ' ', content)
+    content = ''.join([c for c in content if unicodedata.category(c)[0] != 'C'])
+    content = content.replace('^', '')
+    return content
+
+
+def make_responses(n_files=3000, special_ratio=0.05, seed=0):
+    """生成合成的 LLM 返回文本：少数文件中夹杂控制字符、零宽字符和 "^" 等特殊字符"""
+    rng = random.Random(seed)
+    phrases = ["患者右膝关节疼痛3天，", "查体：右膝关节压痛（+），浮髌试验（-）。", "舌淡红，苔薄白，脉弦细。",
+               "西医诊断：膝骨关节炎\n", "中医诊断：痹证（气滞血瘀证）\n", "T 36.5℃ P 78次/分 R 18次/分 BP 120/80mmHg\n"]
+    responses = []
+    for _ in range(n_files):
+        parts = [rng.choice(phrases) for _ in range(rng.randint(5, 40))]
+        if rng.random() < special_ratio:
+            for _ in range(rng.randint(1, 5)):
+                parts.insert(rng.randrange(len(parts) + 1), rng.choice(SPECIAL_CHARS))
+        responses.append("".join(parts))
+    return responses
+
+
+def make_merge_tree(root, responses, files_per_patient=20):
+    """把返回文本写成 step2-tojoint 结构：每位患者若干日常病程记录和固定段落文件"""
+    fixed = ["入院记录-主诉_response.txt", "入院记录-现病史_response.txt", "首次病程记录-病例特点_response.txt",
+             "出院记录-出院情况_response.txt", "其他记录_response.txt"]
+    for start in range(0, len(responses), files_per_patient):
+        patient_dir = os.path.join(root, f"{100000 + start}")
+        os.makedirs(patient_dir)
+        for i, content in enumerate(responses[start:start + files_per_patient]):
+            filename = fixed[i] if i < len(fixed) else f"(拆分)日常病程记录{i}_response.txt"
+            with open(os.path.join(patient_dir, filename), 'w', encoding='utf-8') as f:
+                f.write(content)
+
+
+def measure(func, items, repeat=3):
+    """多次运行取最短耗时，返回秒数"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            func(item)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_merge(module, input_dir, output_dir):
+    """运行一次合并（屏蔽逐个患者的打印），返回耗时和全部输出内容"""
+    shutil.rmtree(output_dir, ignore_errors=True)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        module.merge_patient_records(input_dir, output_dir)
+    elapsed = time.perf_counter() - start
+    outputs = {}
+    for filename in sorted(os.listdir(output_dir)):
+        with open(os.path.join(output_dir, filename), 'r', encoding='utf-8') as f:
+            outputs[filename] = f.read()
+    return elapsed, outputs
+
+
+def check_worker_logs(module, input_dir, output_dir, log_dir, workers=2):
+    """多进程合并时工作进程的 DEBUG 日志（每位患者一条“已创建整合病历”）都应写入主进程的 JSONL 文件"""
+    shutil.rmtree(output_dir, ignore_errors=True)
+    path = logging_utils.setup_logging('bench_merge', log_dir=log_dir, level='WARNING')
+    with contextlib.redirect_stdout(io.StringIO()):
+        pending = module.merge_patient_records(input_dir, output_dir, workers=workers)
+    # 写完两个队列中剩余的日志
+    logging_utils._stop_worker_listener()
+    logging_utils._stop_listener()
+    with open(path, 'r', encoding='utf-8') as f:
+        messages = [json.loads(line)['message'] for line in f]
+    created = sum('已创建整合病历' in message for message in messages)
+    assert created == len(pending), f"工作进程的日志丢失: {created}/{len(pending)} 位患者"
+    print(f"工作进程日志 {workers} 个进程: {created}/{len(pending)} 位患者的 DEBUG 日志已写入 JSONL")
+
+
+def check_callback_manifest(module, input_dir, output_dir):
+    """逐个患者整合（LLM 批处理的 on_patient_complete 路径）并记录签名后，merge_patient_records 不再重复整合"""
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.makedirs(output_dir)
+    signatures = {}
+    for patient_id in sorted(os.listdir(input_dir)):
+        signatures[patient_id] = module.response_signature(os.path.join(input_dir, patient_id))
+        module.merge_patient(patient_id, input_dir, output_dir)
+    module.record_merged(signatures, input_dir, output_dir)
+    with contextlib.redirect_stdout(io.StringIO()):
+        pending = module.merge_patient_records(input_dir, output_dir, workers=1)
+    assert pending == [], f"逐个整合后仍有 {len(pending)} 位患者被重复整合"
+    print(f"逐个整合: {len(signatures)} 位患者的签名已写入清单，之后的整合没有重复处理")
+
+
+def run(n_files=3000):
+    integrate = load_center_script("hucm1st-norm-code", "Integrate_a_txt_file.py", "integrate_a_txt_file")
+    responses = make_responses(n_files)
+
+    # 随机码位（含未分配、私用区、格式字符）的结果一致性检查
+    rng = random.Random(1)
+    samples = ["".join(chr(rng.choice([rng.randrange(0x110000), rng.randrange(0x80), rng.randrange(0x4e00, 0x9fa5)]))
+                       for _ in range(50)).encode('utf-8', 'replace').decode('utf-8') for _ in range(20000)]
+    assert [integrate.clean_response(text) for text in responses + samples] == \
+           [legacy_clean_response(text) for text in responses + samples], "清理结果与原实现不一致"
+
+    size_mb = sum(len(text.encode('utf-8')) for text in responses) / 1e6
+    legacy_time = measure(legacy_clean_response, responses)
+    new_time = measure(integrate.clean_response, responses)
+    print(f"合成返回文本: {len(responses)} 个文件, {size_mb:.1f} MB")
+    print(f"字符清理   原实现 {size_mb / legacy_time:7.1f} MB/s   新实现 {size_mb / new_time:7.1f} MB/s   "
+          f"加速 {legacy_time / new_time:.1f}x")
+
+    work_dir = tempfile.mkdtemp(prefix="bench_merge_")
+    try:
+        input_dir = os.path.join(work_dir, "step2-tojoint")
+        output_dir = os.path.join(work_dir, "step3-merged")
+        make_merge_tree(input_dir, responses)
+
+        new_merge, new_outputs = run_merge(integrate, input_dir, output_dir)
+        integrate.clean_response = legacy_clean_response
+        legacy_merge, legacy_outputs = run_merge(integrate, input_dir, output_dir)
+        assert new_outputs == legacy_outputs, "合并结果与原实现不一致"
+        check_worker_logs(integrate, input_dir, output_dir, os.path.join(work_dir, "logs"))
+        check_callback_manifest(integrate, input_dir, output_dir)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    # 合并阶段中字符清理所占的比例（其余为文件读写和目录遍历）
+    print(f"合并阶段   原实现 {legacy_merge:.3f}s（字符清理约占 {legacy_time / legacy_merge:.0%}）   "
+          f"新实现 {new_merge:.3f}s（字符清理约占 {new_time / new_merge:.0%}）")
+
+
+if __name__ == "__main__":
+    run()
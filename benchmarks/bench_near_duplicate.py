@@ -0,0 +1,132 @@
+import os
+import random
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from synthetic_emr import PHRASES
+from common.near_duplicate import NearDuplicateIndex, report_near_duplicates, patch_response
+from common.normalizer import normalize
+
+# 模板化的段落：同一模板在不同患者之间只差日期和数值
+TEMPLATES = {
+    '出院医嘱.txt': [
+        "1.注意休息，避免劳累。\n2.口服塞来昔布胶囊{dose}mg 每日一次，共{days}天。\n3.{month}月{day}日门诊复查。",
+        "1.低盐低脂饮食。\n2.口服氨基葡萄糖{dose}mg 每日三次，连服{days}天。\n3.出院后{week}周门诊复查膝关节X线。",
+    ],
+    '诊疗计划.txt': [
+        "1.完善血常规、生化全项等检查。\n2.中药熏洗每日{times}次，针刺治疗隔日一次，共{days}天。\n3.择期复查。",
+    ],
+    '专科检查.txt': [
+        "右膝关节肿胀，压痛（+），浮髌试验（-），屈伸活动度{angle}°-{angle2}°。\n"
+        "左膝关节无明显肿胀，活动度{angle3}°-{angle4}°。",
+    ],
+}
+
+PROMPTS = {'mapping': {name: name for name in TEMPLATES}, 'daily_pattern': None, 'daily_prompt': None,
+           'texts': {name: f"请提取{os.path.splitext(name)[0]}中的结构化信息，按 JSON 输出。" for name in TEMPLATES}}
+
+
+def make_records(n_patients=500, template_ratio=0.7, seed=0):
+    """
+    生成各患者的段落：template_ratio 的段落由模板填入随机日期/数值，其余为自由文本
+    :return: [{'patient', 'filename', 'text'}, ...]
+    """
+    rng = random.Random(seed)
+    records = []
+    for patient in range(n_patients):
+        for filename, templates in TEMPLATES.items():
+            if rng.random() < template_ratio:
+                text = rng.choice(templates).format(
+                    dose=rng.choice([100, 200, 250, 500]), days=rng.randint(7, 28), month=rng.randint(1, 12),
+                    day=rng.randint(10, 28), week=rng.randint(2, 6), times=rng.randint(2, 3),
+                    angle=rng.randint(10, 20), angle2=rng.randint(90, 130), angle3=rng.randint(0, 9),
+                    angle4=rng.randint(131, 150))
+            else:
+                text = "".join(rng.choice(PHRASES) for _ in range(rng.randint(3, 8)))
+            records.append({'patient': f"P{patient:05d}", 'filename': filename, 'text': text})
+    return records
+
+
+def oracle_backend(content):
+    """模拟的模型：返回段落中的全部数字（结果只依赖输入，可以校验本地修补是否正确）"""
+    text = content.split("\n\n", 1)[1]
+    return "结果: " + " ".join(re.findall(r'\d+(?:\.\d+)?', text))
+
+
+def derived_oracle_backend(content):
+    """模拟的模型：除原文数字外还给出由这些数字推算出的合计（本地替换无法更新推算值，必须改为请求模型）"""
+    numbers = re.findall(r'\d+(?:\.\d+)?', content.split("\n\n", 1)[1])
+    return oracle_backend(content) + f"，合计: {sum(float(number) for number in numbers):.1f}"
+
+
+# 本地修补的边界情况：(原段落, 新段落, 原结果, 期望结果)，期望为 None 表示必须改为请求模型
+PATCH_CASES = [
+    # 只有数值改动，结果中的数字都来自原文
+    ('身高170cm，体重70kg。', '身高170cm，体重80kg。', '{"身高":"170cm","体重":"70kg"}', '{"身高":"170cm","体重":"80kg"}'),
+    # 推算值：BMI 由身高体重算出，体重改变后无法本地更新
+    ('身高170cm，体重70kg。', '身高170cm，体重80kg。', '{"体重":"70kg","BMI":"24.2"}', None),
+    # 巧合的数字：结果中的评分 10 与原文的活动度 10 数值相同，但含义不同
+    ('屈伸活动度10°', '屈伸活动度15°', '{"活动度":"10","评分":"10"}', None),
+    # 改动的数值在结果中找不到（模型做了换算）
+    ('口服200mg', '口服250mg', '{"剂量":"0.2g"}', None),
+]
+
+
+def check_patch_cases():
+    """逐条校验 PATCH_CASES"""
+    for old_text, new_text, response, expected in PATCH_CASES:
+        patched = patch_response(old_text, new_text, response)
+        assert patched == expected, f"本地修补结果错误: {old_text} -> {new_text}: {patched!r}（期望 {expected!r}）"
+    print(f"本地修补边界情况: {len(PATCH_CASES)} 条全部符合预期")
+
+
+def compare(records, backend, threshold):
+    """
+    分别逐段调用和启用近似重复索引运行同一批段落
+    :return: (索引, API 调用次数, 结果不一致的段落数, 索引开销秒数)
+    """
+    start = time.perf_counter()
+    baseline = dict((id(record), response) for record, response in normalize(records, PROMPTS, backend))
+    baseline_time = time.perf_counter() - start
+
+    calls = [0]
+
+    def counting_backend(content):
+        calls[0] += 1
+        return backend(content)
+
+    index = NearDuplicateIndex(threshold, delta=False)  # 差异提示词的结果取决于模型，这里只校验本地修补
+    start = time.perf_counter()
+    results = list(normalize(records, PROMPTS, counting_backend, near_duplicates=index))
+    index_time = time.perf_counter() - start
+    wrong = sum(response != baseline[id(record)] for record, response in results)
+    return index, calls[0], wrong, index_time - baseline_time
+
+
+def run(n_patients=500, template_ratio=0.7, threshold=0.9):
+    check_patch_cases()
+    records = make_records(n_patients, template_ratio)
+    print(f"合成段落: {len(records)} 段（{n_patients} 位患者，模板段落比例 {template_ratio:.0%}），相似度阈值 {threshold}")
+
+    index, calls, wrong, overhead = compare(records, oracle_backend, threshold)
+    report_near_duplicates(index)
+    print(f"\nAPI 调用: {len(records)} -> {calls} 次（节省 {1 - calls / len(records):.1%}），"
+          f"与逐段调用结果不一致 {wrong} 段")
+    print(f"索引开销: {overhead / len(records) * 1e3:.2f} ms/段（不含模型耗时）")
+    assert wrong == 0, "本地修补的结果与逐段调用不一致"
+
+    # 结果含推算值时不能本地修补：结果必须全部与逐段调用一致
+    _, calls, wrong, _ = compare(records, derived_oracle_backend, threshold)
+    print(f"结果含推算值时: API 调用 {len(records)} -> {calls} 次，与逐段调用结果不一致 {wrong} 段")
+    assert wrong == 0, "结果含推算值时本地修补产生了过时的结果"
+
+
+if __name__ == "__main__":
+    # 用法：python bench_near_duplicate.py [患者数] [模板段落比例] [相似度阈值]
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 500,
+        float(sys.argv[2]) if len(sys.argv) > 2 else 0.7,
+        float(sys.argv[3]) if len(sys.argv) > 3 else 0.9)
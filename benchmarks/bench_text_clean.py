@@ -0,0 +1,133 @@
+import os
+import random
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "hutcm2nd-norm-code"))
+
+from common.text_clean import clean_content, clean_filename, is_chinese_name, is_chinese_title, tidy_whitespace
+from bench_daily_course_split import load_script
+
+# 吞吐量下限（MB/s）：约为开发机实测最低值的 1/3，用于发现数量级的退化（如每次调用重新编译正则），
+# 不受机器间和多次运行间的波动影响；较慢的机器上可按比例调低
+MIN_THROUGHPUT = {
+    'clean_content': 40,
+    'tidy_whitespace': 8,
+    'is_chinese_title': 40,
+    'is_chinese_name': 25,
+    'clean_filename': 15,
+    'de_privacy_admission': 4,
+}
+# 相对原实现的加速比下限（同一次运行中交替计时，与机器无关）；tidy_whitespace 与原实现相当，只要求不变慢
+MIN_SPEEDUP = {
+    'clean_content': 2.0,
+    'tidy_whitespace': 0.9,
+    'is_chinese_title': 1.1,
+}
+
+
+def legacy_clean_content(content):
+    """原各脚本中重复定义的 clean_content（对照基准）"""
+    if not isinstance(content, str):
+        return ""
+    content = content.replace('*', '')
+    content = re.sub(r'\s+', ' ', content)
+    content = re.sub(r'\n+', '\n', content).strip()
+    return content
+
+
+def legacy_tidy_whitespace(content):
+    """原 de_privacy_admission 末尾的四次空白替换（对照基准）"""
+    content = re.sub(r'[ \t]{2,}', ' ', content)
+    content = re.sub(r'\n\s+', '\n', content)
+    content = re.sub(r'\s+\n', '\n', content)
+    content = re.sub(r'\n{3,}', '\n\n', content)
+    return content
+
+
+def legacy_is_chinese_title(line):
+    """原 is_chinese_title（每次调用按模式字符串查找正则缓存）"""
+    if "记录" not in line and "查房" not in line and "术" not in line:
+        return False
+    if re.fullmatch(r'[\u4e00-\u9fa5]+', line):
+        return 4 <= len(line) <= 15
+    elif re.fullmatch(r'[\u4e00-\u9fa5，、.（）]+', line):
+        return 4 <= len(line) <= 20
+    return False
+
+
+def make_emr_text(n_records=2000, seed=0):
+    """
+    生成合成的中文病历文本：带时间戳和标题的病程记录，夹杂星号、连续空格、
+    行首行尾空白和多余空行，以及医师姓名行
+    """
+    rng = random.Random(seed)
+    phrases = ["患者诉右膝关节疼痛较前缓解，", "夜间睡眠可，纳可，二便调。", "查体：右膝关节压痛（+），",
+               "浮髌试验（-），活动度可。", "继续目前治疗方案，*密切观察*病情变化。", "T: 36.5℃ P: 78次/分 ",
+               "舌淡红，苔薄白，脉弦细。"]
+    titles = ["主治医师查房记录", "日常病程记录", "术后第一天记录", "（副主任医师）查房记录"]
+    names = ["张三", "李医生", "王小明"]
+    parts = []
+    for _ in range(n_records):
+        parts.append(f"2022-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}\n")
+        parts.append(rng.choice(titles) + "\n")
+        for _ in range(rng.randint(2, 8)):
+            parts.append(" " * rng.randint(0, 6) + rng.choice(phrases) + " \t" * rng.randint(0, 2))
+            parts.append("\n" * rng.randint(1, 4))
+        parts.append(rng.choice(names) + "\n\n")
+    return "".join(parts)
+
+
+def measure(funcs, items, repeat=7):
+    """多次运行取最短耗时，多个实现交替运行（减少机器负载波动对比较的影响），返回各自的秒数"""
+    best = [float('inf')] * len(funcs)
+    for _ in range(repeat):
+        for i, func in enumerate(funcs):
+            start = time.perf_counter()
+            for item in items:
+                func(item)
+            best[i] = min(best[i], time.perf_counter() - start)
+    return best
+
+
+def report(name, items, new, legacy=None):
+    """
+    打印吞吐量（MB/s，按 UTF-8 字节数计算），有对照实现时同时打印加速比
+    吞吐量低于 MIN_THROUGHPUT 或加速比低于 MIN_SPEEDUP 时断言失败
+    """
+    size_mb = sum(len(item.encode('utf-8')) for item in items) / 1e6
+    if legacy is None:
+        new_time, = measure([new], items)
+    else:
+        assert [new(item) for item in items] == [legacy(item) for item in items], f"{name} 结果与原实现不一致"
+        new_time, legacy_time = measure([new, legacy], items)
+    line = f"{name:<22} {size_mb / new_time:8.1f} MB/s"
+    if legacy is not None:
+        line += f"   原实现 {size_mb / legacy_time:8.1f} MB/s   加速 {legacy_time / new_time:.2f}x"
+    print(line)
+    assert size_mb / new_time >= MIN_THROUGHPUT[name], f"{name} 吞吐量低于下限 {MIN_THROUGHPUT[name]} MB/s"
+    if legacy is not None:
+        assert legacy_time / new_time >= MIN_SPEEDUP[name], f"{name} 加速比低于下限 {MIN_SPEEDUP[name]}x"
+
+
+def run(n_records=2000):
+    text = make_emr_text(n_records)
+    documents = [text[i:i + 2000] for i in range(0, len(text), 2000)]
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    print(f"合成病历: {len(text.encode('utf-8')) / 1e6:.1f} MB, {len(documents)} 段, {len(lines)} 行\n")
+
+    report("clean_content", documents, clean_content, legacy_clean_content)
+    report("tidy_whitespace", documents, tidy_whitespace, legacy_tidy_whitespace)
+    report("is_chinese_title", lines, is_chinese_title, legacy_is_chinese_title)
+    report("is_chinese_name", lines, is_chinese_name)
+    report("clean_filename", lines, clean_filename)
+
+    deid = load_script(os.path.join("hutcm2nd-norm-code", "De-privacization.py"), "de_privacization")
+    report("de_privacy_admission", documents, lambda document: deid.de_privacy_admission(document, set()))
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,61 @@
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 模拟返回的最大长度（字符）：截取输入病历的末尾部分作为"标准化结果"
+REPLY_CHARS = 200
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    本地模拟的 chat/completions 接口（与 siliconflow 的返回格式一致），用于在不调用真实 API 的情况下
+    对批处理程序做端到端计时；每个请求按 server.latency 秒模拟模型耗时
+    """
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        content = json.loads(body)['messages'][0]['content']
+        time.sleep(self.server.latency)
+        with self.server.lock:
+            self.server.requests += 1
+            self.server.request_bytes += len(body)
+
+        data = json.dumps({'choices': [{'message': {'role': 'assistant', 'content': content[-REPLY_CHARS:]}}]},
+                          ensure_ascii=False).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        """不打印每个请求的访问日志"""
+
+
+def start_stub(latency=0.0, port=0):
+    """
+    在后台线程中启动模拟服务
+    :param port: 0 表示自动选择空闲端口
+    :return: (服务对象, 接口 URL)；服务对象的 requests/request_bytes 为累计的请求数和请求字节数，用完后调用 shutdown()
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', port), StubHandler)
+    server.latency = latency
+    server.lock = threading.Lock()
+    server.requests = 0
+    server.request_bytes = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions"
+
+
+if __name__ == "__main__":
+    # 单独运行：python llm_stub.py [端口] [每个请求的模拟耗时（秒）]
+    server, url = start_stub(float(sys.argv[2]) if len(sys.argv) > 2 else 0.0,
+                             int(sys.argv[1]) if len(sys.argv) > 1 else 8000)
+    print(f"模拟服务已启动: {url}（设置环境变量 LLM_API_URL={url} 后运行批处理程序）")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
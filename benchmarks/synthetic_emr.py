@@ -0,0 +1,196 @@
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+# 合成病历用的文本片段（不含任何真实患者信息）
+SURNAMES = "赵钱孙李周吴郑王冯陈褚卫蒋沈韩杨朱秦尤许何吕施张孔曹严华金魏陶姜"
+GIVEN_NAMES = "伟芳娜敏静丽强磊军洋勇艳杰娟涛明超秀霞平刚桂英华玉兰"
+COMPLAINTS = ["右膝关节疼痛3年，加重1周", "双膝关节肿痛反复发作5年", "左膝关节疼痛伴活动受限2月", "双膝关节酸痛10余年，加重半月"]
+PHRASES = ["患者诉右膝关节疼痛较前缓解，", "夜间睡眠可，纳可，二便调。", "查体：右膝关节压痛（+），", "浮髌试验（-），活动度可。",
+           "继续目前治疗方案，密切观察病情变化。", "舌淡红，苔薄白，脉弦细。", "予中药熏洗及针刺治疗，", "膝关节X线示：关节间隙变窄，骨质增生。",
+           "患者上下楼梯时疼痛明显，休息后可缓解。", "T:36.5℃ P:78次/分 R:18次/分 BP:120/80mmHg。"]
+TCM_DIAGNOSES = ["膝痹病（气滞血瘀证）", "膝痹病（肝肾亏虚证）", "膝痹病（寒湿痹阻证）"]
+WESTERN_DIAGNOSES = ["膝关节骨性关节炎", "双膝骨关节炎", "膝关节退行性病变；高血压病2级"]
+COURSE_TITLES = ["日常病程记录", "主治医师查房记录", "副主任医师查房记录", "（主任医师）查房记录"]
+EXAMS = [("膝关节正侧位片", "X线"), ("膝关节MRI平扫", "MR"), ("心电图", "心电")]
+LAB_ITEMS = [("血常规", "白细胞计数", "3.5-9.5", "10^9/L"), ("血常规", "血红蛋白", "130-175", "g/L"),
+             ("生化全项", "谷丙转氨酶", "9-50", "U/L"), ("生化全项", "肌酐", "57-111", "umol/L"),
+             ("血沉", "红细胞沉降率", "0-15", "mm/h"), ("C反应蛋白", "C反应蛋白", "0-10", "mg/L")]
+SOLAR_TERMS = ["立春", "雨水", "惊蛰", "春分", "清明", "谷雨", "立夏", "小满", "芒种", "夏至"]
+
+
+def person_name(rng):
+    """随机生成 2~3 个汉字的姓名"""
+    return rng.choice(SURNAMES) + "".join(rng.choice(GIVEN_NAMES) for _ in range(rng.randint(1, 2)))
+
+
+def paragraph(rng, text_scale=1.0, low=3, high=8):
+    """由文本片段拼成一段文字，text_scale 控制长度"""
+    count = max(1, int(rng.randint(low, high) * text_scale))
+    return "".join(rng.choice(PHRASES) for _ in range(count))
+
+
+def admission_stay(rng):
+    """随机的住院时间段 :return: (入院时间, 出院时间, 住院天数)"""
+    admit = datetime(2021, 1, 1) + timedelta(days=rng.randint(0, 700), hours=rng.randint(8, 17))
+    days = rng.randint(5, 20)
+    return admit, admit + timedelta(days=days), days
+
+
+def course_stamps(rng, admit, days, n_records):
+    """住院期间按时间先后排列的病程记录时间"""
+    return sorted(admit + timedelta(days=rng.uniform(0, days)) for _ in range(n_records))
+
+
+def write_excel(df, path, title_rows=None):
+    """
+    写出 Excel（需要 openpyxl）。pandas 已不支持写出 .xls，统一写出 .xlsx；读取时 pandas 按文件内容判断格式
+    :param title_rows: 表头之前的标题行（如 hucm1st 导出的前两行），读取时对应 header=len(title_rows)
+    """
+    if title_rows:
+        rows = [[title] + [None] * (len(df.columns) - 1) for title in title_rows]
+        rows.append(list(df.columns))
+        rows.extend(df.itertuples(index=False, name=None))
+        pd.DataFrame(rows).to_excel(path, header=False, index=False)
+    else:
+        df.to_excel(path, index=False)
+    return path
+
+
+def generate_cstcm(output_dir, n_patients=100, text_scale=1.0, max_records=10, seed=0):
+    """
+    生成 cstcm 格式的导出表：入院记录、出院记录、首次病程、日常病程、检查项、检验项，
+    均以 住院号 标识患者（检验项另有 病案号）
+    :return: {表名: 文件路径}
+    """
+    rng = random.Random(seed)
+    os.makedirs(output_dir, exist_ok=True)
+    admission, discharge, first_course, daily, exams, labs = [], [], [], [], [], []
+    for i in range(n_patients):
+        patient_id = str(2021000 + i)
+        admit, leave, days = admission_stay(rng)
+        admission.append({'住院号': patient_id, '主诉': rng.choice(COMPLAINTS),
+                          '辅助检查项目': paragraph(rng, text_scale, 1, 3), '现病史': paragraph(rng, text_scale, 5, 15),
+                          '中医四诊': paragraph(rng, text_scale, 2, 4), '专科检查': paragraph(rng, text_scale, 2, 6)})
+        discharge.append({'住院号': patient_id, '入院时间': admit, '出院时间': leave,
+                          '入院诊断': rng.choice(TCM_DIAGNOSES), '出院诊断': rng.choice(WESTERN_DIAGNOSES),
+                          '诊疗经过': paragraph(rng, text_scale, 5, 12), '入院情况': paragraph(rng, text_scale, 3, 8),
+                          '出院医嘱': paragraph(rng, text_scale, 1, 3), '出院情况': paragraph(rng, text_scale, 2, 5)})
+        first_course.append({'住院号': patient_id, '中医诊断': rng.choice(TCM_DIAGNOSES),
+                             '西医诊断': rng.choice(WESTERN_DIAGNOSES), '诊疗计划': paragraph(rng, text_scale, 2, 6),
+                             '诊断依据': paragraph(rng, text_scale, 2, 6), '专科检查': paragraph(rng, text_scale, 2, 6),
+                             '病例特点': paragraph(rng, text_scale, 4, 10)})
+        for stamp in course_stamps(rng, admit, days, rng.randint(1, max_records)):
+            daily.append({'住院号': patient_id, '病程记录时间': stamp.strftime('%Y-%m-%d %H:%M'),
+                          '标题': rng.choice(COURSE_TITLES), '病程记录内容': paragraph(rng, text_scale)})
+        for name, kind in rng.sample(EXAMS, rng.randint(1, len(EXAMS))):
+            exams.append({'住院号': patient_id, '检查名称': name, '报告日期': admit + timedelta(days=1),
+                          '检查所见': paragraph(rng, text_scale, 1, 3), '检查类型': kind,
+                          '检查结果': rng.choice(WESTERN_DIAGNOSES)})
+        for suite, item, reference, unit in LAB_ITEMS:
+            received = admit + timedelta(hours=rng.randint(2, 48))
+            labs.append({'病案号': patient_id, '住院号': patient_id, '参考范围': reference,
+                         '报告时间': received + timedelta(hours=3), '检验结果': f"{rng.uniform(1, 150):.1f}",
+                         '单位': unit, '检验套名称': suite, '标本名称': '血液',
+                         '异常提示': rng.choice(['', '', '↑', '↓']), '检验项名称': item, '接收时间': received})
+
+    tables = {'入院记录': admission, '出院记录': discharge, '首次病程': first_course, '日常病程': daily,
+              '检查项': exams, '检验项': labs}
+    return {name: write_excel(pd.DataFrame(rows), os.path.join(output_dir, f"{name}.xlsx"))
+            for name, rows in tables.items()}
+
+
+def generate_hucm1st(output_dir, n_patients=100, text_scale=1.0, max_records=10, seed=0):
+    """
+    生成 hucm1st 格式的宽表导出：前两行为标题，第三行为列名（header=2），以 regno_admno 标识患者，
+    日常病程为一列，内含多条以 YYYY-MM-DD HH:MM 开头的记录
+    :return: 文件路径
+    """
+    rng = random.Random(seed)
+    os.makedirs(output_dir, exist_ok=True)
+    rows = []
+    for i in range(n_patients):
+        admit, _, days = admission_stay(rng)
+        stamps = course_stamps(rng, admit, days, rng.randint(1, max_records))
+        rows.append({
+            'regno_admno': f"{800000 + i}_{rng.randint(1, 3)}",
+            '性别': rng.choice(['男', '女']), '年龄': rng.randint(45, 85),
+            '主诉': rng.choice(COMPLAINTS), '辅助检查': paragraph(rng, text_scale, 1, 3),
+            '现病史': paragraph(rng, text_scale, 5, 15), '中医望诊': paragraph(rng, text_scale, 1, 3),
+            '专科检查': paragraph(rng, text_scale, 2, 6),
+            '诊疗经过': paragraph(rng, text_scale, 5, 12), '入院情况': paragraph(rng, text_scale, 3, 8),
+            '出院医嘱': paragraph(rng, text_scale, 1, 3), '出院情况': paragraph(rng, text_scale, 2, 5),
+            '出院记录-入院诊断': rng.choice(TCM_DIAGNOSES), '出院诊断': rng.choice(WESTERN_DIAGNOSES),
+            '首次病程-中医诊断': rng.choice(TCM_DIAGNOSES), '诊疗计划': paragraph(rng, text_scale, 2, 6),
+            '诊断依据': paragraph(rng, text_scale, 2, 6), '首次病程-专科检查': paragraph(rng, text_scale, 2, 6),
+            '首次病程-西医诊断': rng.choice(WESTERN_DIAGNOSES), '病例特点': paragraph(rng, text_scale, 4, 10),
+            '日常病程': "".join(f"{stamp:%Y-%m-%d %H:%M}  {rng.choice(COURSE_TITLES)}\n{paragraph(rng, text_scale)}\n"
+                            for stamp in stamps),
+            '影像检查': rng.choice(EXAMS)[0], '实验室检查': paragraph(rng, text_scale, 1, 2),
+        })
+    path = os.path.join(output_dir, "KOA精确导出v1.xlsx")
+    return write_excel(pd.DataFrame(rows), path, title_rows=["KOA精确导出", f"导出时间：{datetime(2023, 5, 1):%Y-%m-%d}"])
+
+
+def generate_hutcm2nd(output_dir, n_patients=100, text_scale=1.0, max_records=10, seed=0, gbk_ratio=0.1, crlf_ratio=0.1):
+    """
+    生成 hutcm2nd 格式的导出目录：每位患者一个文件夹，包含 入院/出院/首程/病程.txt，
+    带有需要去隐私化的姓名信息块和医师签名，病程以 YYYY.MM.DD HH:MM 标题 开头；
+    gbk_ratio 比例的患者文件以 GBK 编码保存（与真实导出一样混有不同编码），
+    crlf_ratio 比例的患者文件使用 \r\n 换行（Windows 导出的文件）
+    :return: 导出目录
+    """
+    rng = random.Random(seed)
+    for i in range(n_patients):
+        patient_dir = os.path.join(output_dir, f"{300000 + i}")
+        os.makedirs(patient_dir, exist_ok=True)
+        patient, doctor = person_name(rng), person_name(rng)
+        admit, _, days = admission_stay(rng)
+        files = {
+            '入院.txt': (f"姓  名：{patient}    性别：{rng.choice(['男', '女'])}    年龄：{rng.randint(45, 85)}岁\n"
+                        f"入院日期：{admit:%Y-%m-%d}    发病节气：{rng.choice(SOLAR_TERMS)}\n\n"
+                        f"主诉：{rng.choice(COMPLAINTS)}\n现病史：{paragraph(rng, text_scale, 5, 15)}\n"
+                        f"既往史：否认糖尿病病史。\n个人史：生于原籍。\n家族史：无特殊。\n"
+                        f"体格检查：{paragraph(rng, text_scale, 2, 5)}专科检查：{paragraph(rng, text_scale, 2, 5)}\n"
+                        f"初步诊断：{rng.choice(TCM_DIAGNOSES)}\n医师签名：{doctor} \n"),
+            '出院.txt': (f"患者姓名：{patient}  住院号：{300000 + i}  住院天数：{days}天\n"
+                        f"入院情况：{paragraph(rng, text_scale, 3, 8)}\n诊疗经过：{paragraph(rng, text_scale, 5, 12)}\n"
+                        f"出院情况：{paragraph(rng, text_scale, 2, 5)}\n出院医嘱：{paragraph(rng, text_scale, 1, 3)}\n"
+                        f"医师签名：{doctor} \n"),
+            '首程.txt': (f"病例特点：{paragraph(rng, text_scale, 4, 10)}\n中医诊断：{rng.choice(TCM_DIAGNOSES)}\n"
+                        f"西医诊断：{rng.choice(WESTERN_DIAGNOSES)}\n中医鉴别诊断：{paragraph(rng, text_scale, 1, 2)}\n"
+                        f"诊疗计划：{paragraph(rng, text_scale, 2, 6)}\n{doctor}\n"),
+            '病程.txt': "".join(f"{stamp:%Y.%m.%d %H:%M} {rng.choice(COURSE_TITLES)}\n{paragraph(rng, text_scale)}\n"
+                              f"{doctor}\n\n"
+                              for stamp in course_stamps(rng, admit, days, rng.randint(1, max_records))),
+        }
+        encoding = 'gbk' if rng.random() < gbk_ratio else 'utf-8'
+        newline = '\r\n' if rng.random() < crlf_ratio else '\n'
+        for filename, content in files.items():
+            with open(os.path.join(patient_dir, filename), 'w', encoding=encoding, newline=newline) as f:
+                f.write(content)
+    return output_dir
+
+
+def generate_all(output_dir, n_patients=100, text_scale=1.0, max_records=10, seed=0):
+    """
+    生成三个中心的合成输入
+    :return: {'cstcm': {表名: 路径}, 'hucm1st': 路径, 'hutcm2nd': 目录}
+    """
+    return {
+        'cstcm': generate_cstcm(os.path.join(output_dir, 'cstcm'), n_patients, text_scale, max_records, seed),
+        'hucm1st': generate_hucm1st(os.path.join(output_dir, 'hucm1st'), n_patients, text_scale, max_records, seed),
+        'hutcm2nd': generate_hutcm2nd(os.path.join(output_dir, 'hutcm2nd'), n_patients, text_scale, max_records, seed),
+    }
+
+
+if __name__ == "__main__":
+    # 用法：python synthetic_emr.py 输出目录 [患者数] [文本长度倍数]
+    output_dir = sys.argv[1] if len(sys.argv) > 1 else 'synthetic-emr'
+    n_patients = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    text_scale = float(sys.argv[3]) if len(sys.argv) > 3 else 1.0
+    generate_all(output_dir, n_patients, text_scale)
+    print(f"已生成 {n_patients} 位患者的合成数据: {output_dir}")
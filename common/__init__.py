@@ -0,0 +1 @@
+# 各中心共用的工具模块
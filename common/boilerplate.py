@@ -0,0 +1,180 @@
+import json
+import os
+import re
+from collections import Counter
+
+from common.input_index import list_patients, list_patient_files
+from common.tokens import estimate_tokens
+
+# 一句文本在同类段落中出现的文档比例达到该阈值时视为模板行
+MIN_DOCUMENT_RATIO = 0.5
+# 同类段落的文档数少于该值时不学习（样本太少，高频行不可靠）
+MIN_DOCUMENTS = 20
+# 短于该长度的行（如"无"、"否认"）往往是实际内容，不作为模板行
+MIN_LINE_LENGTH = 4
+
+# 不学习模板行的段落类型：检验/检查记录每行都是结构化字段（检验项目、单位、参考范围），高频也不能删除
+EXCLUDED_SECTIONS = {'检验项', '检查项'}
+# "列名: 值" 形式的字段行（检验项目: 血糖、单位: mmol/L）是实际内容，不作为模板行
+FIELD_LINE = re.compile(r'^[^:：]{1,20}[:：]\s*\S')
+# 字段行中只有签名栏（医师签名：、记录者：等）可以作为模板行
+SIGNATURE_FIELD = re.compile(r'^[^:：]*(?:签名|签字|医师|记录者|审核)\s*[:：]')
+# 阴性/阳性体征等检查所见即使高频也是有意义的内容（如"浮髌试验（-）"、"未闻及干湿性啰音"）
+FINDING_LINE = re.compile(r'[（(]\s*[-+±]\s*[)）]|阴性|阳性|未见|未触及|未闻及|无明显')
+
+# 学习和删除以句为单位：每行在句末标点（。；）之后切开，标点留在句尾
+# hucm1st 的文件只有一行（clean_content 把换行合并为空格），cstcm 的行多为"列名: 值"字段行，
+# 按整行统计时都学不到模板，切分后字段值中的固定套话也能被识别
+PHRASE_END = re.compile(r'(?<=[。；;])')
+
+# 拆分后的文件名：(拆分)病程记录3.txt、日常病程记录12.txt 等归为同一段落类型
+SPLIT_FILENAME = re.compile(r'^(?:\(拆分\))?(.*?)\d*$')
+
+
+def section_type(filename):
+    """由文件名得到段落类型（去掉扩展名、"(拆分)"前缀和序号）"""
+    return SPLIT_FILENAME.match(os.path.splitext(filename)[0]).group(1)
+
+
+def iter_documents(input_dir, suffix='.txt', index=None):
+    """
+    遍历输入目录（第一层为患者文件夹）中的文件 :return: 生成 (段落类型, 文件路径)
+    :param index: 输入索引（common.input_index），设置时按索引读取源文件
+    """
+    for patient in list_patients(input_dir, index):
+        for filename, path in list_patient_files(input_dir, patient, index):
+            if filename.endswith(suffix):
+                yield section_type(filename), path
+
+
+def split_phrases(line):
+    """把一行按句末标点切成句子（拼接后与原行相同）"""
+    return [phrase for phrase in PHRASE_END.split(line) if phrase]
+
+
+def is_candidate(section, line, min_length=MIN_LINE_LENGTH):
+    """一行文本能否作为模板行：排除检验/检查段落、过短的行、字段行（签名栏除外）和检查所见"""
+    if section in EXCLUDED_SECTIONS or len(line) < min_length:
+        return False
+    if FIELD_LINE.match(line) and not SIGNATURE_FIELD.match(line):
+        return False
+    return not FINDING_LINE.search(line)
+
+
+def learn_boilerplate(input_dir, min_ratio=MIN_DOCUMENT_RATIO, min_documents=MIN_DOCUMENTS,
+                      min_length=MIN_LINE_LENGTH, index=None):
+    """
+    扫描一个中心的全部输入文件，按段落类型学习高频模板行（签名栏、固定标题、模板套话等）：
+    1. 每个文件按行、行内按句末标点切成句子并去除首尾空白，同一文件中重复的句子只计一次
+    2. 统计每一句出现在同类段落多少个文件中（文档频率）
+    3. 文档比例达到 min_ratio 且长度不少于 min_length 的句子记为模板行，
+       字段行、检查所见和检验/检查段落不参与学习（见 is_candidate）
+    :return: {段落类型: {'documents': 文件数, 'lines': [{'line', 'documents', 'saved_tokens'}, ...]}}
+    """
+    document_counts = Counter()
+    line_counts = {}
+    for section, path in iter_documents(input_dir, index=index):
+        with open(path, 'r', encoding='utf-8') as f:
+            lines = {phrase.strip() for line in f for phrase in split_phrases(line)}
+        document_counts[section] += 1
+        line_counts.setdefault(section, Counter()).update(line for line in lines if is_candidate(section, line, min_length))
+
+    table = {}
+    for section, documents in sorted(document_counts.items()):
+        if documents < min_documents:
+            continue
+        threshold = documents * min_ratio
+        lines = [
+            {'line': line, 'documents': count, 'saved_tokens': round(estimate_tokens(line) * count, 1)}
+            for line, count in line_counts[section].most_common() if count >= threshold
+        ]
+        if lines:
+            table[section] = {'documents': documents, 'lines': lines}
+    return table
+
+
+def save_boilerplate(table, path, source=None):
+    """保存学习到的模板行（即删除清单，供审计）"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'source': source, 'sections': table}, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+def load_boilerplate(path):
+    """
+    读取删除清单（旧版本学习到的字段行等同样按 is_candidate 排除）
+    旧版本按整行学习的多句模板行切成句子后再匹配（切出的句子按 MIN_LINE_LENGTH 排除过短的句子）
+    :return: {段落类型: 模板行集合}
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        sections = json.load(f).get('sections', {})
+    table = {}
+    for section, entry in sections.items():
+        lines = set()
+        for item in entry['lines']:
+            phrases = [phrase.strip() for phrase in split_phrases(item['line'])]
+            min_length = 0 if len(phrases) == 1 else MIN_LINE_LENGTH
+            lines.update(phrase for phrase in phrases if is_candidate(section, phrase, min_length))
+        if lines:
+            table[section] = lines
+    return table
+
+
+def load_or_learn_boilerplate(input_dir, path, index=None):
+    """
+    删除清单存在时直接读取，否则扫描 input_dir 学习并保存
+    清单可以手工编辑（删去不应过滤的行），删除该文件即可重新学习
+    """
+    if not os.path.exists(path):
+        table = learn_boilerplate(input_dir, index=index)
+        save_boilerplate(table, path, source=os.path.basename(os.path.normpath(input_dir)))
+        print(f"模板行学习完成: {len(table)} 类段落，删除清单已保存到 {path}")
+        for section, entry in table.items():
+            saved = sum(item['saved_tokens'] for item in entry['lines'])
+            print(f"  {section}: {entry['documents']} 个文件，{len(entry['lines'])} 条模板行，预计节省 {saved:.0f} tokens")
+    return load_boilerplate(path)
+
+
+def strip_boilerplate(content, lines):
+    """
+    删除文本中的模板行（每行按句末标点切成句子，按去除首尾空白后的整句匹配，其余内容保持原样；
+    整行的句子都被删除时删去该行）
+    删除后没有剩余内容时保留原文，避免把整份记录变成空输入
+    :return: (处理后的文本, 删除的文本，每句一行)
+    """
+    if not lines:
+        return content, ""
+    kept = []
+    removed = []
+    for line in content.split('\n'):
+        phrases = split_phrases(line)
+        rest = [phrase for phrase in phrases if phrase.strip() not in lines]
+        if len(rest) < len(phrases):
+            removed.extend(phrase.strip() for phrase in phrases if phrase.strip() in lines)
+            if not rest:
+                continue
+        kept.append(''.join(rest))
+    if not removed or not any(line.strip() for line in kept):
+        return content, ""
+    return '\n'.join(kept), '\n'.join(removed)
+
+
+def boilerplate_stats(stats, section, removed):
+    """按段落类型累计处理的文件数、删除的句数和节省的估算 token 数（原地更新）"""
+    entry = stats.setdefault(section, {'files': 0, 'lines': 0, 'saved_tokens': 0.0})
+    entry['files'] += 1
+    if removed:
+        entry['lines'] += removed.count('\n') + 1
+        entry['saved_tokens'] += estimate_tokens(removed)
+    return stats
+
+
+def report_boilerplate(stats):
+    """打印各段落类型的模板行删除统计"""
+    if not stats:
+        return
+    print("\n模板行过滤统计：")
+    for section, entry in sorted(stats.items()):
+        print(f"  {section}: {entry['files']} 个文件，删除 {entry['lines']} 句，约节省 {entry['saved_tokens']:.0f} tokens")
+    print(f"  合计约节省 {sum(entry['saved_tokens'] for entry in stats.values()):.0f} tokens")
@@ -0,0 +1,196 @@
+import hashlib
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from common.dataset_export import patient_rows
+from common.profiling import profile_stage, profiling_requested
+
+# 各中心的标准化输出（相对仓库根目录）：merged 为每位患者一个整合病历文件，sections 为患者文件夹下的段落返回结果
+CORPUS_SOURCES = {
+    'cstcm': (os.path.join('cstcm-norm-code', 'step2-tojoint'), 'sections'),
+    'hucm1st': (os.path.join('hucm1st-norm-code', 'step3-merged'), 'merged'),
+    'hutcm2nd': (os.path.join('hutcm2nd-norm-code', 'step3-tojoint'), 'sections'),
+}
+
+# 整合病历文件名：整合病历_{患者ID}.txt
+MERGED_FILENAME = re.compile(r'^整合病历_(.+)\.txt$')
+
+
+def file_signature(paths):
+    """一组文件的签名：文件名、大小和修改时间的哈希（不读取文件内容）"""
+    digest = hashlib.sha1()
+    for path in sorted(paths):
+        stat = os.stat(path)
+        digest.update(f"{os.path.basename(path)}\x1f{stat.st_size}\x1f{stat.st_mtime_ns}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def list_center_patients(root, kind):
+    """列出一个中心的全部患者 :return: {本地患者ID: 组成该患者文档的文件路径列表}"""
+    patients = {}
+    if kind == 'merged':
+        for filename in os.listdir(root):
+            match = MERGED_FILENAME.match(filename)
+            if match:
+                patients[match.group(1)] = [os.path.join(root, filename)]
+    else:
+        for patient_id in os.listdir(root):
+            patient_path = os.path.join(root, patient_id)
+            if not os.path.isdir(patient_path):
+                continue
+            files = [os.path.join(patient_path, filename) for filename in os.listdir(patient_path)
+                     if filename.endswith('_response.txt')]
+            if files:
+                patients[patient_id] = files
+    return patients
+
+
+def sections_document(center, patient_id, patient_path):
+    """把患者文件夹中的段落返回结果按病历顺序拼成一份文档（与整合病历的格式一致）"""
+    parts = []
+    category = None
+    for row in patient_rows(center, patient_id, patient_path):
+        if row['category'] != category:
+            category = row['category']
+            parts.append(f"\n【{category}】\n")
+        parts.append(f"{row['section']}{row['ordinal'] or ''}：{' '.join(row['text'].split())}\n")
+    return ''.join(parts).strip()
+
+
+def store_object(corpus_dir, content):
+    """
+    按内容哈希保存文档（内容相同的文档只保存一份）
+    :return: 内容哈希
+    """
+    data = content.encode('utf-8')
+    digest = hashlib.sha1(data).hexdigest()
+    path = os.path.join(corpus_dir, 'objects', digest[:2], digest + '.txt')
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    return digest
+
+
+def ingest_center(center, root, kind, corpus_dir, known):
+    """
+    导入一个中心的输出（在工作进程中运行）：只读取签名与上次不同的患者，文档保存到内容寻址存储中
+    :param known: {本地患者ID: 上次导入时的签名}
+    :return: (中心名, {本地患者ID: 签名}, {本地患者ID: 内容哈希}（仅本次读取的患者）, 耗时)
+    """
+    start_time = time.perf_counter()
+    signatures = {}
+    hashes = {}
+    for patient_id, paths in sorted(list_center_patients(root, kind).items()):
+        signature = file_signature(paths)
+        signatures[patient_id] = signature
+        if known.get(patient_id) == signature:
+            continue
+        if kind == 'merged':
+            with open(paths[0], 'r', encoding='utf-8') as f:
+                content = f.read().strip()
+        else:
+            content = sections_document(center, patient_id, os.path.join(root, patient_id))
+        hashes[patient_id] = store_object(corpus_dir, content)
+    return center, signatures, hashes, time.perf_counter() - start_time
+
+
+def index_path(corpus_dir):
+    """全局患者索引文件路径"""
+    return os.path.join(corpus_dir, 'patient_index.json')
+
+
+def load_corpus_index(corpus_dir):
+    """读取全局患者索引 :return: {'next_id': 下一个全局编号, 'patients': {'中心/本地ID': 记录}}"""
+    path = index_path(corpus_dir)
+    if not os.path.exists(path):
+        return {'next_id': 1, 'patients': {}}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_corpus_index(corpus_dir, index):
+    """保存全局患者索引"""
+    path = index_path(corpus_dir)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def build_corpus(sources=None, corpus_dir='corpus', workers=None):
+    """
+    将各中心的标准化输出导入同一个去重存储，并维护全局患者索引：
+    1. 每个中心一个工作进程并行导入；按文件签名增量更新，只读取新交付或发生变化的患者
+    2. 文档按内容哈希保存在 objects/ 下，内容相同的文档只保存一份
+    3. patient_index.json 记录 中心 + 本地ID（住院号、病案号、regno_admno 等）-> 全局ID，
+       全局ID（G000001 起）一经分配保持不变，新患者依次编号
+    :param sources: {中心名: (目录, 'merged' 或 'sections')}，默认为 CORPUS_SOURCES 中存在的目录
+    :param workers: 并行进程数，默认每个中心一个进程；1 表示在当前进程中串行处理
+    :return: 全局患者索引
+    """
+    if sources is None:
+        sources = {center: source for center, source in CORPUS_SOURCES.items() if os.path.isdir(source[0])}
+    os.makedirs(corpus_dir, exist_ok=True)
+    index = load_corpus_index(corpus_dir)
+    patients = index['patients']
+
+    tasks = []
+    for center, (root, kind) in sorted(sources.items()):
+        known = {entry['local_id']: entry['signature'] for entry in patients.values() if entry['center'] == center}
+        tasks.append((center, root, kind, corpus_dir, known))
+
+    workers = workers or len(tasks) or 1
+    if workers == 1 or len(tasks) <= 1:
+        results = [ingest_center(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(ingest_center, *zip(*tasks)))
+
+    for center, signatures, hashes, seconds in results:
+        added = changed = 0
+        for patient_id, digest in sorted(hashes.items()):
+            key = f"{center}/{patient_id}"
+            entry = patients.get(key)
+            if entry is None:
+                entry = patients[key] = {'global_id': f"G{index['next_id']:06d}", 'center': center,
+                                         'local_id': patient_id}
+                index['next_id'] += 1
+                added += 1
+            elif entry.get('hash') != digest:
+                changed += 1
+            entry['hash'] = digest
+            # hashes 包含全部签名变化的患者：内容未变（哈希相同）的也在这里更新签名，下次不再读取；
+            # 不在 hashes 中的患者签名与索引中的相同，无需更新
+            entry['signature'] = signatures[patient_id]
+        removed = sum(1 for entry in patients.values() if entry['center'] == center and entry['local_id'] not in signatures)
+        print(f"中心 {center}: 共 {len(signatures)} 位患者，新增 {added} 位，内容变更 {changed} 位，"
+              f"未变化跳过 {len(signatures) - len(hashes)} 位，已不在本次输出中 {removed} 位（保留），用时 {seconds:.2f} 秒")
+
+    save_corpus_index(corpus_dir, index)
+    unique = len({entry['hash'] for entry in patients.values()})
+    print(f"语料库: {len(patients)} 位患者，{unique} 份不同的文档（去重 {len(patients) - unique} 份），已保存到 {corpus_dir}")
+    return index
+
+
+def read_document(corpus_dir, center, local_id, index=None):
+    """按 中心 + 本地ID 读取患者文档 :return: (全局ID, 文档内容)，不存在时返回 (None, None)"""
+    if index is None:
+        index = load_corpus_index(corpus_dir)
+    entry = index['patients'].get(f"{center}/{local_id}")
+    if entry is None:
+        return None, None
+    digest = entry['hash']
+    with open(os.path.join(corpus_dir, 'objects', digest[:2], digest + '.txt'), 'r', encoding='utf-8') as f:
+        return entry['global_id'], f.read()
+
+
+if __name__ == "__main__":
+    # 在仓库根目录运行：python -m common.corpus [--profile]
+    with profile_stage('corpus', enabled=profiling_requested()):
+        build_corpus()
@@ -0,0 +1,106 @@
+import re
+from functools import lru_cache
+
+# 已知的病程记录时间戳格式（名称 -> 正则），各中心按名称选择
+TIMESTAMP_FORMATS = {
+    # 2022-07-09 09:12（hucm1st）
+    'dash': r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}',
+    # 2021.10.10 08:11 主治医师查房记录（hutcm2nd，时间后必须有标题，一行最多一条）
+    'dot_title': r'\d{4}\.\d{2}\.\d{2} \d{2}:\d{2} .+',
+    # 2021/10/10 08:11
+    'slash': r'\d{4}/\d{1,2}/\d{1,2} \d{1,2}:\d{2}',
+    # 2021年10月10日 08:11
+    'chinese': r'\d{4}年\d{1,2}月\d{1,2}日 ?\d{1,2}[:：]\d{2}',
+}
+
+# 所有格式共有的四位年份开头
+YEAR = r'\d{4}'
+# 时间戳中的数字（年、月、日、时、分）
+DIGITS = re.compile(r'\d+')
+# 年份之后以字面分隔符开头、结构固定的格式：先查找"分隔符及之后的部分"，再检查前面是否为四位年份。
+# sre 对以字面量开头的正则使用快速查找，比在每个位置尝试 \d 快数倍；这些格式中真正时间戳的分隔符
+# 不可能落在另一个候选匹配的内部，结果与完整正则相同（dot_title 以 .+ 结尾，候选会吞掉同一行后面的内容，仍用完整正则）
+ANCHORED_FORMATS = {'dash', 'slash', 'chinese'}
+
+
+def normalize_formats(formats=None):
+    """格式提示统一为名称元组：None 表示全部已知格式，也可以是单个名称或名称列表"""
+    if formats is None:
+        return tuple(TIMESTAMP_FORMATS)
+    if isinstance(formats, str):
+        return (formats,)
+    return tuple(formats)
+
+
+def timestamp_regex(formats=None):
+    """返回所选格式的正则字符串（多个格式组成交替）"""
+    patterns = [TIMESTAMP_FORMATS[name] for name in normalize_formats(formats)]
+    if len(patterns) == 1:
+        return patterns[0]
+    if all(pattern.startswith(YEAR) for pattern in patterns):
+        # 提取公共的年份前缀：定长前缀不改变匹配结果，正则引擎只需在年份处依次尝试各格式
+        return YEAR + '(?:' + '|'.join(pattern[len(YEAR):] for pattern in patterns) + ')'
+    return '|'.join(f'(?:{pattern})' for pattern in patterns)
+
+
+@lru_cache(maxsize=None)
+def _compiled(formats):
+    return re.compile(timestamp_regex(formats))
+
+
+def timestamp_pattern(formats=None):
+    """返回所选格式编译后的正则（按格式组合缓存，只编译一次）"""
+    return _compiled(normalize_formats(formats))
+
+
+@lru_cache(maxsize=None)
+def _anchored(formats):
+    """单一格式且在 ANCHORED_FORMATS 中时返回去掉年份的正则，否则返回 None"""
+    if len(formats) != 1 or formats[0] not in ANCHORED_FORMATS:
+        return None
+    return re.compile(TIMESTAMP_FORMATS[formats[0]][len(YEAR):])
+
+
+def timestamp_starts(content, formats=None):
+    """content 中各时间戳的起始位置（与 timestamp_pattern(formats).finditer 的结果相同）"""
+    formats = normalize_formats(formats)
+    anchored = _anchored(formats)
+    if anchored is None:
+        return [match.start() for match in _compiled(formats).finditer(content)]
+    # \d 与 str.isdecimal 都是 Unicode Nd 类字符
+    return [start - 4 for start in (match.start() for match in anchored.finditer(content))
+            if start >= 4 and content[start - 4:start].isdecimal()]
+
+
+def timestamp_key(record):
+    """记录开头时间戳的排序键：(年, 月, 日, 时, 分)"""
+    return tuple(int(value) for value in DIGITS.findall(record[:32])[:5])
+
+
+def split_records(content, formats=None, sort=False):
+    """
+    按时间戳拆分病程记录
+    :param formats: 时间戳格式提示（TIMESTAMP_FORMATS 中的名称或名称列表），None 表示尝试全部已知格式
+    :param sort: 是否按时间戳先后排序（稳定排序，时间相同的记录保持原有顺序）
+    :return: 去除首尾空白后的记录列表；没有时间戳时返回空列表
+    """
+    # 每条记录从时间戳开始，到下一个时间戳之前结束，第一个时间戳之前的内容丢弃
+    starts = timestamp_starts(content, formats)
+    ends = starts[1:] + [len(content)]
+    records = [content[start:end].strip() for start, end in zip(starts, ends)]
+    if sort:
+        records.sort(key=timestamp_key)
+    return records
+
+
+def chronological_order(stamps):
+    """
+    按时间先后排列一组时间文本（如表格中的 病程记录时间 列），无法解析的排在最后
+    :return: 排序后的位置列表（稳定排序）
+    """
+    keys = []
+    for stamp in stamps:
+        # 缺失值（None、NaN、NaT）不等于自身
+        key = timestamp_key(str(stamp)) if stamp is not None and stamp == stamp else ()
+        keys.append((0, key) if key else (1, ()))
+    return sorted(range(len(keys)), key=keys.__getitem__)
@@ -0,0 +1,164 @@
+import importlib.util
+import json
+import os
+import re
+import shutil
+import sys
+
+import pandas as pd
+
+from common.profiling import profile_stage, profiling_requested
+
+# 各中心 LLM 标准化结果所在目录（相对仓库根目录，目录下第一层为患者文件夹）
+CENTER_OUTPUTS = {
+    'cstcm': os.path.join('cstcm-norm-code', 'step2-tojoint'),
+    'hucm1st': os.path.join('hucm1st-norm-code', 'step2-tojoint'),
+    'hutcm2nd': os.path.join('hutcm2nd-norm-code', 'step3-tojoint'),
+}
+
+# 大类（按病历逻辑顺序）及判断方法：段落名（去掉"(合并)"前缀）以这些文字开头
+CATEGORY_PREFIXES = [
+    ('入院记录', ('入院',)),
+    ('首次病程记录', ('首次病程', '首程')),
+    ('日常病程记录', ('日常病程', '病程')),
+    ('出院记录', ('出院',)),
+]
+OTHER_CATEGORY = '其他记录'
+CATEGORY_ORDER = {name: i for i, name in enumerate([name for name, _ in CATEGORY_PREFIXES] + [OTHER_CATEGORY])}
+
+# LLM 返回文件名：(拆分)日常病程记录3_response.txt -> 段落 日常病程记录、序号 3
+RESPONSE_FILENAME = re.compile(r'^(?:\(拆分\))?(.*?)(\d*)_response\.txt$')
+
+COLUMNS = ['patient', 'center', 'category', 'section', 'ordinal', 'text']
+
+
+def section_category(section):
+    """由段落名得到所属大类（入院记录/首次病程记录/日常病程记录/出院记录/其他记录）"""
+    name = section.replace('(合并)', '')
+    for category, prefixes in CATEGORY_PREFIXES:
+        if name.startswith(prefixes):
+            return category
+    return OTHER_CATEGORY
+
+
+def patient_rows(center, patient_id, patient_path):
+    """读取一位患者的全部 LLM 返回结果，每个文件一行"""
+    rows = []
+    for filename in os.listdir(patient_path):
+        match = RESPONSE_FILENAME.match(filename)
+        if not match:
+            continue
+        with open(os.path.join(patient_path, filename), 'r', encoding='utf-8') as f:
+            text = f.read().strip()
+        section = match.group(1)
+        rows.append({
+            'patient': patient_id,
+            'center': center,
+            'category': section_category(section),
+            'section': section,
+            'ordinal': int(match.group(2) or 0),
+            'text': text,
+        })
+    # 大类按病历顺序，同一大类内按段落名和序号排列
+    rows.sort(key=lambda row: (CATEGORY_ORDER[row['category']], row['section'], row['ordinal']))
+    return rows
+
+
+def require_parquet_engine():
+    """检查 Parquet 引擎（pyarrow 或 fastparquet），未安装时在导出开始前报错，而不是导出到最后才跳过"""
+    if not any(importlib.util.find_spec(engine) for engine in ('pyarrow', 'fastparquet')):
+        raise ImportError("Parquet 输出需要安装 pyarrow（pip install pyarrow），或使用 parquet=False 只导出 JSONL")
+
+
+def write_parquet(df, parquet_dir):
+    """
+    按 中心/大类 分区写出 Parquet
+    分区写出会在目录中追加新文件，因此先写到临时目录，完成后替换上一次导出的结果
+    """
+    tmp_dir = parquet_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    df.to_parquet(tmp_dir, partition_cols=['center', 'category'], index=False)
+    shutil.rmtree(parquet_dir, ignore_errors=True)
+    os.replace(tmp_dir, parquet_dir)
+
+
+def export_dataset(sources=None, output_dir='dataset', parquet=True):
+    """
+    将各中心的标准化结果导出为列式数据集，供下游研究直接按患者/段落读取，无需重新解析整合病历：
+    1. sections.jsonl：每行一个段落（patient、center、category、section、ordinal、text），同一患者的行连续存放
+    2. patient_index.json：{患者ID: [{center, offset, length, rows}, ...]}，offset/length 为该患者在
+       sections.jsonl 中的字节范围，查找单个患者只需一次 seek 和一次读取（见 read_patient）
+    3. parquet/：按 center、category 分区的 Parquet 数据集（parquet=True 时，需要 pyarrow）
+    sections.jsonl 和 patient_index.json 都先写临时文件再替换，中断时不会留下与字节偏移不一致的索引
+    :param sources: {中心名: 标准化结果目录}，默认为 CENTER_OUTPUTS 中存在的目录
+    :return: 段落数
+    """
+    if parquet:
+        require_parquet_engine()
+    if sources is None:
+        sources = {center: path for center, path in CENTER_OUTPUTS.items() if os.path.isdir(path)}
+    os.makedirs(output_dir, exist_ok=True)
+
+    jsonl_path = os.path.join(output_dir, 'sections.jsonl')
+    index = {}
+    all_rows = []
+    with open(jsonl_path + '.tmp', 'wb') as f:
+        for center, root in sorted(sources.items()):
+            for patient_id in sorted(os.listdir(root)):
+                patient_path = os.path.join(root, patient_id)
+                if not os.path.isdir(patient_path):
+                    continue
+                rows = patient_rows(center, patient_id, patient_path)
+                if not rows:
+                    continue
+                data = ''.join(json.dumps(row, ensure_ascii=False) + '\n' for row in rows).encode('utf-8')
+                index.setdefault(patient_id, []).append(
+                    {'center': center, 'offset': f.tell(), 'length': len(data), 'rows': len(rows)})
+                f.write(data)
+                all_rows.extend(rows)
+            print(f"已导出中心 {center}: {root}")
+
+    # 两个文件都写完后再依次替换，缩短两者不一致的时间窗口
+    index_path = os.path.join(output_dir, 'patient_index.json')
+    with open(index_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False)
+    os.replace(jsonl_path + '.tmp', jsonl_path)
+    os.replace(index_path + '.tmp', index_path)
+
+    if parquet and all_rows:
+        write_parquet(pd.DataFrame(all_rows, columns=COLUMNS), os.path.join(output_dir, 'parquet'))
+
+    print(f"导出完成: {len(index)} 位患者，{len(all_rows)} 个段落，已保存到 {output_dir}")
+    return len(all_rows)
+
+
+def load_patient_index(output_dir='dataset'):
+    """读取患者索引"""
+    with open(os.path.join(output_dir, 'patient_index.json'), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def read_patient(patient_id, output_dir='dataset', index=None, center=None):
+    """
+    按患者ID读取段落（通过索引直接定位到 sections.jsonl 中的字节范围）
+    :param index: 已读取的患者索引（多次查询时传入，避免重复读取）
+    :param center: 只读取指定中心的记录（不同中心的患者ID可能重复）
+    :return: 段落列表，每项为 dict
+    """
+    if index is None:
+        index = load_patient_index(output_dir)
+    rows = []
+    with open(os.path.join(output_dir, 'sections.jsonl'), 'rb') as f:
+        for span in index.get(patient_id, []):
+            if center is not None and span['center'] != center:
+                continue
+            f.seek(span['offset'])
+            # 按字节拆行：JSON 已转义换行符，文本中的 \u2028 等字符不会被当作行尾
+            rows.extend(json.loads(line) for line in f.read(span['length']).splitlines())
+    return rows
+
+
+if __name__ == "__main__":
+    # 在仓库根目录运行：python -m common.dataset_export [--profile] [--no-parquet]
+    with profile_stage('dataset_export', enabled=profiling_requested()):
+        export_dataset(parquet='--no-parquet' not in sys.argv)
@@ -0,0 +1,86 @@
+import json
+import os
+
+import pandas as pd
+
+from common.tokens import estimate_tokens_series
+
+# 中心去重汇总文件：保存在各导出表输出目录的上一级（即该中心的工作目录），记录每个导出表最近一次运行的去重统计
+DEDUPE_SUMMARY_FILE = 'dedupe-summary.json'
+
+
+def duplicate_mask(ids, records, seen=None):
+    """
+    标记同一患者内完全重复的记录（保留第一次出现的记录）：
+    对 (患者ID, 规范化后的记录文本) 计算哈希，哈希重复即视为重复行；空记录不参与去重
+    :param seen: 分块处理时跨块保存已出现哈希的集合（原地更新），None 表示只在本表内去重
+    :return: 布尔数组，True 表示应删除的重复行
+    """
+    keys = pd.util.hash_pandas_object(
+        pd.DataFrame({'id': ids.astype(str).to_numpy(), 'record': records.to_numpy(dtype=object)}),
+        index=False
+    )
+    mask = keys.duplicated().to_numpy(copy=True)
+    if seen is not None:
+        mask |= keys.isin(seen).to_numpy()
+        seen.update(keys[~mask].tolist())
+    mask &= (records != "").to_numpy()
+    return mask
+
+
+def dedupe_stats(records, mask, stats=None):
+    """
+    累计去重统计：总行数、删除的重复行数、节省的估算 token 数（记录文本 + 分隔符）
+    :param stats: 已有的统计字典（原地累加，分块处理时使用），None 表示新建
+    """
+    if stats is None:
+        stats = {}
+    stats['rows'] = stats.get('rows', 0) + len(records)
+    stats['duplicate_rows'] = stats.get('duplicate_rows', 0) + int(mask.sum())
+    saved = float(estimate_tokens_series(records[mask] + "\n\n").sum()) if mask.any() else 0.0
+    stats['saved_tokens'] = stats.get('saved_tokens', 0.0) + saved
+    return stats
+
+
+def format_dedupe(stats):
+    """去重统计的文字：行数、删除的重复行数及比例、节省的 token 数"""
+    rows = stats.get('rows', 0)
+    duplicate_rows = stats.get('duplicate_rows', 0)
+    ratio = duplicate_rows / rows * 100 if rows else 0.0
+    return (f"共 {rows} 行，删除完全重复行 {duplicate_rows} 行（{ratio:.1f}%），"
+            f"约节省 {stats.get('saved_tokens', 0.0):.0f} tokens")
+
+
+def record_dedupe(source, stats, output_dir):
+    """
+    把本导出表的去重统计写入中心汇总文件（同一导出表重新运行时覆盖上次的统计，每次运行的统计覆盖整张表）
+    :return: {导出表文件名: 统计}
+    """
+    path = os.path.join(os.path.dirname(os.path.abspath(output_dir)), DEDUPE_SUMMARY_FILE)
+    summary = {}
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                summary = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"警告: 去重汇总文件 {path} 读取失败，将重新记录: {e}")
+    summary[os.path.basename(source)] = {key: stats.get(key, 0) for key in ('rows', 'duplicate_rows', 'saved_tokens')}
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+    return summary
+
+
+def report_dedupe(source, stats, output_dir=None):
+    """
+    打印去重统计：本导出表的统计，以及本中心全部导出表（检验项、检查项、日常病程记录等各自运行）的合计
+    :param output_dir: 本导出表的输出目录，用于定位中心汇总文件；None 表示只打印本表的统计
+    """
+    print(f"\n去重统计（{os.path.basename(source)}）：{format_dedupe(stats)}。")
+    if output_dir is None:
+        return
+    summary = record_dedupe(source, stats, output_dir)
+    total = {key: sum(entry.get(key, 0) for entry in summary.values())
+             for key in ('rows', 'duplicate_rows', 'saved_tokens')}
+    print(f"本中心去重合计（{len(summary)} 个导出表：{'、'.join(sorted(summary))}）：{format_dedupe(total)}。")
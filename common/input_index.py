@@ -0,0 +1,53 @@
+import json
+import os
+
+
+def build_input_index(source_folders, suffix='.txt'):
+    """
+    建立 患者 -> 文件 的索引，代替把各源文件夹中的文件复制到同一个目录（虚拟合并视图）
+    多个源文件夹中有同名文件时，后面的文件夹优先（与依次复制时后复制的文件覆盖前面的一致）
+    :return: {患者ID: {文件名: 源文件绝对路径}}
+    """
+    index = {}
+    for source_folder in source_folders:
+        if not os.path.exists(source_folder):
+            print(f"警告: 源文件夹 '{source_folder}' 不存在，跳过")
+            continue
+        for patient_id in os.listdir(source_folder):
+            patient_source_path = os.path.join(source_folder, patient_id)
+            if not os.path.isdir(patient_source_path):
+                continue
+            files = index.setdefault(patient_id, {})
+            for filename in os.listdir(patient_source_path):
+                if filename.endswith(suffix):
+                    files[filename] = os.path.abspath(os.path.join(patient_source_path, filename))
+    return index
+
+
+def save_input_index(index, path):
+    """保存索引"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def load_input_index(path):
+    """读取索引"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def list_patients(input_dir, index=None):
+    """输入中的全部患者ID（排序）：有索引时取自索引，否则为 input_dir 下的患者文件夹"""
+    if index is not None:
+        return sorted(index)
+    return sorted(d for d in os.listdir(input_dir) if os.path.isdir(os.path.join(input_dir, d)))
+
+
+def list_patient_files(input_dir, patient_id, index=None):
+    """患者的全部输入文件 :return: [(文件名, 文件路径), ...]"""
+    if index is not None:
+        return sorted(index.get(patient_id, {}).items())
+    patient_path = os.path.join(input_dir, patient_id)
+    return [(filename, os.path.join(patient_path, filename)) for filename in sorted(os.listdir(patient_path))]
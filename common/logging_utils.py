@@ -0,0 +1,235 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import multiprocessing
+import os
+import queue
+import sys
+import time
+import unicodedata
+
+# 日志目录（相对运行目录）：每个脚本/实例一个 JSONL 文件
+LOG_DIR = 'logs'
+
+# 日志级别（可通过环境变量调整）：终端默认只显示 INFO 及以上，逐个患者/文件的 DEBUG 日志只写入 JSONL 文件；
+# 需要在终端查看逐条记录时设置 LOG_LEVEL=DEBUG
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+LOG_FILE_LEVEL = os.environ.get('LOG_FILE_LEVEL', 'DEBUG')
+
+# 非终端输出（重定向到文件、后台运行）时，进度以 INFO 日志记录的间隔（秒）
+PROGRESS_LOG_INTERVAL = 30
+
+# 后台写日志的监听线程及其队列、终端输出和当前的 JSONL 文件（队列和终端输出每个进程只配置一次）
+_listener = None
+_queue = None
+_console = None
+_file_handler = None
+# 多进程工作进程的日志队列（跨进程共享）及把其中的日志转入 _queue 的监听线程，首次创建进程池时启动
+_manager = None
+_worker_queue = None
+_worker_listener = None
+
+
+def get_logger(name):
+    """各模块的日志记录器（未调用 setup_logging 时 WARNING 及以上输出到终端，其余丢弃）"""
+    return logging.getLogger(name)
+
+
+class JsonlFormatter(logging.Formatter):
+    """每条日志一行 JSON：时间、级别、模块、消息，以及通过 extra={'fields': {...}} 传入的结构化字段"""
+
+    def format(self, record):
+        entry = {
+            'time': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry.update(fields)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class ProcessQueueHandler(logging.handlers.QueueHandler):
+    """
+    放入队列后立即返回的日志处理器，格式化和写文件都在监听线程中完成，不阻塞处理循环
+    工作进程（fork 方式）会继承该处理器，但工作进程中没有监听线程取出队列：进程池通过 worker_logging()
+    配置时会替换为跨进程队列；未配置时 WARNING 及以上直接输出到终端，其余丢弃
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.pid = os.getpid()
+
+    def emit(self, record):
+        if os.getpid() == self.pid:
+            super().emit(record)
+        elif record.levelno >= logging.WARNING:
+            logging.lastResort.handle(record)
+
+
+def setup_logging(name, log_dir=LOG_DIR, level=None, file_level=None):
+    """
+    配置日志：所有记录先进入内存队列，由后台线程写到终端和 {log_dir}/{name}.jsonl（追加）
+    同一进程中可以多次调用（如常驻进程中依次运行多个实例）：文件不同时先写完队列中已有的日志，
+    再切换到新的 JSONL 文件
+    :param name: 日志文件名（并行运行的多个实例应使用不同的名称）
+    :param level: 终端日志级别，默认 LOG_LEVEL
+    :param file_level: JSONL 文件日志级别，默认 LOG_FILE_LEVEL
+    :return: 日志文件路径
+    """
+    global _listener, _queue, _console, _file_handler
+    os.makedirs(log_dir, exist_ok=True)
+    path = os.path.join(log_dir, f"{name}.jsonl")
+    if _file_handler is not None and _file_handler.baseFilename == os.path.abspath(path):
+        return path
+
+    if _queue is None:
+        _console = logging.StreamHandler(sys.stderr)
+        _console.setFormatter(logging.Formatter('%(message)s'))
+        _queue = queue.SimpleQueue()
+        logging.getLogger().addHandler(ProcessQueueHandler(_queue))
+        # 退出前写完队列中剩余的日志
+        atexit.register(_stop_listener)
+    else:
+        _stop_listener()
+        _file_handler.close()
+
+    _console.setLevel(level or LOG_LEVEL)
+    _file_handler = logging.FileHandler(path, encoding='utf-8')
+    _file_handler.setLevel(file_level or LOG_FILE_LEVEL)
+    _file_handler.setFormatter(JsonlFormatter())
+    logging.getLogger().setLevel(min(_console.level, _file_handler.level))
+    _listener = logging.handlers.QueueListener(_queue, _console, _file_handler, respect_handler_level=True)
+    _listener.start()
+    return path
+
+
+def _stop_listener():
+    """停止监听线程（先写完队列中已有的日志）"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def worker_logging():
+    """
+    进程池的日志配置，用法：ProcessPoolExecutor(max_workers=workers, **worker_logging())
+    工作进程的日志（包括 DEBUG/INFO）经跨进程队列转入主进程，与主进程的日志写到同一终端和 JSONL 文件；
+    Windows（spawn 方式）的工作进程不继承任何处理器，也由此获得日志输出
+    :return: ProcessPoolExecutor 的 initializer/initargs 参数；未调用 setup_logging 时为空（保持默认行为）
+    """
+    global _manager, _worker_queue, _worker_listener
+    if _queue is None:
+        return {}
+    if _worker_queue is None:
+        _manager = multiprocessing.Manager()
+        _worker_queue = _manager.Queue()
+        # 工作进程中的记录已经格式化过，这里原样转入主进程的队列
+        _worker_listener = logging.handlers.QueueListener(_worker_queue, logging.handlers.QueueHandler(_queue))
+        _worker_listener.start()
+        # 退出时先于主监听线程停止（atexit 后注册先执行），保证工作进程的日志都写入文件
+        atexit.register(_stop_worker_listener)
+    return {'initializer': init_worker_logging, 'initargs': (_worker_queue, logging.getLogger().level)}
+
+
+def init_worker_logging(log_queue, level):
+    """工作进程初始化：日志全部放入跨进程队列（替换 fork 时继承的处理器）"""
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level)
+
+
+def _stop_worker_listener():
+    """停止工作进程日志的监听线程并关闭跨进程队列"""
+    global _manager, _worker_queue, _worker_listener
+    if _worker_listener is not None:
+        _worker_listener.stop()
+        _manager.shutdown()
+        _manager = _worker_queue = _worker_listener = None
+
+
+def format_seconds(seconds):
+    """秒数 -> 时:分:秒"""
+    seconds = int(seconds)
+    return f"{seconds // 3600:d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def display_width(text):
+    """文字在终端中占的列数（中文等全角字符占 2 列）"""
+    return sum(2 if unicodedata.east_asian_width(char) in 'WF' else 1 for char in text)
+
+
+class Progress:
+    """
+    紧凑的进度显示：已完成/总数、速率、预计剩余时间和失败数
+    终端中在同一行刷新（每 interval 秒最多一次），输出被重定向时每 PROGRESS_LOG_INTERVAL 秒记录一条 INFO 日志；
+    结束时记录一条汇总日志（含 done、failed、seconds 等字段）
+    """
+
+    def __init__(self, total, desc='', unit='位患者', logger=None, interval=0.5, stream=None):
+        self.total = total
+        self.desc = desc
+        self.unit = unit
+        self.logger = logger or get_logger('progress')
+        self.interval = interval
+        self.stream = stream or sys.stderr
+        self.tty = hasattr(self.stream, 'isatty') and self.stream.isatty()
+        self.done = 0
+        self.failed = 0
+        self.start = time.perf_counter()
+        self.last_draw = 0.0
+        self.last_log = self.start
+        self.width = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def status(self):
+        """当前进度文字"""
+        elapsed = time.perf_counter() - self.start
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        text = f"{self.desc} {self.done}/{self.total} {self.unit}  {rate:.1f}/s"
+        if rate > 0 and self.total:
+            text += f"  剩余 {format_seconds(max(self.total - self.done, 0) / rate)}"
+        if self.failed:
+            text += f"  失败 {self.failed}"
+        return text
+
+    def draw(self, end=''):
+        """在同一行重绘进度：比上次短时用空格覆盖上次的剩余部分（不使用 ANSI 控制序列，Windows 旧终端也能正确显示）"""
+        text = self.status()
+        width = display_width(text)
+        self.stream.write('\r' + text + ' ' * max(self.width - width, 0) + end)
+        self.stream.flush()
+        self.width = width
+
+    def update(self, n=1, failed=0):
+        """完成 n 项，其中（或另有）failed 项失败"""
+        self.done += n
+        self.failed += failed
+        now = time.perf_counter()
+        if self.tty:
+            if now - self.last_draw >= self.interval or self.done >= self.total:
+                self.last_draw = now
+                self.draw()
+        elif now - self.last_log >= PROGRESS_LOG_INTERVAL:
+            self.last_log = now
+            self.logger.info(self.status())
+
+    def close(self):
+        """结束进度显示并记录汇总"""
+        elapsed = time.perf_counter() - self.start
+        if self.tty:
+            self.draw('\n')
+        self.logger.info(f"{self.desc}完成: {self.done} {self.unit}，失败 {self.failed}，用时 {format_seconds(elapsed)}",
+                         extra={'fields': {'done': self.done, 'failed': self.failed, 'total': self.total,
+                                           'seconds': round(elapsed, 3)}})
@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+
+def manifest_path(output_dir, source):
+    """清单文件路径：每个数据源一个清单，保存在输出目录下"""
+    name = os.path.splitext(os.path.basename(source))[0]
+    return os.path.join(output_dir, f".manifest-{name}.json")
+
+
+def file_digest(path):
+    """文件内容的哈希（用于输出设置中引用的其他文件，如住院时间窗来源表）"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def normalize_options(options):
+    """输出设置统一为 JSON 可比较的形式（元组转为列表等）"""
+    return None if options is None else json.loads(json.dumps(options, ensure_ascii=False, sort_keys=True))
+
+
+def load_manifest(output_dir, source, options=None):
+    """
+    读取上一次运行保存的 {患者ID: 行内容哈希}，不存在时返回空字典
+    :param options: 影响输出内容的设置（如去重、住院时间窗来源表的哈希）；与上一次运行不同时清单失效，
+                    返回空字典使全部患者重新生成（行哈希只覆盖原始行，无法反映这些设置的变化）
+    """
+    path = manifest_path(output_dir, source)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"警告: 清单文件 {path} 读取失败，将全量重新生成: {e}")
+        return {}
+    previous = manifest.get('options')
+    options = normalize_options(options)
+    if previous != options:
+        changed = sorted(key for key in set(previous or {}) | set(options or {})
+                         if (previous or {}).get(key) != (options or {}).get(key))
+        print(f"输出设置已变化（{', '.join(changed)}），清单 {path} 失效，将全量重新生成")
+        return {}
+    return manifest.get('patients', {})
+
+
+def save_manifest(output_dir, source, hashes, options=None):
+    """保存本次运行的 {患者ID: 行内容哈希} 及输出设置"""
+    path = manifest_path(output_dir, source)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'source': os.path.basename(source), 'options': normalize_options(options), 'patients': hashes},
+                  f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def accumulate_patient_hashes(digests, df, id_col):
+    """
+    累积计算患者行哈希（可对同一张表的多个分块依次调用）：
+    1. 使用 pandas 向量化计算每一行的哈希
+    2. 同一患者的多行按原始顺序累积到同一个哈希中（列名也参与计算，表结构变化时视为全部变更）
+    3. 患者ID与各提取脚本一致，取 str(原始值)，并跳过空ID
+    :param digests: {患者ID: hashlib 对象}，原地更新
+    """
+    ids = df[id_col]
+    valid = ids.notna() & (ids.astype(str).str.strip() != "")
+    rows = df[valid]
+    if rows.empty:
+        return digests
+
+    row_hashes = pd.util.hash_pandas_object(rows, index=False).to_numpy()
+    header = '\x1f'.join(map(str, df.columns)).encode('utf-8')
+    positions = pd.Series(range(len(rows))).groupby(rows[id_col].astype(str).to_numpy()).indices
+
+    for patient_id, pos in positions.items():
+        if patient_id not in digests:
+            digests[patient_id] = hashlib.sha1(header)
+        digests[patient_id].update(row_hashes[pos].tobytes())
+    return digests
+
+
+def patient_hashes(df, id_col):
+    """按患者ID计算行内容哈希 :return: {患者ID: 十六进制哈希}"""
+    digests = accumulate_patient_hashes({}, df, id_col)
+    return {patient_id: digest.hexdigest() for patient_id, digest in digests.items()}
+
+
+def diff_manifest(old, new):
+    """
+    比较新旧清单
+    :return: (新增患者, 变更患者, 移除患者)，均为排序后的列表
+    """
+    added = sorted(pid for pid in new if pid not in old)
+    changed = sorted(pid for pid in new if pid in old and old[pid] != new[pid])
+    removed = sorted(pid for pid in old if pid not in new)
+    return added, changed, removed
+
+
+def plan_incremental(output_dir, source, df, id_col, incremental=True, options=None):
+    """
+    计算本次需要重新生成的患者
+    输出目录中已被删除的患者文件夹即使哈希未变也会重新生成
+    :param options: 影响输出内容的设置，与上一次运行不同时全部重新生成（保存清单时需传入相同的设置）
+    :return: (需要生成的患者ID集合, 新哈希, (新增, 变更, 移除))
+    """
+    return plan_from_hashes(output_dir, source, patient_hashes(df, id_col), incremental, options)
+
+
+def plan_from_hashes(output_dir, source, hashes, incremental=True, options=None):
+    """同 plan_incremental，使用已计算好的 {患者ID: 哈希}（分块处理时使用）"""
+    old = load_manifest(output_dir, source, options) if incremental else {}
+    added, changed, removed = diff_manifest(old, hashes)
+    missing = [pid for pid in hashes
+               if pid in old and old[pid] == hashes[pid] and not os.path.isdir(os.path.join(output_dir, pid))]
+    pending = set(added) | set(changed) | set(missing)
+    return pending, hashes, (added, sorted(set(changed) | set(missing)), removed)
+
+
+def report_changes(source, changes, skipped):
+    """打印增量运行的变更统计"""
+    added, changed, removed = changes
+    print(f"\n增量统计（{os.path.basename(source)}）：新增 {len(added)} 位，变更 {len(changed)} 位，"
+          f"移除 {len(removed)} 位，未变化跳过 {skipped} 位。")
+    if removed:
+        print(f"  已不在本次导出中的患者（输出保留未删除）: {', '.join(removed[:20])}"
+              + (" ..." if len(removed) > 20 else ""))
+
+
+def write_text_if_changed(path, content):
+    """
+    仅当文件内容发生变化时才写入，保持未变化文件的修改时间，
+    使 LLM 处理阶段可以按修改时间只处理真正变化的部分
+    :return: 是否实际写入
+    """
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                if f.read() == content:
+                    return False
+        except (OSError, UnicodeDecodeError):
+            pass
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    return True
+
+
+def remove_stale_files(patient_dir, written, suffix='.txt'):
+    """删除患者目录中本次未再生成的旧文件（例如拆分后条数减少的病程记录）"""
+    removed = 0
+    if not os.path.isdir(patient_dir):
+        return removed
+    for filename in os.listdir(patient_dir):
+        if filename.endswith(suffix) and filename not in written:
+            os.remove(os.path.join(patient_dir, filename))
+            removed += 1
+    return removed
@@ -0,0 +1,264 @@
+import difflib
+import re
+import zlib
+from collections import Counter
+
+import numpy as np
+
+from common.logging_utils import get_logger
+from common.tokens import estimate_tokens
+
+logger = get_logger('near_duplicate')
+
+# 默认相似度阈值：MinHash 估计的 Jaccard 相似度达到该值才视为近似重复
+SIMILARITY_THRESHOLD = 0.9
+
+# LSH 分段：签名长度 = BANDS * BAND_ROWS，任一分段完全相同即为候选（约在相似度 0.5 以上时大概率被召回）
+BANDS = 16
+BAND_ROWS = 4
+
+# 分片长度（字符）：中文病历按字符切分，数字统一替换为 # 后再切分，只差日期/数值的段落签名相同
+SHINGLE_SIZE = 5
+
+# 每次查询最多尝试本地修补的相似段落数
+MAX_PATCH_CANDIDATES = 5
+
+# 差异提示词中的可变部分（原结果 + 差异）不超过原文该比例时才发送差异提示词，否则按原文请求
+DELTA_MAX_RATIO = 0.5
+
+# 差异提示词：已处理段落的结果 + 本段落相对它的改动
+DELTA_TEMPLATE = (
+    "{prompt}\n\n"
+    "本段落与一份已处理的段落基本相同，已处理段落按上述要求得到的结果为：\n{response}\n\n"
+    "本段落相对该段落的改动（- 开头为删去的行，+ 开头为新增的行，未列出的行不变）：\n{diff}\n\n"
+    "请在上述结果的基础上按改动修改，按原要求的格式输出本段落的完整结果。"
+)
+
+NUMBER_PATTERN = re.compile(r'\d+(?:\.\d+)?')
+DIGITS_PATTERN = re.compile(r'\d+')
+# 比较改动时的词元：整个数字、连续空白或单个字符
+TOKEN_PATTERN = re.compile(r'\d+(?:\.\d+)?|\s+|.', re.S)
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+# MinHash 的哈希函数 (a * x + b) mod p（固定种子，保证不同进程/不同次运行的签名一致）
+MERSENNE_PRIME = (1 << 31) - 1
+_rng = np.random.RandomState(20240601)
+HASH_A = _rng.randint(1, MERSENNE_PRIME, size=BANDS * BAND_ROWS).astype(np.uint64)
+HASH_B = _rng.randint(0, MERSENNE_PRIME, size=BANDS * BAND_ROWS).astype(np.uint64)
+
+
+def shingle_text(text):
+    """计算签名用的文本：数字替换为 #，去掉全部空白"""
+    return WHITESPACE_PATTERN.sub('', NUMBER_PATTERN.sub('#', text))
+
+
+def minhash_signature(text):
+    """
+    文本的 MinHash 签名（BANDS * BAND_ROWS 个 uint64）
+    :return: 签名数组；没有可比较内容（空文本）时返回 None
+    """
+    text = shingle_text(text)
+    if not text:
+        return None
+    shingles = {text[i:i + SHINGLE_SIZE] for i in range(max(len(text) - SHINGLE_SIZE + 1, 1))}
+    hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles), dtype=np.uint64, count=len(shingles))
+    # x < 2^32、a < 2^31，乘积不会溢出 uint64
+    return ((hashes[:, None] * HASH_A + HASH_B) % MERSENNE_PRIME).min(axis=0)
+
+
+def number_parts(number):
+    """数字本身及其中的各段整数（"3.18日" 中的 3.18 既可能是小数，也可能是序号 3. 加 18 日）"""
+    return {number, *DIGITS_PATTERN.findall(number)}
+
+
+def number_shape(number):
+    """数字的写法：是否有前导零、小数位数（整数为 -1）、小数末尾是否为零（模型可能省略）"""
+    integer, _, decimals = number.partition('.')
+    return (len(integer) > 1 and integer.startswith('0'), len(decimals) if '.' in number else -1,
+            decimals.endswith('0'))
+
+
+def patch_response(old_text, new_text, response):
+    """
+    本地修补：两个段落去掉空白后只有数字（日期、剂量、检验值等）不同时，把原结果中对应的数字替换为新值
+    以下情况无法确定结果中的数字对应哪一处，返回 None（改为请求模型）：
+    1. 除数字外还有其他改动
+    2. 同一个原值被改成了不同的新值，或新旧数字的写法不同（前导零、小数位数）
+    3. 改动的数值也出现在未改动的部分（如序号 1. 与日期 01 日），或结果中有数值相同但写法不同的数字（如 05 与 5）
+    4. 改动的数值在结果中找不到（模型可能做了换算或改写）
+    5. 结果中有原文没有的数值（如由身高体重算出的 BMI），改动后这些推算值可能已经过时
+    6. 改动的数值在结果中出现的次数多于原文（如活动度 10 改为 15，结果中另有评分 10），无法区分哪一处对应原文
+    :return: 修补后的结果；无法修补时返回 None
+    """
+    old_tokens = TOKEN_PATTERN.findall(old_text)
+    new_tokens = TOKEN_PATTERN.findall(new_text)
+    replacements = {}  # 原数字 -> 新数字
+    unchanged = set()  # 未改动部分中的数字
+    matcher = difflib.SequenceMatcher(None, old_tokens, new_tokens, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            for token in old_tokens[i1:i2]:
+                if NUMBER_PATTERN.fullmatch(token):
+                    unchanged.update(number_parts(token))
+            continue
+        old_part = ''.join(old_tokens[i1:i2])
+        new_part = ''.join(new_tokens[j1:j2])
+        if shingle_text(old_part) != shingle_text(new_part):
+            return None
+        for old, new in zip(NUMBER_PATTERN.findall(old_part), NUMBER_PATTERN.findall(new_part)):
+            if old == new:
+                unchanged.update(number_parts(old))
+                continue
+            if number_shape(old) != number_shape(new):
+                return None  # 写法不同（如 10 改为 08、3.5 改为 3.20），结果中的写法无法确定
+            if replacements.setdefault(old, new) != new:
+                return None
+
+    if not replacements:
+        return response
+    changed = {float(old) for old in replacements}
+    if changed & {float(number) for number in unchanged}:
+        return None
+
+    old_numbers = Counter(NUMBER_PATTERN.findall(old_text))
+    old_values = {float(part) for number in old_numbers for part in number_parts(number)}
+    response_numbers = Counter(NUMBER_PATTERN.findall(response))
+    if any(float(number) not in old_values for number in response_numbers):
+        return None
+    if any(response_numbers[old] > old_numbers[old] for old in replacements):
+        return None
+
+    found = set()
+    conflicts = []
+
+    def substitute(match):
+        value = match.group(0)
+        if value in replacements:
+            found.add(value)
+            return replacements[value]
+        if float(value) in changed or number_parts(value) & replacements.keys():
+            conflicts.append(value)
+        return value
+
+    # 一次替换全部数字（避免 1->2、2->1 这类交换被替换两次）
+    patched = NUMBER_PATTERN.sub(substitute, response)
+    if conflicts or len(found) < len(replacements):
+        return None
+    return patched
+
+
+def delta_diff(old_text, new_text):
+    """两个段落的逐行差异（只保留改动的行）"""
+    lines = difflib.unified_diff(old_text.splitlines(), new_text.splitlines(), lineterm='', n=0)
+    return '\n'.join(line for line in lines if not line.startswith(('---', '+++', '@@')))
+
+
+class NearDuplicateIndex:
+    """
+    已标准化段落的近似重复索引（按提示词类型分别建立）：
+    出院医嘱、诊疗计划、模板化的专科检查等段落在不同患者之间常常只差日期或数值，
+    新段落与已处理段落足够相似时复用已有结果，减少 API 调用
+    """
+
+    def __init__(self, threshold=SIMILARITY_THRESHOLD, delta=True):
+        """
+        :param threshold: 相似度阈值
+        :param delta: 无法本地修补时是否发送差异提示词（False 表示按原文请求）
+        """
+        self.threshold = threshold
+        self.delta = delta
+        self.entries = {}  # 提示词类型 -> [(签名, 原文, 结果), ...]
+        self.buckets = {}  # 提示词类型 -> {(分段序号, 分段签名): [条目序号, ...]}
+        self.stats = {}  # 提示词类型 -> 统计
+        self.seen = set()  # (提示词类型, 原文) 的哈希：完全相同的段落只保存一次
+
+    def kind_stats(self, kind):
+        """某一提示词类型的统计：查询次数、本地复用次数、差异提示词次数、节省的估算 token 数"""
+        return self.stats.setdefault(kind, {'lookups': 0, 'patched': 0, 'delta': 0, 'saved_tokens': 0.0})
+
+    def add(self, kind, text, response, signature=None):
+        """加入一个已标准化的段落及其结果"""
+        signature = minhash_signature(text) if signature is None else signature
+        key = hash((kind, text))
+        if signature is None or not response or key in self.seen:
+            return
+        self.seen.add(key)
+        entries = self.entries.setdefault(kind, [])
+        buckets = self.buckets.setdefault(kind, {})
+        for band in range(BANDS):
+            key = (band, signature[band * BAND_ROWS:(band + 1) * BAND_ROWS].tobytes())
+            buckets.setdefault(key, []).append(len(entries))
+        entries.append((signature, text, response))
+
+    def find(self, kind, signature):
+        """
+        查找最相似的已处理段落
+        :return: 按相似度从高到低排列的 [(相似度, 原文, 结果), ...]，只包含达到阈值的段落
+        """
+        if signature is None or kind not in self.entries:
+            return []
+        entries = self.entries[kind]
+        buckets = self.buckets[kind]
+        candidates = set()
+        for band in range(BANDS):
+            candidates.update(buckets.get((band, signature[band * BAND_ROWS:(band + 1) * BAND_ROWS].tobytes()), ()))
+        matches = []
+        for position in candidates:
+            other, text, response = entries[position]
+            similarity = float(np.mean(other == signature))
+            if similarity >= self.threshold:
+                matches.append((similarity, text, response))
+        matches.sort(key=lambda match: -match[0])
+        return matches
+
+    def resolve(self, kind, prompt, text, signature=None):
+        """
+        查询一个待处理的段落：
+        1. 有近似重复且只差数字时，返回本地修补后的结果（不调用 API）
+        2. 否则差异足够小时返回差异提示词（代替 提示词 + 原文）
+        :return: (复用的结果, 差异提示词)，都没有时为 (None, None)
+        """
+        signature = minhash_signature(text) if signature is None else signature
+        stats = self.kind_stats(kind)
+        stats['lookups'] += 1
+        matches = self.find(kind, signature)
+        full_tokens = estimate_tokens(prompt + "\n\n" + text)
+        for similarity, old_text, response in matches[:MAX_PATCH_CANDIDATES]:
+            patched = patch_response(old_text, text, response)
+            if patched is not None:
+                stats['patched'] += 1
+                stats['saved_tokens'] += full_tokens
+                logger.debug(f"近似重复（相似度 {similarity:.2f}），复用已有结果",
+                             extra={'fields': {'kind': kind, 'similarity': round(similarity, 3)}})
+                return patched, None
+
+        if self.delta and matches:
+            similarity, old_text, response = matches[0]
+            diff = delta_diff(old_text, text)
+            if len(response) + len(diff) <= len(text) * DELTA_MAX_RATIO:
+                content = DELTA_TEMPLATE.format(prompt=prompt, response=response, diff=diff)
+                stats['delta'] += 1
+                stats['saved_tokens'] += full_tokens - estimate_tokens(content)
+                logger.debug(f"近似重复（相似度 {similarity:.2f}），发送差异提示词",
+                             extra={'fields': {'kind': kind, 'similarity': round(similarity, 3)}})
+                return None, content
+        return None, None
+
+
+def report_near_duplicates(index):
+    """打印各提示词类型的近似重复命中率、节省的 API 调用和 token"""
+    if index is None or not index.stats:
+        return
+    print("\n近似重复复用统计：")
+    totals = {'lookups': 0, 'patched': 0, 'delta': 0, 'saved_tokens': 0.0}
+    for kind, entry in sorted(index.stats.items()):
+        for key in totals:
+            totals[key] += entry[key]
+        hits = entry['patched'] + entry['delta']
+        ratio = hits / entry['lookups'] * 100 if entry['lookups'] else 0.0
+        print(f"  {kind}: 查询 {entry['lookups']} 次，命中 {hits} 次（{ratio:.1f}%），"
+              f"本地复用 {entry['patched']} 次，差异提示词 {entry['delta']} 次，约节省 {entry['saved_tokens']:.0f} tokens")
+    hits = totals['patched'] + totals['delta']
+    ratio = hits / totals['lookups'] * 100 if totals['lookups'] else 0.0
+    print(f"  合计命中率 {ratio:.1f}%，节省 API 调用 {totals['patched']} 次，约节省 {totals['saved_tokens']:.0f} tokens")
+    logger.debug("近似重复复用统计", extra={'fields': totals})
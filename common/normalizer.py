@@ -0,0 +1,287 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from common.boilerplate import section_type, strip_boilerplate, boilerplate_stats
+from common.input_index import list_patient_files
+from common.logging_utils import get_logger, Progress
+from common.near_duplicate import minhash_signature
+
+logger = get_logger('normalizer')
+
+# 默认接口地址（siliconflow 的 chat/completions）
+API_URL = "https://api.siliconflow.cn/v1/chat/completions"
+MAX_RETRIES = 5
+BASE_RETRY_DELAY = 1  # 第一次重试的秒数
+
+# siliconflow 请求参数
+SILICONFLOW_PARAMS = {
+    "model": "deepseek-ai/DeepSeek-R1",
+    "stream": False,
+    "max_tokens": 16384,    # 输出的最大长度
+    "temperature": 0.1,
+    "top_p": 0.95,
+    "top_k": 20,
+    "frequency_penalty": 0.0,
+    "response_format": {"type": "text"}
+}
+
+
+def load_prompts(prompt_dir, mapping, daily_pattern=None, daily_prompt=None):
+    """
+    一次读取全部提示词（常驻进程中多次调用 normalize 时无需重复读取）
+    :param mapping: {输入文件名: 提示词文件名}（静态匹配）
+    :param daily_pattern: 动态文件名（如拆分后的日常病程记录）的正则表达式，匹配的文件使用 daily_prompt
+    :return: 提示词集合，传给 normalize / prompt_for
+    """
+    texts = {}
+    for prompt_file in set(mapping.values()) | ({daily_prompt} if daily_prompt else set()):
+        prompt_path = os.path.join(prompt_dir, prompt_file)
+        if not os.path.exists(prompt_path):
+            logger.warning(f"提示词文件 {prompt_path} 不存在，使用该提示词的文件将跳过处理")
+            continue
+        with open(prompt_path, 'r', encoding='utf-8') as f:
+            texts[prompt_file] = f.read().strip()
+    return {'mapping': mapping, 'daily_pattern': daily_pattern, 'daily_prompt': daily_prompt, 'texts': texts}
+
+
+def prompt_file_for(prompts, filename):
+    """文件对应的提示词文件名（即提示词类型），没有映射时返回 None"""
+    # 优先检查是否是日常病程记录（动态文件名）
+    if prompts['daily_pattern'] is not None and prompts['daily_pattern'].match(filename):
+        return prompts['daily_prompt']
+    return prompts['mapping'].get(filename)
+
+
+def prompt_for(prompts, filename):
+    """文件对应的提示词文本，没有映射或提示词文件不存在时返回 None"""
+    prompt_file = prompt_file_for(prompts, filename)
+    return prompts['texts'].get(prompt_file) if prompt_file else None
+
+
+def siliconflow_backend(token, api_url=API_URL, params=None):
+    """
+    siliconflow 接口：每个线程复用一个 requests.Session（保持连接，省去每次请求的 TCP/TLS 握手）
+    :return: backend(content) -> 返回文本，请求失败时抛出异常
+    """
+    import requests
+
+    params = params or SILICONFLOW_PARAMS
+    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+    local = threading.local()
+
+    def backend(content):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        response = local.session.post(api_url, json=dict(params, messages=[{"role": "user", "content": content}]),
+                                      headers=headers)
+        logger.debug(f"HTTP {response.status_code}")
+        response.raise_for_status()  # 引发HTTP错误异常
+        return response.json()['choices'][0]['message']['content']
+
+    return backend
+
+
+def deepseek_backend(token, base_url="https://api.deepseek.com", model="deepseek-chat"):
+    """DeepSeek 接口（OpenAI SDK，客户端只创建一次） :return: backend(content) -> 返回文本"""
+    from openai import OpenAI
+
+    client = OpenAI(api_key=token, base_url=base_url)
+
+    def backend(content):
+        response = client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": content}],
+            stream=False,
+            timeout=30  # 添加超时设置
+        )
+        return response.choices[0].message.content
+
+    return backend
+
+
+def make_backend(method, token, api_url=API_URL):
+    """按请求方法（'siliconflow' 或 'deepseek'）创建接口"""
+    if method == 'siliconflow':
+        return siliconflow_backend(token, api_url)
+    if method == 'deepseek':
+        return deepseek_backend(token)
+    raise ValueError(f"未知的请求方法: {method}")
+
+
+def call_with_retries(backend, content, label='', fields=None, max_retries=MAX_RETRIES, base_delay=BASE_RETRY_DELAY):
+    """
+    调用接口，失败时按指数回退重试
+    :param label: 日志中的文件名；fields 为最终失败时写入日志的结构化字段（患者、文件）
+    :return: 返回文本（去掉前导空白）；重试后仍失败时返回空字符串
+    """
+    for attempt in range(max_retries):
+        try:
+            return (backend(content) or '').lstrip()
+        except Exception as e:
+            logger.warning(f"API request failed for {label} (Attempt {attempt + 1}/{max_retries}): {e}")
+            if attempt < max_retries - 1:
+                wait_time = base_delay * (2 ** attempt)
+                logger.info(f"Retrying in {wait_time:.2f} seconds...")
+                time.sleep(wait_time)
+    logger.error(f"Max retries reached for {label}. Skipping this file.", extra={'fields': fields or {}})
+    return ''
+
+
+def normalize(records, prompts, backend, concurrency=1, delay=0.0, near_duplicates=None):
+    """
+    对记录调用大模型做标准化（库接口：可在同一进程中反复调用，复用已读取的提示词和接口连接）
+    :param records: 可迭代的 dict，至少包含 filename（决定使用的提示词）和 text；其余字段（如 patient）原样带回
+    :param prompts: load_prompts 的返回值
+    :param backend: make_backend 等创建的接口，backend(content) -> 返回文本
+    :param concurrency: 同时进行的请求数；1 表示在当前线程中依次请求
+    :param delay: 每个请求完成后的等待秒数（限速）
+    :param near_duplicates: 近似重复索引（common.near_duplicate.NearDuplicateIndex）：与已处理记录只差数字时
+        直接复用修补后的结果，差异较小时发送差异提示词；返回的结果陆续加入索引
+    :return: 按完成顺序生成 (record, 返回文本)；失败时返回文本为空字符串，没有提示词的记录跳过
+    """
+    def run(record, content):
+        response = call_with_retries(backend, content, record['filename'],
+                                     {'patient': record.get('patient'), 'file': record['filename']})
+        if delay:
+            time.sleep(delay)
+        return record, response
+
+    signatures = {}  # id(record) -> 签名（请求返回后加入近似重复索引）
+
+    def tasks():
+        """:return: 生成 (record, 请求内容, 本地复用的结果)，两者只有一个不为 None"""
+        for record in records:
+            prompt = prompt_for(prompts, record['filename'])
+            if prompt is None:
+                logger.debug(f"未找到 {record['filename']} 的提示词，跳过处理")
+                continue
+            content = None
+            if near_duplicates is not None:
+                signature = minhash_signature(record['text'])
+                signatures[id(record)] = signature
+                response, content = near_duplicates.resolve(prompt_file_for(prompts, record['filename']), prompt,
+                                                             record['text'], signature)
+                if response is not None:
+                    yield record, None, response
+                    continue
+            # 组合提示词和文件内容
+            yield record, content or prompt + "\n\n" + record['text'], None
+
+    def finished(record, response):
+        if near_duplicates is not None:
+            signature = signatures.pop(id(record), None)
+            near_duplicates.add(prompt_file_for(prompts, record['filename']), record['text'], response, signature)
+        return record, response
+
+    if concurrency <= 1:
+        for record, content, response in tasks():
+            yield finished(*(run(record, content) if response is None else (record, response)))
+        return
+
+    # 多线程并发请求：进行中的请求数保持在 concurrency 的两倍以内，记录按需读取
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending = set()
+        for record, content, response in tasks():
+            if response is not None:
+                yield finished(record, response)
+                continue
+            pending.add(executor.submit(run, record, content))
+            if len(pending) >= concurrency * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield finished(*future.result())
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield finished(*future.result())
+
+
+def response_path(output_dir, patient_id, filename):
+    """返回结果文件路径：{output_dir}/{患者ID}/{文件名去扩展名}_response.txt"""
+    return os.path.join(output_dir, patient_id, f"{os.path.splitext(filename)[0]}_response.txt")
+
+
+def normalize_directory(input_dir, output_dir, prompts, backend, patient_ids, index=None, concurrency=1, delay=0.0,
+                        boilerplate=None, boilerplate_counts=None, skip_reply=None, on_patient_complete=None,
+                        near_duplicates=None, desc='标准化'):
+    """
+    处理输入目录中指定患者的全部文件，结果写入 {output_dir}/{患者ID}/{文件名}_response.txt：
+    1. 已有结果且比输入文件新的文件跳过（缓存），没有提示词的文件跳过
+    2. 读取文件并删除该类段落的模板行后调用 normalize
+    3. 一位患者的全部文件都得到返回结果后调用 on_patient_complete(患者ID)
+    :param index: 输入索引（common.input_index），设置时按索引读取源文件
+    :param boilerplate: {段落类型: 模板行集合}，boilerplate_counts 为删除统计
+    :param skip_reply: 表示"无内容"的返回文本（如 '空'），该返回不写出文件
+    :param near_duplicates: 近似重复索引（见 normalize），已缓存的结果也加入索引，重新运行时同样可以复用
+    :return: 统计 {'patients', 'requests', 'cached', 'failed'}
+    """
+    boilerplate = boilerplate or {}
+    stats = {'patients': len(patient_ids), 'requests': 0, 'cached': 0, 'failed': 0}
+    outstanding = {}  # 患者ID -> 尚未返回的文件数
+    failed = {}  # 患者ID -> 失败的文件数
+    progress = Progress(len(patient_ids), desc)
+
+    def patient_done(patient_id):
+        progress.update(failed=failed.get(patient_id, 0))
+        if on_patient_complete and not failed.get(patient_id):
+            on_patient_complete(patient_id)
+
+    def records():
+        for patient_id in patient_ids:
+            os.makedirs(os.path.join(output_dir, patient_id), exist_ok=True)
+            batch = []
+            for filename, file_path in list_patient_files(input_dir, patient_id, index):
+                if not os.path.isfile(file_path):
+                    continue  # 跳过非文件项
+                # 缓存结果（输入文件在上次处理后被更新时重新处理）
+                output_file_path = response_path(output_dir, patient_id, filename)
+                cached = os.path.exists(output_file_path) and os.path.getmtime(output_file_path) >= os.path.getmtime(file_path)
+                if cached:
+                    logger.debug(f"✓ {filename} 已处理")
+                    stats['cached'] += 1
+                    if near_duplicates is None:
+                        continue
+                if prompt_for(prompts, filename) is None:
+                    logger.debug(f"未找到 {filename} 的提示词，跳过处理")
+                    continue
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    text = f.read()
+                # 删除该类段落的模板行
+                section = section_type(filename)
+                text, removed = strip_boilerplate(text, boilerplate.get(section))
+                if cached:
+                    with open(output_file_path, 'r', encoding='utf-8') as f:
+                        near_duplicates.add(prompt_file_for(prompts, filename), text, f.read())
+                    continue
+                if boilerplate_counts is not None:
+                    boilerplate_stats(boilerplate_counts, section, removed)
+                batch.append({'patient': patient_id, 'filename': filename, 'text': text})
+
+            # 先登记该患者的文件数再交给 normalize，避免并发时第一个结果返回就被误判为患者完成
+            if not batch:
+                patient_done(patient_id)
+                continue
+            outstanding[patient_id] = len(batch)
+            yield from batch
+
+    for record, response in normalize(records(), prompts, backend, concurrency, delay, near_duplicates):
+        patient_id = record['patient']
+        stats['requests'] += 1
+        if not response:
+            # 重试后仍失败时不保存，留待下次运行
+            failed[patient_id] = failed.get(patient_id, 0) + 1
+            stats['failed'] += 1
+        elif response != skip_reply:
+            output_file_path = response_path(output_dir, patient_id, record['filename'])
+            with open(output_file_path, 'w', encoding='utf-8') as f:
+                f.write(response)
+            logger.debug(f"✓ {record['filename']} 处理完成 → {os.path.basename(output_file_path)}",
+                         extra={'fields': {'patient': patient_id, 'file': record['filename'], 'chars': len(record['text'])}})
+        outstanding[patient_id] -= 1
+        if outstanding[patient_id] == 0:
+            patient_done(patient_id)
+
+    progress.close()
+    return stats
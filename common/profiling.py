@@ -0,0 +1,167 @@
+import cProfile
+import csv
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from common.text_clean import clean_filename
+
+# 命令行开关：带上该参数运行任意脚本即对整个阶段做性能分析，无需修改代码
+PROFILE_FLAG = '--profile'
+
+# 分析结果目录（相对运行目录）
+PROFILE_DIR = 'profiles'
+
+# 汇总表中列出的函数个数
+TOP_FUNCTIONS = 20
+
+# 火焰图中忽略占总耗时比例低于该值的调用路径（避免调用图很大时路径数爆炸）
+MIN_STACK_RATIO = 1e-4
+
+
+def profiling_requested(argv=None):
+    """
+    命令行中是否带有 --profile，同时从参数列表中去掉该开关，脚本原有的按位置解析的参数（实例索引、进程数等）不受影响
+    需在脚本解析 sys.argv 之前调用
+    """
+    argv = sys.argv if argv is None else argv
+    if PROFILE_FLAG not in argv:
+        return False
+    argv[:] = [arg for arg in argv if arg != PROFILE_FLAG]
+    return True
+
+
+def start_profiling(stage, enabled=True):
+    """
+    开始对一个阶段计时并启动 cProfile 和 tracemalloc
+    :return: 分析状态（传给 finish_profiling）；enabled 为 False 时返回 None
+    """
+    if not enabled:
+        return None
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    profiler = cProfile.Profile()
+    state = {'stage': stage, 'profiler': profiler, 'tracing': tracing,
+             'wall': time.perf_counter(), 'cpu': time.process_time()}
+    profiler.enable()
+    return state
+
+
+def stack_label(func):
+    """火焰图中的函数名：文件名:行号(函数名)，内置函数只保留函数名"""
+    filename, line, name = func
+    if filename == '~':
+        return name.replace(';', ',')
+    return f"{os.path.basename(filename)}:{line}({name})".replace(';', ',')
+
+
+def folded_stacks(stats):
+    """
+    由 cProfile 的调用关系重建折叠调用栈（flamegraph.pl、speedscope 等可直接读取的格式）
+    cProfile 只记录 调用者 -> 被调用者 的耗时，不记录完整调用栈，因此同一函数被多处调用时按各调用边的耗时比例分摊
+    :return: {'a;b;c': 自身耗时（微秒）}
+    """
+    callees = {}
+    roots = []
+    total = 0.0
+    for func, (_, _, tt, ct, callers) in stats.stats.items():
+        total += tt
+        if not callers:
+            roots.append(func)
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((func, edge[3]))
+    min_seconds = total * MIN_STACK_RATIO
+
+    folded = {}
+
+    def walk(func, path, seconds):
+        _, _, tt, ct, _ = stats.stats[func]
+        ratio = seconds / ct if ct else 0.0
+        path = path + [func]
+        key = ';'.join(stack_label(f) for f in path)
+        if tt * ratio >= min_seconds:
+            folded[key] = folded.get(key, 0) + int(tt * ratio * 1e6)
+        for callee, edge_ct in callees.get(func, []):
+            # 递归调用的耗时已计入外层，不再展开
+            if callee not in path and edge_ct * ratio >= min_seconds:
+                walk(callee, path, edge_ct * ratio)
+
+    for root in roots:
+        walk(root, [], stats.stats[root][3])
+    return folded
+
+
+def top_functions(stats, limit=TOP_FUNCTIONS):
+    """按自身耗时排列的前若干个函数 :return: [(自身耗时, 累计耗时, 调用次数, 函数名), ...]"""
+    rows = [(tt, ct, nc, stack_label(func)) for func, (_, nc, tt, ct, _) in stats.stats.items()]
+    rows.sort(reverse=True)
+    return rows[:limit]
+
+
+def finish_profiling(state, output_dir=PROFILE_DIR):
+    """
+    结束分析并写出结果：
+    1. {阶段}.prof：cProfile 原始数据（可用 snakeviz、gprof2dot 或 pstats 查看）
+    2. {阶段}.folded：折叠调用栈，可直接生成火焰图（flamegraph.pl、speedscope）
+    3. {阶段}-top.txt：自身耗时最多的函数和内存分配最多的代码行
+    4. summary.csv：每次分析追加一行（阶段、耗时、CPU 时间、内存峰值、最耗时的函数），便于对比
+    注意：只分析当前进程，多进程处理的阶段请以 1 个进程运行（workers=1），否则工作进程中的耗时只体现为等待
+    :return: 汇总信息 dict；state 为 None 时返回 None
+    """
+    if state is None:
+        return None
+    profiler = state['profiler']
+    profiler.disable()
+    wall = time.perf_counter() - state['wall']
+    cpu = time.process_time() - state['cpu']
+    peak = tracemalloc.get_traced_memory()[1]
+    allocations = tracemalloc.take_snapshot().statistics('lineno')[:10]
+    if not state['tracing']:
+        tracemalloc.stop()
+
+    os.makedirs(output_dir, exist_ok=True)
+    name = os.path.join(output_dir, clean_filename(state['stage']))
+    stats = pstats.Stats(profiler)
+    stats.dump_stats(name + '.prof')
+    with open(name + '.folded', 'w', encoding='utf-8') as f:
+        for stack, micros in sorted(folded_stacks(stats).items()):
+            f.write(f"{stack} {micros}\n")
+
+    top = top_functions(stats)
+    lines = [f"阶段 {state['stage']}: 耗时 {wall:.2f} 秒，CPU {cpu:.2f} 秒，Python 内存峰值 {peak / 1e6:.1f} MB",
+             "", f"{'自身耗时(s)':>12} {'累计耗时(s)':>12} {'调用次数':>10}  函数"]
+    lines += [f"{tt:12.3f} {ct:12.3f} {nc:10d}  {label}" for tt, ct, nc, label in top]
+    lines += ["", "内存分配最多的代码行（分析结束时仍占用）:"]
+    lines += [f"{stat.size / 1e3:10.1f} KB  {stat.traceback[0].filename}:{stat.traceback[0].lineno}"
+              for stat in allocations]
+    report = '\n'.join(lines)
+    with open(name + '-top.txt', 'w', encoding='utf-8') as f:
+        f.write(report + '\n')
+    print('\n' + '\n'.join(lines[:3 + min(len(top), 10)]))
+    print(f"性能分析结果已保存到 {output_dir}（{os.path.basename(name)}.prof / .folded / -top.txt）")
+
+    summary = {'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'stage': state['stage'], 'wall_seconds': round(wall, 3),
+               'cpu_seconds': round(cpu, 3), 'peak_mb': round(peak / 1e6, 1), 'top_function': top[0][3] if top else ''}
+    summary_path = os.path.join(output_dir, 'summary.csv')
+    write_header = not os.path.exists(summary_path)
+    with open(summary_path, 'a', newline='', encoding='utf-8-sig') as f:
+        writer = csv.DictWriter(f, fieldnames=list(summary))
+        if write_header:
+            writer.writeheader()
+        writer.writerow(summary)
+    return summary
+
+
+@contextmanager
+def profile_stage(stage, enabled=True, output_dir=PROFILE_DIR):
+    """对 with 块中的代码做性能分析（enabled 为 False 时不做任何事），阶段出错时也写出已收集的结果"""
+    state = start_profiling(stage, enabled)
+    try:
+        yield state
+    finally:
+        finish_profiling(state, output_dir)
@@ -0,0 +1,82 @@
+import re
+import unicodedata
+
+# 文件名中的非法字符
+ILLEGAL_FILENAME_CHARS = re.compile(r'[\\/*?:"<>|]')
+
+# 姓名与标题判断
+CHINESE_NAME = re.compile(r'[\u4e00-\u9fa5]{2,3}')
+CHINESE_ONLY = re.compile(r'[\u4e00-\u9fa5]+')
+CHINESE_WITH_PUNCTUATION = re.compile(r'[\u4e00-\u9fa5，、.（）]+')
+
+# 连续空格/制表符（不包含换行符）
+SPACE_RUN = re.compile(r'[ \t]{2,}')
+# 包含换行符的连续空白：合并为单个换行符
+NEWLINE_RUN = re.compile(r'[^\S\n]*\n\s*')
+
+
+def clean_filename(name):
+    """清理文件名中的非法字符"""
+    return ILLEGAL_FILENAME_CHARS.sub("_", name)
+
+
+def clean_content(content):
+    """
+    清理文本内容：
+    1. 移除星号 (*)
+    2. 将多个连续的空格替换为单个空格
+    3. 将多个连续的换行符替换为单个换行符，并去除首尾空格
+    （原来的两次正则替换合并为一次 split/join：str.split() 与正则 \\s 使用同一套空白字符定义，
+    换行符已在第 2 步中被替换为空格，第 3 步的换行合并不会再生效。
+    中文文本上 str.translate 需逐字符查表，删除单个字符时 str.replace 更快）
+    """
+    if not isinstance(content, str):
+        return ""
+    return ' '.join(content.replace('*', '').split())
+
+
+def is_chinese_name(name):
+    """检查是否为2-3个中文字符的名字"""
+    return CHINESE_NAME.fullmatch(name) is not None
+
+
+def is_chinese_title(line):
+    """检查是否为病程标题行（如"主治医师查房记录"）"""
+    # 检查是否包含“记录”或“查房”或“术”
+    if "记录" not in line and "查房" not in line and "术" not in line:
+        return False
+
+    # 检查是否仅包含中文
+    if CHINESE_ONLY.fullmatch(line):
+        # 仅包含中文，检查长度是否为4-15
+        return 4 <= len(line) <= 15
+    # 检查仅包含中文及中文字符
+    elif CHINESE_WITH_PUNCTUATION.fullmatch(line):
+        # 包含中文字符，检查长度是否不超过20
+        return 4 <= len(line) <= 20
+    return False
+
+
+def tidy_whitespace(content):
+    """
+    清理多余空白：
+    1. 连续空格/制表符合并为单个空格
+    2. 包含换行符的连续空白合并为单个换行符（同时去除行首、行尾空格并压缩空行）
+    与依次执行 "\\n\\s+"、"\\s+\\n"、"\\n{3,}" 三次替换的结果一致
+    """
+    content = SPACE_RUN.sub(' ', content)
+    return NEWLINE_RUN.sub('\n', content)
+
+
+def strip_control_chars(content):
+    """
+    删除 Unicode 类别 C 的字符（控制、格式、代理、私用区、未分配）和 "^" 符号
+    类别 C 分布在 700 多个码位区间中，逐字符调用 unicodedata.category 或使用这样大的正则字符类都很慢；
+    类别 C 的字符都不是可打印字符，str.isprintable() 为 True 时（绝大多数文本）直接跳过，
+    否则只对文本中出现过的不可打印字符判断类别，再逐个删除
+    """
+    if not content.isprintable():
+        for char in set(content):
+            if not char.isprintable() and unicodedata.category(char)[0] == 'C':
+                content = content.replace(char, '')
+    return content.replace('^', '')
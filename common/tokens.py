@@ -0,0 +1,19 @@
+import re
+
+# 估算比例参考 DeepSeek 官方说明：1 个中文字符约 0.6 个 token，1 个英文字符约 0.3 个 token
+CJK_TOKENS_PER_CHAR = 0.6
+OTHER_TOKENS_PER_CHAR = 0.3
+
+CJK_PATTERN = re.compile(r'[\u4e00-\u9fff]')
+
+
+def estimate_tokens(text):
+    """估算一段文本的 token 数"""
+    cjk = len(CJK_PATTERN.findall(text))
+    return cjk * CJK_TOKENS_PER_CHAR + (len(text) - cjk) * OTHER_TOKENS_PER_CHAR
+
+
+def estimate_tokens_series(texts):
+    """向量化估算一列文本的 token 数（返回 Series）"""
+    cjk = texts.str.count(CJK_PATTERN.pattern)
+    return cjk * CJK_TOKENS_PER_CHAR + (texts.str.len() - cjk) * OTHER_TOKENS_PER_CHAR
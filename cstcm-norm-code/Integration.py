@@ -2,24 +2,64 @@ import os
 import shutil
 import sys
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.input_index import build_input_index, save_input_index
+from common.profiling import profile_stage, profiling_requested
+from common.logging_utils import get_logger, setup_logging, Progress
 
-def organize_patient_files(source_folders, target_root):
+logger = get_logger('Integration')
+
+# 整理方式：copy 复制文件；link 建立硬链接（不支持时改用符号链接，仍失败时复制），不占用额外磁盘空间
+ORGANIZE_MODES = ('copy', 'link')
+
+
+def link_file(src_file, dest_file):
+    """
+    在目标位置建立指向源文件的链接：优先硬链接，文件系统不支持（如跨磁盘）时改用符号链接，
+    仍失败时（如 Windows 无创建符号链接的权限）复制文件
+    :return: 实际使用的方式（'硬链接'、'符号链接' 或 '复制'）
+    """
+    if os.path.lexists(dest_file):
+        os.remove(dest_file)
+    try:
+        os.link(src_file, dest_file)
+        return '硬链接'
+    except OSError:
+        pass
+    try:
+        os.symlink(os.path.abspath(src_file), dest_file)
+        return '符号链接'
+    except OSError:
+        shutil.copy2(src_file, dest_file)
+        return '复制'
+
+
+def organize_patient_files(source_folders, target_root, mode='copy'):
     """
     按照患者编号整理文件，不修改原始文件名
     :param source_folders: 包含患者文件夹的源文件夹列表
     :param target_root: 整理后的目标根目录
+    :param mode: 'copy' 复制文件；'link' 建立链接（只写目录项，不复制内容）。
+                 不需要整理后的目录时可以用 build_input_index 建立索引（虚拟合并视图），
+                 批处理程序通过 config.INPUT_INDEX 直接读取源文件
     """
+    if mode not in ORGANIZE_MODES:
+        raise ValueError(f"未知的整理方式: {mode}，可选 {ORGANIZE_MODES}")
+
     # 确保目标目录存在
     os.makedirs(target_root, exist_ok=True)
 
     # 遍历所有源文件夹
     for source_folder in source_folders:
         if not os.path.exists(source_folder):
-            print(f"警告: 源文件夹 '{source_folder}' 不存在，跳过")
+            logger.warning(f"警告: 源文件夹 '{source_folder}' 不存在，跳过")
             continue
 
         # 遍历源文件夹中的患者文件夹
-        for patient_id in os.listdir(source_folder):
+        patient_ids = os.listdir(source_folder)
+        progress = Progress(len(patient_ids), os.path.basename(source_folder))
+        for patient_id in patient_ids:
+            progress.update()
             patient_source_path = os.path.join(source_folder, patient_id)
 
             # 确保是目录
@@ -36,14 +76,25 @@ def organize_patient_files(source_folders, target_root):
                     src_file = os.path.join(patient_source_path, filename)
                     dest_file = os.path.join(patient_target_path, filename)
 
-                    # 检查目标文件是否已存在（虽然您说不会存在同名文件，但添加检查更安全）
-                    if os.path.exists(dest_file):
-                        print(f"警告: 目标文件已存在，跳过复制: {dest_file}")
+                    if mode == 'link':
+                        # 已链接到同一个源文件时跳过（源文件被重新创建后重新链接）
+                        if os.path.exists(dest_file) and os.path.samefile(src_file, dest_file):
+                            continue
+                        method = link_file(src_file, dest_file)
+                        logger.debug(f"已{method}: {src_file} -> {dest_file}")
                         continue
 
+                    # 目标文件已存在且与源文件一致时跳过（增量提取后只复制发生变化的文件）
+                    if os.path.exists(dest_file):
+                        src_stat = os.stat(src_file)
+                        dest_stat = os.stat(dest_file)
+                        if src_stat.st_size == dest_stat.st_size and src_stat.st_mtime <= dest_stat.st_mtime:
+                            continue
+
                     # 复制文件
                     shutil.copy2(src_file, dest_file)
-                    print(f"已复制: {src_file} -> {dest_file}")
+                    logger.debug(f"已复制: {src_file} -> {dest_file}")
+        progress.close()
 
 
 if __name__ == "__main__":
@@ -57,7 +108,20 @@ if __name__ == "__main__":
         "E:\\PyCharm\\nlp\\八医院数据标准化代码\\检验项（259）"  # 检验项
     ]
     TARGET_ROOT = "E:\\PyCharm\\nlp\\八医院数据标准化代码\\step1-totxt_integration"  # 替换为您想要的目标根目录
+    # 整理方式：'copy' 复制；'link' 链接；'virtual' 只生成索引（config.INPUT_INDEX），批处理程序直接读取源文件
+    ORGANIZE_MODE = 'link'
 
-    # 执行整理
-    organize_patient_files(SOURCE_FOLDERS, TARGET_ROOT)
+    # 执行整理（带 --profile 运行时输出性能分析结果）
+    setup_logging('Integration')
+    with profile_stage('Integration', enabled=profiling_requested()):
+        if ORGANIZE_MODE == 'virtual':
+            from config import INPUT_INDEX
+            if not INPUT_INDEX:
+                print("错误: 虚拟整理需要在 config.py 中设置 INPUT_INDEX")
+                sys.exit(1)
+            index = build_input_index(SOURCE_FOLDERS)
+            save_input_index(index, INPUT_INDEX)
+            print(f"已生成索引: {INPUT_INDEX}（{len(index)} 位患者，{sum(map(len, index.values()))} 个文件）")
+        else:
+            organize_patient_files(SOURCE_FOLDERS, TARGET_ROOT, ORGANIZE_MODE)
     print("\n文件整理完成！")
\ No newline at end of file
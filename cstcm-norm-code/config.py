@@ -17,4 +17,17 @@ OUTPUT_DIR = 'step2-tojoint'    # 输出目录（处理结果将保存到这里
 PROMPT_DIR = 'prompts'   # 提示词文件目录
 
 # API请求方法：'siliconflow' 或 'deepseek'
-REQUEST_METHOD = 'siliconflow'  # Change to 'deepseek' to use DeepSeek API  siliconflow
\ No newline at end of file
+REQUEST_METHOD = 'siliconflow'  # Change to 'deepseek' to use DeepSeek API  siliconflow
+
+# 模板行删除清单：按段落类型学习到的高频模板行，文件不存在时自动学习并保存（供审计），None 表示不过滤
+# 默认关闭：高频行也可能是实际内容，开启前请检查学习到的清单，删去不应过滤的行
+BOILERPLATE_FILE = None
+
+# 输入索引：Integration.py 以 virtual 方式整理时生成的 患者 -> 源文件 索引，设置后批处理程序直接读取源文件夹，
+# 不再需要 INPUT_DIR 中整理后的文件；None 表示读取 INPUT_DIR
+INPUT_INDEX = None  # 例如 'step1-totxt_index.json'
+
+# 近似重复复用：段落与本实例已处理的同类段落（MinHash 估计）相似度达到该阈值时，只差日期/数值则本地替换后复用原结果，
+# 其余差异较小时只发送差异提示词；None 表示关闭
+# 默认关闭：本地替换不理解数字的含义（结果中由数值推算出的内容无法更新），开启前请抽查复用的结果
+NEAR_DUPLICATE_THRESHOLD = None
\ No newline at end of file
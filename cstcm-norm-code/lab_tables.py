@@ -0,0 +1,246 @@
+import os
+import shutil
+import sys
+from collections import defaultdict
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.manifest import (accumulate_patient_hashes, plan_from_hashes, save_manifest, report_changes,
+                             write_text_if_changed, file_digest, remove_stale_files)
+from common.dedupe import duplicate_mask, dedupe_stats, report_dedupe
+from common.logging_utils import get_logger, Progress
+
+logger = get_logger('lab_tables')
+
+# 分块处理时每块读取的行数
+DEFAULT_CHUNKSIZE = 200000
+
+# 住院时间窗来源表（如出院记录导出）中的列名
+ADMISSION_ID_COL = '住院号'
+ADMISSION_DATE_COL = '入院时间'
+DISCHARGE_DATE_COL = '出院时间'
+
+
+def clean_series(values):
+    """
+    向量化的 clean_content（按列一次处理）：
+    1. 与原逐行代码一致，先对每个值取 str()（缺失值置为空串，由调用方屏蔽）
+    2. 移除星号，合并连续空白为单个空格并去除首尾空白
+    （str.split() 与正则 \\s 使用同一套空白字符定义）
+    """
+    return values.astype(object).where(values.notna(), "").astype(str) \
+        .str.replace('*', '', regex=False) \
+        .str.split().str.join(' ')
+
+
+def format_records(df, columns):
+    """
+    列式拼接每一行的记录文本，结果与逐行拼接 "{col}: {value}" 再以换行连接一致：
+    每列整体生成 "\\n{col}: {value}"（缺失值为空串）后逐列相加，最后去掉开头的换行
+    :return: 与 df 同索引的记录文本 Series
+    """
+    record = pd.Series("", index=df.index, dtype=object)
+    for col in columns:
+        if col not in df.columns:
+            continue
+        values = df[col]
+        line = ("\n" + col + ": ") + clean_series(values)
+        record = record + line.where(values.notna(), "").astype(object)
+    return record.str[1:]
+
+
+def group_records(df, id_col, columns, dedupe=False, stats=None, seen=None):
+    """
+    按患者合并记录：groupby(...).agg('\\n\\n'.join)，同一患者内保持原始行顺序
+    :param dedupe: 合并前删除同一患者内规范化后完全相同的记录，统计累加到 stats
+    :param seen: 分块处理时跨块记录已出现的行哈希
+    :return: DataFrame，索引为 str(患者ID)，包含 text（合并后的文本）和 count（记录数）两列
+    """
+    records = format_records(df, columns)
+    ids = df[id_col]
+    if dedupe:
+        mask = duplicate_mask(ids, records, seen)
+        dedupe_stats(records, mask, stats)
+        records, ids = records[~mask], ids[~mask]
+    grouped = records.groupby(ids)
+    result = pd.DataFrame({'text': grouped.agg('\n\n'.join), 'count': grouped.size()})
+    result.index = result.index.map(str)
+    return result
+
+
+def write_patient_files(grouped, output_dir, filename, pending=None):
+    """
+    将按患者合并好的记录写出到 {output_dir}/{患者ID}/{filename}
+    :param pending: 需要写出的患者ID集合（增量处理），None 表示全部写出；
+                    其中没有记录的患者（如记录全部在住院时间窗以外）删除上一次生成的文件
+    :return: 写出的患者ID列表
+    """
+    written = []
+    progress = Progress(len(grouped), os.path.splitext(filename)[0])
+    for patient_id, text, count in zip(grouped.index, grouped['text'], grouped['count']):
+        progress.update()
+        if pending is not None and patient_id not in pending:
+            continue
+        patient_dir = os.path.join(output_dir, patient_id)
+        os.makedirs(patient_dir, exist_ok=True)
+        write_text_if_changed(os.path.join(patient_dir, filename), text)
+        written.append(patient_id)
+        logger.debug(f"已为患者 {patient_id} 创建{os.path.splitext(filename)[0]}文件，包含 {count} 条记录")
+    progress.close()
+    if pending is not None:
+        remove_emptied_patients(output_dir, filename, set(pending) - set(grouped.index))
+    return written
+
+
+def remove_emptied_patients(output_dir, filename, patient_ids):
+    """
+    删除本次没有任何记录的患者上一次生成的文件（过滤后记录为空时旧文件不会被覆盖，
+    清单又会把该患者记为已是最新，必须显式删除）
+    :return: 删除的文件数
+    """
+    removed = 0
+    for patient_id in sorted(patient_ids):
+        removed += remove_stale_files(os.path.join(output_dir, patient_id), (), suffix=filename)
+    if removed:
+        logger.info(f"删除 {removed} 位患者过滤后已无记录的{os.path.splitext(filename)[0]}文件")
+    return removed
+
+
+def manifest_options(dedupe, admission_file=None, time_columns=(), key_col=ADMISSION_ID_COL):
+    """
+    影响输出内容的设置（保存在增量清单中）：去重开关，以及住院时间窗来源表的内容哈希、时间列和关联列。
+    这些设置变化时行哈希不变，需要据此让清单失效，否则未变化的患者会保留按旧设置生成的输出
+    """
+    options = {'dedupe': bool(dedupe), 'admission_file': None}
+    if admission_file:
+        options.update(admission_file=file_digest(admission_file), time_columns=list(time_columns), key_col=key_col)
+    return options
+
+
+def to_datetime(values):
+    """解析时间列（各行格式可能不同，如只有日期或带时分），无法解析的置为 NaT"""
+    return pd.to_datetime(values, errors='coerce', format='mixed').astype('datetime64[ns]')
+
+
+def load_admission_windows(file_path, id_col=ADMISSION_ID_COL, admit_col=ADMISSION_DATE_COL,
+                           discharge_col=DISCHARGE_DATE_COL):
+    """
+    读取每次住院的时间窗：入院当天 0 点至出院次日 0 点（出院时间通常只有日期）
+    :return: DataFrame，包含 key（str(住院号)）、start、end 三列，按 start 排序
+    """
+    if file_path.lower().endswith('.csv'):
+        df = pd.read_csv(file_path, usecols=[id_col, admit_col, discharge_col], dtype={id_col: str})
+    else:
+        df = pd.read_excel(file_path, header=0, usecols=[id_col, admit_col, discharge_col])
+    windows = pd.DataFrame({
+        'key': df[id_col].astype(str),
+        'start': to_datetime(df[admit_col]).dt.normalize(),
+        'end': to_datetime(df[discharge_col]).dt.normalize() + pd.Timedelta(days=1),
+    })
+    windows = windows[df[id_col].notna().to_numpy() & windows['start'].notna().to_numpy()]
+    # 缺少出院时间的住院视为尚未出院
+    windows['end'] = windows['end'].fillna(pd.Timestamp.max)
+    print(f"已读取 {len(windows)} 条住院时间窗: {file_path}")
+    return windows.sort_values('start', kind='stable').reset_index(drop=True)
+
+
+def filter_admission_window(df, windows, time_columns, key_col=ADMISSION_ID_COL, stats=None):
+    """
+    只保留在本次住院时间窗内的检验/检查记录（向量化区间连接）：
+    1. 每行取 time_columns 中第一个可解析的时间（如 报告时间，缺失时用 接收时间）
+    2. 按住院号用 merge_asof 找到开始时间不晚于该时间的最近一次住院，判断是否早于出院
+    3. 无法判断的行（缺少时间、住院号或该住院号没有时间窗）保留
+    :param key_col: 与时间窗 住院号 关联的列（不一定是分组用的患者ID列，如检验项按 病案号 分组）
+    :param stats: 统计字典（原地累加 rows/out_of_window_rows）
+    :return: 过滤后的 DataFrame（保持原始行顺序）
+    :raises KeyError: 表中没有 key_col 列（要求过滤却无法过滤时不能静默输出未过滤的记录）
+    """
+    if key_col not in df.columns:
+        raise KeyError(key_col)
+
+    times = pd.Series(pd.NaT, index=df.index, dtype='datetime64[ns]')
+    for col in time_columns:
+        if col in df.columns:
+            times = times.fillna(to_datetime(df[col]))
+
+    rows = pd.DataFrame({'row': range(len(df)), 'key': df[key_col].astype(str).to_numpy(), 'time': times.to_numpy()})
+    known = rows['time'].notna() & rows['key'].isin(windows['key'])
+    matched = pd.merge_asof(rows[known].sort_values('time', kind='stable'), windows,
+                            left_on='time', right_on='start', by='key', direction='backward')
+    outside = matched.loc[~(matched['time'] < matched['end']), 'row'].to_numpy()
+
+    keep = pd.Series(True, index=range(len(df)))
+    keep[outside] = False
+    if stats is not None:
+        stats['rows'] = stats.get('rows', 0) + len(df)
+        stats['out_of_window_rows'] = stats.get('out_of_window_rows', 0) + len(outside)
+    return df[keep.to_numpy()]
+
+
+def report_window_filter(source, stats):
+    """打印住院时间窗过滤统计"""
+    print(f"\n住院时间窗过滤（{os.path.basename(source)}）：共 {stats.get('rows', 0)} 行，"
+          f"删除住院期间以外的记录 {stats.get('out_of_window_rows', 0)} 行。")
+
+
+def process_in_chunks(file_path, output_dir, id_col, columns, filename,
+                      chunksize=DEFAULT_CHUNKSIZE, incremental=True, dedupe=True,
+                      windows=None, time_columns=(), key_col=ADMISSION_ID_COL, options=None):
+    """
+    分块处理无法一次读入内存的大表（CSV 导出）：
+    1. 逐块列式拼接记录，按患者追加到暂存目录中的文件（在磁盘上完成分组，内存只保留当前块）
+    2. 同时逐块累积每位患者的行哈希
+    3. 全部读完后，只把新增或内容变化患者的暂存文件写为最终文件
+    dedupe=True 时跨块删除同一患者内完全重复的记录；给定 windows 时按 key_col 关联，只保留住院期间内的记录。
+    所有值按字符串读取，同一患者内保持原始行顺序。
+    :param options: 影响输出内容的设置（manifest_options），与上一次运行不同时全部重新生成
+    :return: 创建的文件数
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    staging_dir = os.path.join(output_dir, '.staging')
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    os.makedirs(staging_dir)
+
+    digests = {}
+    record_counts = defaultdict(int)
+    stats = {}
+    window_stats = {}
+    seen = set()
+    try:
+        for chunk_index, chunk in enumerate(pd.read_csv(file_path, chunksize=chunksize, dtype=str)):
+            accumulate_patient_hashes(digests, chunk, id_col)
+            if windows is not None:
+                chunk = filter_admission_window(chunk, windows, time_columns, key_col, stats=window_stats)
+            grouped = group_records(chunk, id_col, columns, dedupe, stats, seen)
+            for patient_id, text, count in zip(grouped.index, grouped['text'], grouped['count']):
+                with open(os.path.join(staging_dir, f"{patient_id}.txt"), 'a', encoding='utf-8') as f:
+                    # 记录之间的分隔符
+                    f.write(("\n\n" if record_counts[patient_id] else "") + text)
+                record_counts[patient_id] += count
+            logger.info(f"已处理第 {chunk_index + 1} 块（{len(chunk)} 行），累计 {len(record_counts)} 位患者")
+
+        hashes = {patient_id: digest.hexdigest() for patient_id, digest in digests.items()}
+        pending, hashes, changes = plan_from_hashes(output_dir, file_path, hashes, incremental, options)
+
+        files_created = 0
+        for patient_id in sorted(record_counts):
+            if patient_id not in pending:
+                continue
+            with open(os.path.join(staging_dir, f"{patient_id}.txt"), 'r', encoding='utf-8') as f:
+                text = f.read()
+            patient_dir = os.path.join(output_dir, patient_id)
+            os.makedirs(patient_dir, exist_ok=True)
+            write_text_if_changed(os.path.join(patient_dir, filename), text)
+            files_created += 1
+        remove_emptied_patients(output_dir, filename, set(pending) - set(record_counts))
+
+        save_manifest(output_dir, file_path, hashes, options)
+        report_changes(file_path, changes, len(record_counts) - files_created)
+        if windows is not None:
+            report_window_filter(file_path, window_stats)
+        if dedupe:
+            report_dedupe(file_path, stats, output_dir)
+        return files_created
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
@@ -1,35 +1,28 @@
 import pandas as pd
 import os
-import re
+import sys
 from collections import defaultdict
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.manifest import plan_incremental, save_manifest, report_changes, write_text_if_changed, remove_stale_files
+from common.text_clean import clean_content
+from common.dedupe import duplicate_mask, dedupe_stats, report_dedupe
+from common.course_splitter import chronological_order
+from common.profiling import profile_stage, profiling_requested
+from common.logging_utils import setup_logging, Progress
+from lab_tables import format_records
 
-def clean_filename(name):
-    """清理文件名中的非法字符"""
-    return re.sub(r'[\\/*?:"<>|]', "_", name)
+# 每条病程记录输出的字段（按顺序）
+RECORD_COLUMNS = ['病程记录时间', '标题', '病程记录内容']
 
 
-def clean_content(content):
-    """
-    清理文本内容：
-    1. 移除星号 (*)
-    2. 将多个连续的空格替换为单个空格
-    3. 将多个连续的换行符替换为单个换行符，并去除首尾空格
-    """
-    if pd.isna(content) or not isinstance(content, str):
-        return ""
-    # 移除星号
-    content = content.replace('*', '')
-    # 将多个连续的空格替换为单个空格
-    content = re.sub(r'\s+', ' ', content)
-    # 将多个连续的换行符替换为单个换行符，并去除首尾空格
-    content = re.sub(r'\n+', '\n', content).strip()
-    return content
-
-
-def summarize_medical_records(file_path="E:\\PyCharm\\nlp\\八医院数据标准化代码\\八医院koa数据（314）\\日常病程最终.xls", output_dir="日常病程记录（314）"):
+def summarize_medical_records(file_path="E:\\PyCharm\\nlp\\八医院数据标准化代码\\八医院koa数据（314）\\日常病程最终.xls", output_dir="日常病程记录（314）", incremental=True, dedupe=True, sort_by_time=False):
     """
     读取Excel文件，将每个患者的每条病程记录单独保存为编号的txt文件
+    incremental=True 时根据清单只重新生成新增或内容变化的患者。
+    dedupe=True 时删除同一住院号下完全重复的病程记录（每条记录是一次 LLM 调用）。
+    sort_by_time=True 时按 病程记录时间 先后编号（无法解析的时间排在最后），否则按表格中的行顺序编号。
+    这两个开关保存在清单中，变化时全部患者重新生成。
     """
     try:
         # 读取Excel文件，第一行作为列名
@@ -51,11 +44,30 @@ def summarize_medical_records(file_path="E:\\PyCharm\\nlp\\八医院数据标准
         total_files_created = 0
         patients_processed = set()
 
+        # 增量处理：只重新生成新增或内容变化的患者
+        options = {'dedupe': bool(dedupe), 'sort_by_time': bool(sort_by_time)}
+        pending, hashes, changes = plan_incremental(output_dir, file_path, df, '住院号', incremental, options)
+        written = defaultdict(set)
+        skipped = 0
+
+        # 去重：删除同一住院号下规范化后完全相同的病程记录
+        stats = {}
+        if dedupe:
+            records = format_records(df, RECORD_COLUMNS)
+            mask = duplicate_mask(df['住院号'], records)
+            dedupe_stats(records, mask, stats)
+            df = df[~mask]
+
         # 按住院号分组处理
         grouped = df.groupby('住院号')
 
+        progress = Progress(grouped.ngroups, '日常病程记录')
         for patient_id, group in grouped:
+            progress.update()
             patient_id = str(patient_id)
+            if patient_id not in pending:
+                skipped += 1
+                continue
             patients_processed.add(patient_id)
 
             # 创建患者目录
@@ -64,7 +76,8 @@ def summarize_medical_records(file_path="E:\\PyCharm\\nlp\\八医院数据标准
                 os.makedirs(patient_dir)
 
             # 按时间排序（如果需要按时间顺序编号）
-            # group = group.sort_values(by='病程记录时间')
+            if sort_by_time and '病程记录时间' in group.columns:
+                group = group.iloc[chronological_order(group['病程记录时间'].tolist())]
 
             # 为每条记录创建单独的文件
             for idx, (_, row) in enumerate(group.iterrows(), start=1):
@@ -74,7 +87,7 @@ def summarize_medical_records(file_path="E:\\PyCharm\\nlp\\八医院数据标准
 
                 # 创建文件内容
                 content_lines = []
-                for col in ['病程记录时间', '标题', '病程记录内容']:
+                for col in RECORD_COLUMNS:
                     if col in row and pd.notna(row[col]):
                         cleaned_content = clean_content(str(row[col]))
                         content_lines.append(f"{col}: {cleaned_content}")
@@ -82,12 +95,20 @@ def summarize_medical_records(file_path="E:\\PyCharm\\nlp\\八医院数据标准
                 if content_lines:
                     # 创建文件名
                     filename = f"(拆分)日常病程记录{record_num}.txt"
-                    file_path = os.path.join(patient_dir, filename)
 
-                    # 写入文件
-                    with open(file_path, 'w', encoding='utf-8') as f:
-                        f.write("\n".join(content_lines))
+                    # 写入文件（内容未变化时保留原文件）
+                    write_text_if_changed(os.path.join(patient_dir, filename), "\n".join(content_lines))
+                    written[patient_id].add(filename)
                     total_files_created += 1
+        progress.close()
+
+        # 清理变更患者中本次不再生成的旧文件（如病程条数减少），并保存清单
+        for patient_id in pending:
+            remove_stale_files(os.path.join(output_dir, patient_id), written[patient_id])
+        save_manifest(output_dir, file_path, hashes, options)
+        report_changes(file_path, changes, skipped)
+        if dedupe:
+            report_dedupe(file_path, stats, output_dir)
 
         print(f"处理完成。共处理 {len(patients_processed)} 位患者的记录，创建 {total_files_created} 个文件。")
 
@@ -102,4 +123,7 @@ def summarize_medical_records(file_path="E:\\PyCharm\\nlp\\八医院数据标准
 
 
 if __name__ == "__main__":
-    summarize_medical_records()
\ No newline at end of file
+    # 带 --profile 运行时输出性能分析结果（profiles 目录）
+    setup_logging('日常病程记录')
+    with profile_stage('日常病程记录', enabled=profiling_requested()):
+        summarize_medical_records()
\ No newline at end of file
@@ -1,37 +1,46 @@
 import pandas as pd
 import os
-import re
-import csv
+import sys
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.manifest import plan_incremental, save_manifest, report_changes
+from common.dedupe import report_dedupe
+from common.profiling import profile_stage, profiling_requested
+from common.logging_utils import setup_logging
+from lab_tables import (group_records, write_patient_files, process_in_chunks, load_admission_windows,
+                        filter_admission_window, report_window_filter, manifest_options)
 
-def clean_filename(name):
-    """清理文件名中的非法字符"""
-    return re.sub(r'[\\/*?:"<>|]', "_", name)
 
+# 每条记录输出的字段（按顺序）
+RECORD_COLUMNS = ['参考范围', '报告时间', '检验结果', '单位', '检验套名称', '标本名称', '异常提示', '检验项名称', '接收时间']
 
-def clean_content(content):
-    """
-    清理文本内容：
-    1. 移除星号 (*)
-    2. 将多个连续的空格替换为单个空格
-    3. 将多个连续的换行符替换为单个换行符，并去除首尾空格
-    """
-    if pd.isna(content) or not isinstance(content, str):
-        return ""
-    # 移除星号
-    content = content.replace('*', '')
-    # 将多个连续的空格替换为单个空格
-    content = re.sub(r'\s+', ' ', content)
-    # 将多个连续的换行符替换为单个换行符，并去除首尾空格
-    content = re.sub(r'\n+', '\n', content).strip()
-    return content
-
-
-def process_examination_records(file_path="E:\\PyCharm\\nlp\\八医院数据标准化代码\\八医院koa数据（314）\\检验项最终.xls", output_dir="检验项（259）"):
+# 住院时间窗按该列与 admission_file 的 住院号 关联（患者按 病案号 分组，时间窗对应的是每一次住院）
+WINDOW_KEY_COL = '住院号'
+
+# 判断是否在住院期间所用的时间列（按优先级）
+TIME_COLUMNS = ['报告时间', '接收时间']
+
+
+def process_examination_records(file_path="E:\\PyCharm\\nlp\\八医院数据标准化代码\\八医院koa数据（314）\\检验项最终.xls", output_dir="检验项（259）", incremental=True, chunksize=None, dedupe=True, admission_file=None):
     """
     读取Excel文件，将每个患者的所有检查记录合并保存到一个文件中
+    incremental=True 时根据清单只重新生成新增或内容变化的患者。
+    超出内存的大表可导出为 CSV 并指定 chunksize，按块处理。
+    dedupe=True 时删除同一患者内完全重复的记录，并统计节省的行数和 token。
+    给定 admission_file（含 住院号/入院时间/出院时间 的表）时，只保留本次住院期间内的记录。
+    去重开关和 admission_file 的内容保存在清单中，变化时全部患者重新生成。
     """
     try:
+        windows = load_admission_windows(admission_file) if admission_file else None
+        options = manifest_options(dedupe, admission_file, TIME_COLUMNS, WINDOW_KEY_COL)
+
+        if chunksize:
+            files_created = process_in_chunks(file_path, output_dir, '病案号', RECORD_COLUMNS, "检验项.txt",
+                                              chunksize, incremental, dedupe, windows, TIME_COLUMNS,
+                                              WINDOW_KEY_COL, options)
+            print(f"\n处理完成。共处理 {files_created} 位患者的记录，创建 {files_created} 个文件。")
+            return
+
         # 读取Excel文件，第一行作为列名
         df = pd.read_excel(file_path, header=0)
 
@@ -46,47 +55,27 @@ def process_examination_records(file_path="E:\\PyCharm\\nlp\\八医院数据标
 
         print(f"从文件 {file_path} 读取到数据，开始处理并将结果保存到 '{output_dir}' 目录中：\n")
 
-        # 用于跟踪患者处理
-        patients_processed = set()
-        files_created = 0
-
-        # 按住院号分组处理
-        grouped = df.groupby('病案号')
-
-        for patient_id, group in grouped:
-            patient_id = str(patient_id)
-            patients_processed.add(patient_id)
-
-            # 创建患者目录
-            patient_dir = os.path.join(output_dir, patient_id)
-            if not os.path.exists(patient_dir):
-                os.makedirs(patient_dir)
-
-            # 为每个患者创建一个检查项文件
-            output_file = os.path.join(patient_dir, "检验项.txt")
-            files_created += 1
-
-            # 写入所有检查记录
-            with open(output_file, 'w', encoding='utf-8') as f:
-                for idx, (_, row) in enumerate(group.iterrows(), start=1):
-                    # 创建记录内容
-                    record_lines = []
-                    for col in ['参考范围', '报告时间', '检验结果', '单位', '检验套名称', '标本名称', '异常提示', '检验项名称', '接收时间']:
-                        if col in row and pd.notna(row[col]):
-                            cleaned_content = clean_content(str(row[col]))
-                            record_lines.append(f"{col}: {cleaned_content}")
+        # 增量处理：只重新生成新增或内容变化的患者
+        pending, hashes, changes = plan_incremental(output_dir, file_path, df, '病案号', incremental, options)
 
-                    # 将当前记录的所有字段合并为一个字符串
-                    record_content = "\n".join(record_lines)
+        # 住院时间窗过滤：删除本次住院期间以外的记录
+        window_stats = {}
+        if windows is not None:
+            df = filter_admission_window(df, windows, TIME_COLUMNS, WINDOW_KEY_COL, stats=window_stats)
 
-                    # 写入当前记录，并在记录之间添加分隔符
-                    if idx > 1:
-                        f.write("\n\n")  # 记录之间的分隔符
-                    f.write(record_content)
+        # 列式拼接每条记录（可选删除完全重复的记录），再按患者合并（groupby + '\n\n'.join）
+        stats = {}
+        grouped = group_records(df, '病案号', RECORD_COLUMNS, dedupe, stats)
+        written = write_patient_files(grouped, output_dir, "检验项.txt", pending)
 
-            print(f"已为患者 {patient_id} 创建检验项文件，包含 {len(group)} 条记录")
+        save_manifest(output_dir, file_path, hashes, options)
+        report_changes(file_path, changes, len(grouped) - len(written))
+        if windows is not None:
+            report_window_filter(file_path, window_stats)
+        if dedupe:
+            report_dedupe(file_path, stats, output_dir)
 
-        print(f"\n处理完成。共处理 {len(patients_processed)} 位患者的记录，创建 {files_created} 个文件。")
+        print(f"\n处理完成。共处理 {len(written)} 位患者的记录，创建 {len(written)} 个文件。")
 
     except FileNotFoundError:
         print(f"错误：文件 {file_path} 未找到。")
@@ -99,4 +88,7 @@ def process_examination_records(file_path="E:\\PyCharm\\nlp\\八医院数据标
 
 
 if __name__ == "__main__":
-    process_examination_records()
\ No newline at end of file
+    # 带 --profile 运行时输出性能分析结果（profiles 目录）
+    setup_logging('检验项')
+    with profile_stage('检验项', enabled=profiling_requested()):
+        process_examination_records()
\ No newline at end of file
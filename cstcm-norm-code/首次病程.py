@@ -1,33 +1,21 @@
 import pandas as pd
 import os
-import re
+import sys
 from datetime import datetime
 
-def clean_filename(name):
-    """清理文件名中的非法字符"""
-    return re.sub(r'[\\/*?:"<>|]', "_", name)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.manifest import plan_incremental, save_manifest, report_changes, write_text_if_changed, remove_stale_files
+from common.text_clean import clean_filename, clean_content
+from common.profiling import profile_stage, profiling_requested
+from common.logging_utils import get_logger, setup_logging, Progress
 
-def clean_content(content):
-    """
-    清理文本内容：
-    1. 移除星号 (*)
-    2. 将多个连续的空格替换为单个空格
-    3. 将多个连续的换行符替换为单个换行符，并去除首尾空格
-    """
-    if pd.isna(content) or not isinstance(content, str):
-        return ""
-    # 移除星号
-    content = content.replace('*', '')
-    # 将多个连续的空格替换为单个空格
-    content = re.sub(r'\s+', ' ', content)
-    # 将多个连续的换行符替换为单个换行符，并去除首尾空格
-    content = re.sub(r'\n+', '\n', content).strip()
-    return content
-
-def summarize_medical_records(file_path="E:\\PyCharm\\nlp\\八医院数据标准化代码\\八医院koa数据（314）\\首次病程(已纳排).xls", output_dir="首次病程（314）"):
+logger = get_logger('首次病程')
+
+def summarize_medical_records(file_path="E:\\PyCharm\\nlp\\八医院数据标准化代码\\八医院koa数据（314）\\首次病程(已纳排).xls", output_dir="首次病程（314）", incremental=True):
     """
     读取Excel文件，将第三行作为标题，从第二行开始读取数据，
     并将每个患者的病历信息的每个部分单独保存到对应的文件中。
+    incremental=True 时根据清单只重新生成新增或内容变化的患者。
     """
     try:
         # 读取Excel文件，第一行作为列名
@@ -52,11 +40,21 @@ def summarize_medical_records(file_path="E:\\PyCharm\\nlp\\八医院数据标准
         patients_count = 0
         files_created = 0
 
+        # 增量处理：只重新生成新增或内容变化的患者
+        pending, hashes, changes = plan_incremental(output_dir, file_path, df, '住院号', incremental)
+        written = {}
+        skipped = set()
+
+        progress = Progress(len(df), '首次病程', unit='行')
         for index, row in df.iterrows():
+            progress.update()
             # 获取住院号作为患者ID
             patient_id = row['住院号']
             if pd.isna(patient_id) or str(patient_id).strip() == "":
-                print(f"跳过第 {index + 1} 行: 未找到有效的住院号")
+                logger.debug(f"跳过第 {index + 1} 行: 未找到有效的住院号")
+                continue
+            if str(patient_id) not in pending:
+                skipped.add(str(patient_id))
                 continue
 
             # 创建患者目录
@@ -64,6 +62,10 @@ def summarize_medical_records(file_path="E:\\PyCharm\\nlp\\八医院数据标准
             if not os.path.exists(patient_dir):
                 os.makedirs(patient_dir)
 
+            # 同一住院号出现多行时只保存第一行
+            if str(patient_id) not in written:
+                written[str(patient_id)] = set()
+
                 # 2. 首次病程
                 # 2.1 合并诊断部分
                 diagnosis_content = []
@@ -72,22 +74,28 @@ def summarize_medical_records(file_path="E:\\PyCharm\\nlp\\八医院数据标准
                         diagnosis_content.append(clean_content(str(row[col])))  # Apply clean_content
 
                 if diagnosis_content:
-                    file_path = os.path.join(patient_dir, "(合并)首程中西医诊断.txt")
-                    with open(file_path, "w", encoding="utf-8") as f:
-                        f.write("\n\n".join(diagnosis_content))
+                    write_text_if_changed(os.path.join(patient_dir, "(合并)首程中西医诊断.txt"), "\n\n".join(diagnosis_content))
+                    written[str(patient_id)].add("(合并)首程中西医诊断.txt")
                     files_created += 1
 
                 # 2.2 其他首次病程部分单独保存
                 for col in discharge_cols:
                     if col in row and pd.notna(row[col]) and str(row[col]).strip() != "":
                         safe_col = clean_filename(col)
-                        file_path = os.path.join(patient_dir, f"首次病程记录-{safe_col}.txt")
-                        with open(file_path, "w", encoding="utf-8") as f:
-                            f.write(clean_content(str(row[col])))  # Apply clean_content
+                        filename = f"首次病程记录-{safe_col}.txt"
+                        write_text_if_changed(os.path.join(patient_dir, filename), clean_content(str(row[col])))  # Apply clean_content
+                        written[str(patient_id)].add(filename)
                         files_created += 1
 
             patients_count += 1
-            print(f"已处理患者 {patient_id} 的记录")
+            logger.debug(f"已处理患者 {patient_id} 的记录")
+        progress.close()
+
+        # 清理变更患者中本次不再生成的旧文件，并保存清单
+        for patient_id in pending:
+            remove_stale_files(os.path.join(output_dir, patient_id), written.get(patient_id, set()))
+        save_manifest(output_dir, file_path, hashes)
+        report_changes(file_path, changes, len(skipped))
 
         print(f"\n处理完成。共处理 {patients_count} 位患者的记录，创建 {files_created} 个文件。")
 
@@ -102,4 +110,7 @@ def summarize_medical_records(file_path="E:\\PyCharm\\nlp\\八医院数据标准
 
 
 if __name__ == "__main__":
-    summarize_medical_records()
\ No newline at end of file
+    # 带 --profile 运行时输出性能分析结果（profiles 目录）
+    setup_logging('首次病程')
+    with profile_stage('首次病程', enabled=profiling_requested()):
+        summarize_medical_records()
\ No newline at end of file
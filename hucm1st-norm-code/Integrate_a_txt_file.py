@@ -1,172 +1,254 @@
+import hashlib
 import os
 import re
-import unicodedata
+import sys
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.manifest import load_manifest, save_manifest, diff_manifest, report_changes, write_text_if_changed
+from common.text_clean import strip_control_chars
+from common.profiling import profile_stage, profiling_requested
+from common.logging_utils import get_logger, setup_logging, worker_logging, Progress
 
-def merge_patient_records(input_dir="step2-tojoint", output_dir="step3-merged"):
+logger = get_logger('Integrate_a_txt_file')
+
+
+def clean_response(content):
     """
-    将每个患者文件夹中的零散TXT文件按病历顺序合并为一个整合病历文件
-    新增功能：自动清理控制字符和"^"符号
+    清理内容：去除所有换行符和多余空格，再清理控制字符和"^"符号
+    （split/join 与去除首尾空白后执行 \\s+ 替换的结果一致）
     """
-    # 确保输出目录存在
-    os.makedirs(output_dir, exist_ok=True)
+    return strip_control_chars(' '.join(content.split()))
+
+
+# 定义大类及其包含的文件（按病历逻辑顺序）
+CATEGORIES = [
+    {
+        "name": "入院记录",
+        "files": [
+            "入院记录-主诉_response.txt",
+            "入院记录-现病史_response.txt",
+            "入院记录-中医望诊_response.txt",
+            "入院记录-专科检查_response.txt",
+            "入院记录-辅助检查_response.txt"
+        ]
+    },
+    {
+        "name": "首次病程记录",
+        "files": [
+            "首次病程记录-病例特点_response.txt",
+            "首次病程记录-首次病程-专科检查_response.txt",
+            "首次病程记录-首次病程-中医诊断_response.txt",
+            "首次病程记录-首次病程-西医诊断_response.txt",
+            "首次病程记录-诊断依据_response.txt",
+            "首次病程记录-诊疗计划_response.txt"
+        ]
+    },
+    {
+        "name": "日常病程记录",
+        "is_daily": True  # 特殊标记为日常病程记录
+    },
+    {
+        "name": "出院记录",
+        "files": [
+            "出院记录-入院情况_response.txt",
+            "(合并)出院记录诊断_response.txt",
+            "出院记录-诊疗经过_response.txt",
+            "出院记录-出院情况_response.txt",
+            "出院记录-出院医嘱_response.txt"
+        ]
+    },
+    {
+        "name": "其他记录",
+        "files": ["其他记录_response.txt"]
+    }
+]
+
+# 日常病程记录的返回文件名
+DAILY_RESPONSE_PATTERN = re.compile(r'(\(拆分\))?日常病程记录(\d+)?_response\.txt')
+
+
+def merged_filename(patient_id):
+    """患者整合病历的文件名"""
+    return f"整合病历_{patient_id}.txt"
+
+
+def response_signature(patient_path):
+    """
+    患者输入状态的签名：所有 *_response.txt 的文件名、大小和修改时间的哈希
+    （只读取目录信息，不读取文件内容；LLM 阶段重新生成任一段落都会改变签名）
+    """
+    digest = hashlib.sha1()
+    for entry in sorted(os.scandir(patient_path), key=lambda entry: entry.name):
+        if entry.is_file() and entry.name.endswith('_response.txt'):
+            stat = entry.stat()
+            digest.update(f"{entry.name}\x1f{stat.st_size}\x1f{stat.st_mtime_ns}\n".encode('utf-8'))
+    return digest.hexdigest()
 
-    # 定义大类及其包含的文件（按病历逻辑顺序）
-    categories = [
-        {
-            "name": "入院记录",
-            "files": [
-                "入院记录-主诉_response.txt",
-                "入院记录-现病史_response.txt",
-                "入院记录-中医望诊_response.txt",
-                "入院记录-专科检查_response.txt",
-                "入院记录-辅助检查_response.txt"
-            ]
-        },
-        {
-            "name": "首次病程记录",
-            "files": [
-                "首次病程记录-病例特点_response.txt",
-                "首次病程记录-首次病程-专科检查_response.txt",
-                "首次病程记录-首次病程-中医诊断_response.txt",
-                "首次病程记录-首次病程-西医诊断_response.txt",
-                "首次病程记录-诊断依据_response.txt",
-                "首次病程记录-诊疗计划_response.txt"
-            ]
-        },
-        {
-            "name": "日常病程记录",
-            "is_daily": True  # 特殊标记为日常病程记录
-        },
-        {
-            "name": "出院记录",
-            "files": [
-                "出院记录-入院情况_response.txt",
-                "(合并)出院记录诊断_response.txt",
-                "出院记录-诊疗经过_response.txt",
-                "出院记录-出院情况_response.txt",
-                "出院记录-出院医嘱_response.txt"
-            ]
-        },
-        {
-            "name": "其他记录",
-            "files": ["其他记录_response.txt"]
-        }
-    ]
-
-    # 遍历所有患者文件夹
-    for patient_id in os.listdir(input_dir):
-        patient_path = os.path.join(input_dir, patient_id)
-        if not os.path.isdir(patient_path):
-            continue
-
-        print(f"处理患者: {patient_id}")
-
-        # 收集该患者的所有文件
-        patient_files = os.listdir(patient_path)
-
-        # 创建合并后的文件
-        merged_content = []
-        merged_filename = f"整合病历_{patient_id}.txt"
-        output_path = os.path.join(output_dir, merged_filename)
-
-        # 特殊处理：收集日常病程记录并按序号排序
-        daily_records = []
-        for filename in patient_files:
-            if re.match(r'(\(拆分\))?日常病程记录(\d+)?_response\.txt', filename):
-                # 提取序号用于排序
-                match = re.search(r'(\d+)', filename)
-                index = int(match.group(1)) if match else 0
-                daily_records.append((index, filename))
-
-        # 按序号排序日常病程记录
-        daily_records.sort(key=lambda x: x[0])
-        sorted_daily = [filename for _, filename in daily_records]
-
-        # 按类别顺序处理文件
-        for category in categories:
-            category_content = []
-
-            if "is_daily" in category and category["is_daily"]:
-                # 处理日常病程记录
-                for filename in sorted_daily:
-                    file_path = os.path.join(patient_path, filename)
+
+def merge_patient(patient_id, input_dir="step2-tojoint", output_dir="step3-merged"):
+    """
+    将单个患者文件夹中的零散TXT文件按病历顺序合并为一个整合病历文件
+    （清理控制字符和"^"符号；内容未变化时不重写文件）
+    :return: 是否实际写入
+    """
+    patient_path = os.path.join(input_dir, patient_id)
+    logger.debug(f"处理患者: {patient_id}")
+
+    # 收集该患者的所有文件
+    patient_files = os.listdir(patient_path)
+
+    # 创建合并后的文件
+    merged_content = []
+    output_path = os.path.join(output_dir, merged_filename(patient_id))
+
+    # 特殊处理：收集日常病程记录并按序号排序
+    daily_records = []
+    for filename in patient_files:
+        if DAILY_RESPONSE_PATTERN.match(filename):
+            # 提取序号用于排序
+            match = re.search(r'(\d+)', filename)
+            index = int(match.group(1)) if match else 0
+            daily_records.append((index, filename))
+
+    # 按序号排序日常病程记录
+    daily_records.sort(key=lambda x: x[0])
+    sorted_daily = [filename for _, filename in daily_records]
+
+    # 按类别顺序处理文件
+    for category in CATEGORIES:
+        category_content = []
+
+        if "is_daily" in category and category["is_daily"]:
+            # 处理日常病程记录
+            for filename in sorted_daily:
+                file_path = os.path.join(patient_path, filename)
+                try:
+                    with open(file_path, 'r', encoding='utf-8') as f:
+                        # 清理内容：去除换行符、多余空格、控制字符和^符号
+                        content = clean_response(f.read())
+
+                        # 获取标题（去掉_response.txt）
+                        title = filename.replace('_response.txt', '')
+
+                        # 添加标题和内容
+                        category_content.append(f"{title}：{content}\n")
+
+                except Exception as e:
+                    logger.warning(f"  读取文件失败: {filename} - {str(e)}")
+
+            if category_content:
+                # 添加日常病程记录标题
+                merged_content.append("\n【日常病程记录】\n")
+                merged_content.extend(category_content)
+
+        else:
+            # 处理其他类别
+            for pattern in category["files"]:
+                if pattern in patient_files:
+                    file_path = os.path.join(patient_path, pattern)
                     try:
                         with open(file_path, 'r', encoding='utf-8') as f:
-                            content = f.read().strip()
-                            # 清理内容：去除所有换行符和多余空格
-                            content = re.sub(r'\s+', ' ', content)
-
-                            # 清理控制字符和特殊符号
-                            content = ''.join([c for c in content if unicodedata.category(c)[0] != 'C'])
-                            content = content.replace('^', '')  # 删除^符号
+                            # 清理内容：去除换行符、多余空格、控制字符和^符号
+                            content = clean_response(f.read())
 
                             # 获取标题（去掉_response.txt）
-                            title = filename.replace('_response.txt', '')
+                            title = pattern.replace('_response.txt', '')
+
+                            # 简化标题
+                            if "(合并)" in title:
+                                title = title.replace("(合并)", "")
+                            else:
+                                # 其他标题去掉前缀中的"首次病程记录-"
+                                title = re.sub(r'^首次病程记录-', '', title)
 
                             # 添加标题和内容
                             category_content.append(f"{title}：{content}\n")
 
                     except Exception as e:
-                        print(f"  读取文件失败: {filename} - {str(e)}")
-
-                if category_content:
-                    # 添加日常病程记录标题
-                    merged_content.append("\n【日常病程记录】\n")
-                    merged_content.extend(category_content)
-
-            else:
-                # 处理其他类别
-                for pattern in category["files"]:
-                    if pattern in patient_files:
-                        file_path = os.path.join(patient_path, pattern)
-                        try:
-                            with open(file_path, 'r', encoding='utf-8') as f:
-                                content = f.read().strip()
-                                # 清理内容：去除所有换行符和多余空格
-                                content = re.sub(r'\s+', ' ', content)
-
-                                # 清理控制字符和特殊符号
-                                content = ''.join([c for c in content if unicodedata.category(c)[0] != 'C'])
-                                content = content.replace('^', '')  # 删除^符号
-
-                                # 获取标题（去掉_response.txt）
-                                title = pattern.replace('_response.txt', '')
-
-                                # 简化标题
-                                if "(合并)" in title:
-                                    title = title.replace("(合并)", "")
-                                else:
-                                    # 其他标题去掉前缀中的"首次病程记录-"
-                                    title = re.sub(r'^首次病程记录-', '', title)
-
-                                # 添加标题和内容
-                                category_content.append(f"{title}：{content}\n")
-
-                        except Exception as e:
-                            print(f"  读取文件失败: {pattern} - {str(e)}")
-
-                if category_content:
-                    # 添加类别标题
-                    merged_content.append(f"\n【{category['name']}】\n")
-                    merged_content.extend(category_content)
-
-        # 写入合并后的文件
-        with open(output_path, 'w', encoding='utf-8') as out_file:
-            # 将列表内容合并为字符串
-            final_content = ''.join(merged_content)
-
-            # 清理多余的空行
-            final_content = re.sub(r'\n{3,}', '\n\n', final_content)
-
-            # 写入文件
-            out_file.write(final_content.strip())
-
-        print(f"  已创建整合病历: {merged_filename}")
+                        logger.warning(f"  读取文件失败: {pattern} - {str(e)}")
+
+            if category_content:
+                # 添加类别标题
+                merged_content.append(f"\n【{category['name']}】\n")
+                merged_content.extend(category_content)
+
+    # 将列表内容合并为字符串
+    final_content = ''.join(merged_content)
 
+    # 清理多余的空行
+    final_content = re.sub(r'\n{3,}', '\n\n', final_content)
+
+    # 写入合并后的文件
+    written = write_text_if_changed(output_path, final_content.strip())
+    logger.debug(f"  已创建整合病历: {merged_filename(patient_id)}")
+    return written
+
+
+def record_merged(signatures, input_dir="step2-tojoint", output_dir="step3-merged"):
+    """
+    把逐个整合的患者（LLM 批处理中 on_patient_complete 调用 merge_patient）的签名合并进整合清单，
+    之后运行 merge_patient_records 时不再重复整合这些患者
+    多个实例同时写入时可能丢失其他实例的更新，只会使这些患者下次被重新整合（内容相同，不重写文件）
+    :param signatures: {患者ID: 整合前计算的 response_signature}
+    """
+    manifest = load_manifest(output_dir, input_dir)
+    manifest.update(signatures)
+    save_manifest(output_dir, input_dir, manifest)
+
+
+def merge_patient_records(input_dir="step2-tojoint", output_dir="step3-merged", workers=None, incremental=True):
+    """
+    将每个患者文件夹中的零散TXT文件按病历顺序合并为一个整合病历文件
+    新增功能：自动清理控制字符和"^"符号
+    增量合并：输出目录中的清单记录每位患者 *_response.txt 的签名（文件名、大小、修改时间），
+    只重新合并签名变化或整合病历缺失的患者
+    :param workers: 并行进程数，默认使用全部 CPU 核心；1 表示在当前进程中串行处理
+    :param incremental: False 表示忽略清单，全部重新合并
+    :return: 本次重新合并的患者ID列表
+    """
+    # 确保输出目录存在
+    os.makedirs(output_dir, exist_ok=True)
+
+    # 遍历所有患者文件夹，计算输入签名
+    signatures = {}
+    for patient_id in sorted(os.listdir(input_dir)):
+        patient_path = os.path.join(input_dir, patient_id)
+        if os.path.isdir(patient_path):
+            signatures[patient_id] = response_signature(patient_path)
+
+    old = load_manifest(output_dir, input_dir) if incremental else {}
+    added, changed, removed = diff_manifest(old, signatures)
+    missing = [patient_id for patient_id in signatures if patient_id in old and old[patient_id] == signatures[patient_id]
+               and not os.path.exists(os.path.join(output_dir, merged_filename(patient_id)))]
+    pending = sorted(set(added) | set(changed) | set(missing))
+
+    # 多进程并行合并（每位患者相互独立）
+    worker = partial(merge_patient, input_dir=input_dir, output_dir=output_dir)
+    workers = workers or os.cpu_count() or 1
+    with Progress(len(pending), '合并') as progress:
+        if workers == 1 or len(pending) <= 1:
+            for patient_id in pending:
+                worker(patient_id)
+                progress.update()
+        else:
+            print(f"使用 {workers} 个进程并行合并 {len(pending)} 位患者")
+            with ProcessPoolExecutor(max_workers=workers, **worker_logging()) as executor:
+                for _ in executor.map(worker, pending, chunksize=8):
+                    progress.update()
+
+    save_manifest(output_dir, input_dir, signatures)
+    report_changes(input_dir, (added, sorted(set(changed) | set(missing)), removed), len(signatures) - len(pending))
     print("\n所有患者病历整合完成!")
+    return pending
 
 
 if __name__ == "__main__":
-    merge_patient_records()
+    # 带 --profile 运行时输出性能分析结果（只分析主进程，需要分析合并本身时以 1 个进程运行）
+    profile = profiling_requested()
+    setup_logging('Integrate_a_txt_file')
+    # 并行进程数（命令行第一个参数），默认使用全部 CPU 核心
+    with profile_stage('Integrate_a_txt_file', enabled=profile):
+        merge_patient_records(workers=int(sys.argv[1]) if len(sys.argv) > 1 else None)
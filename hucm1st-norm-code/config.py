@@ -19,4 +19,16 @@ OUTPUT_DIR = 'step2-tojoint'    # 输出目录（处理结果将保存到这里
 PROMPT_DIR = 'prompts'   # 提示词文件目录
 
 # API请求方法：'siliconflow' 或 'deepseek'
-REQUEST_METHOD = 'siliconflow'  # Change to 'deepseek' to use DeepSeek API  siliconflow
\ No newline at end of file
+REQUEST_METHOD = 'siliconflow'  # Change to 'deepseek' to use DeepSeek API  siliconflow
+
+# 模板行删除清单：按段落类型学习到的高频模板行，文件不存在时自动学习并保存（供审计），None 表示不过滤
+# 默认关闭：高频行也可能是实际内容，开启前请检查学习到的清单，删去不应过滤的行
+BOILERPLATE_FILE = None
+
+# 整合病历目录：患者所有段落处理完成后立即整合到该目录，设为 None 则在全部处理完成后单独运行 Integrate_a_txt_file.py
+MERGE_DIR = 'step3-merged'
+
+# 近似重复复用：段落与本实例已处理的同类段落（MinHash 估计）相似度达到该阈值时，只差日期/数值则本地替换后复用原结果，
+# 其余差异较小时只发送差异提示词；None 表示关闭
+# 默认关闭：本地替换不理解数字的含义（结果中由数值推算出的内容无法更新），开启前请抽查复用的结果
+NEAR_DUPLICATE_THRESHOLD = None
\ No newline at end of file
@@ -1,30 +1,22 @@
 import pandas as pd
+import numpy as np
 import os
 import re
+import sys
+from collections import defaultdict
 from datetime import datetime
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.manifest import plan_incremental, save_manifest, report_changes, write_text_if_changed, remove_stale_files
+from common.text_clean import clean_filename, clean_content
+from common.course_splitter import split_records, timestamp_starts
+from common.profiling import profile_stage, profiling_requested
+from common.logging_utils import get_logger, setup_logging, Progress
 
-def clean_filename(name):
-    """清理文件名中的非法字符"""
-    return re.sub(r'[\\/*?:"<>|]', "_", name)
+logger = get_logger('totxt-own')
 
-
-def clean_content(content):
-    """
-    清理文本内容：
-    1. 移除星号 (*)
-    2. 将多个连续的空格替换为单个空格
-    3. 将多个连续的换行符替换为单个换行符，并去除首尾空格
-    """
-    if pd.isna(content) or not isinstance(content, str):
-        return ""
-    # 移除星号
-    content = content.replace('*', '')
-    # 将多个连续的空格替换为单个空格
-    content = re.sub(r'\s+', ' ', content)
-    # 将多个连续的换行符替换为单个换行符，并去除首尾空格
-    content = re.sub(r'\n+', '\n', content).strip()
-    return content
+# 日常病程时间戳格式（YYYY-MM-DD HH:MM）
+DAILY_COURSE_FORMAT = 'dash'
 
 
 def split_daily_course(content):
@@ -35,39 +27,92 @@ def split_daily_course(content):
     if pd.isna(content) or not content.strip():
         return []
 
-    # 匹配日期时间模式（YYYY-MM-DD HH:MM）
-    pattern = r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}'
-    matches = list(re.finditer(pattern, content))
-
-    if not matches:
+    records = split_records(content, DAILY_COURSE_FORMAT)
+    if not records:
         # Before returning, clean the single content block
         return [clean_content(content)]
+    return [clean_content(record) for record in records if record]
 
-    # 根据匹配位置拆分内容
-    records = []
-    start_index = 0
 
-    for i, match in enumerate(matches):
-        record_start = match.start()
-        if i > 0:
-            # 获取上一个匹配结束到当前匹配开始之间的内容
-            record_content = content[start_index:record_start].strip()
-            if record_content:
-                records.append(clean_content(record_content)) # Apply clean_content here
-        start_index = record_start
-
-    # 添加最后一个记录
-    last_record = content[start_index:].strip()
-    if last_record:
-        records.append(clean_content(last_record)) # Apply clean_content here
-
-    return records
+def split_daily_course_frame(patient_ids, daily_course):
+    """
+    批量拆分所有患者的日常病程记录（与 split_daily_course 结果一致）：
+    1. 全部病程以换行连接后只做一次时间戳扫描（与 split_records 共用 timestamp_starts），按偏移量把记录归属到各行
+    2. 有时间戳的病程丢弃首个时间戳之前的内容；无时间戳的病程整体作为一条记录
+    3. 统一清理内容并向量化生成文件名（单条记录为"日常病程记录.txt"，多条为"(拆分)日常病程记录{i}.txt"）
+    :param patient_ids: 患者ID序列（与 daily_course 等长）
+    :param daily_course: 日常病程内容序列
+    :return: DataFrame，包含 patient_id、filename、record 三列，按原始行顺序排列
+    """
+    # 全程使用 Python 字符串列表和 object 数组：与 pandas 字符串数组（安装 pyarrow 时为 Arrow 存储）之间的
+    # 来回转换比拆分本身还慢
+    patient_ids = np.asarray(patient_ids, dtype=object)
+    values = np.asarray(daily_course, dtype=object)
+    present = pd.notna(values)
+    contents = [str(value) for value in values[present]]
+    nonblank = np.fromiter((bool(content.strip()) for content in contents), dtype=bool, count=len(contents))
+    patient_ids = patient_ids[present][nonblank]
+    contents = [content for content, keep in zip(contents, nonblank) if keep]
+    if not contents:
+        return pd.DataFrame(columns=['patient_id', 'filename', 'record'])
+
+    # 一次扫描全部病程（时间戳不含换行，不会跨越两行），再用各行的结束偏移量确定时间戳所属的行
+    # （Series.str.split 按正则切分时仍是逐行调用 re.split，比逐行 finditer 还慢）
+    lengths = np.fromiter(map(len, contents), dtype=np.int64, count=len(contents))
+    row_ends = np.cumsum(lengths + 1) - 1
+    row_starts = row_ends - lengths
+    joined = '\n'.join(contents)
+    starts = np.array(timestamp_starts(joined, DAILY_COURSE_FORMAT), dtype=np.int64)
+    rows = np.searchsorted(row_ends, starts)
+
+    # 每条记录到同一行的下一个时间戳或行尾为止
+    ends = np.empty_like(starts)
+    ends[:-1] = starts[1:]
+    last = np.ones(len(rows), dtype=bool)
+    last[:-1] = rows[1:] != rows[:-1]
+    ends[last] = row_ends[rows[last]]
+
+    # 无时间戳的病程整体作为一条记录，再按 (行, 起始位置) 恢复原始顺序
+    missing = np.setdiff1d(np.arange(len(contents)), rows)
+    rows = np.concatenate([rows, missing])
+    starts = np.concatenate([starts, row_starts[missing]])
+    ends = np.concatenate([ends, row_ends[missing]])
+    order = np.lexsort((starts, rows))
+    rows, starts, ends = rows[order], starts[order], ends[order]
+    # 与 clean_content 等价（内联以省去逐条记录的函数调用）
+    records = [' '.join(joined[start:end].replace('*', '').split()) for start, end in zip(starts.tolist(), ends.tolist())]
+
+    # 每行的记录数和记录序号（rows 已按行排序）
+    counts = np.bincount(rows, minlength=len(contents))
+    ordinals = np.arange(len(rows)) - (np.cumsum(counts) - counts)[rows] + 1
+    filenames = ["日常病程记录.txt" if count == 1 else f"(拆分)日常病程记录{ordinal}.txt"
+                 for count, ordinal in zip(counts[rows].tolist(), ordinals.tolist())]
+
+    return pd.DataFrame({
+        'patient_id': patient_ids[rows],
+        'filename': filenames,
+        'record': records,
+    }, dtype=object)
+
+
+def write_daily_course_records(records, output_dir):
+    """
+    一次性批量写出拆分后的日常病程记录文件（患者目录需已存在，内容未变化的文件不重写）
+    :return: 创建的文件数
+    """
+    if records.empty:
+        return 0
+    paths = output_dir + os.sep + records['patient_id'].astype(str) + os.sep + records['filename']
+    for path, record in zip(paths, records['record']):
+        write_text_if_changed(path, record)
+    return len(records)
 
 
-def summarize_medical_records(file_path="KOA精确导出v1.xlsx", output_dir="step1-totxt"):
+def summarize_medical_records(file_path="KOA精确导出v1.xlsx", output_dir="step1-totxt", incremental=True):
     """
     读取Excel文件，将第三行作为标题，从第四行开始读取数据，
     并将每个患者的病历信息的每个部分单独保存到对应的文件中。
+    incremental=True 时根据清单只重新生成新增或内容变化的患者。
     """
     try:
         # 读取Excel文件，第三行作为列名
@@ -100,11 +145,21 @@ def summarize_medical_records(file_path="KOA精确导出v1.xlsx", output_dir="st
         patients_count = 0
         files_created = 0
 
+        # 增量处理：只重新生成新增或内容变化的患者
+        pending, hashes, changes = plan_incremental(output_dir, file_path, df, 'regno_admno', incremental)
+        written = defaultdict(set)
+        skipped = set()
+
+        progress = Progress(len(df), 'totxt-own', unit='行')
         for index, row in df.iterrows():
+            progress.update()
             # 获取登记号就诊号（regno_admno）作为患者ID
             patient_id = row['regno_admno']
             if pd.isna(patient_id) or str(patient_id).strip() == "":
-                print(f"跳过第 {index + 1} 行: 未找到有效的登记号就诊号")
+                logger.debug(f"跳过第 {index + 1} 行: 未找到有效的登记号就诊号")
+                continue
+            if str(patient_id) not in pending:
+                skipped.add(str(patient_id))
                 continue
 
             # 创建患者目录
@@ -116,9 +171,9 @@ def summarize_medical_records(file_path="KOA精确导出v1.xlsx", output_dir="st
             for col in admission_cols:
                 if col in row and pd.notna(row[col]) and str(row[col]).strip() != "":
                     safe_col = clean_filename(col)
-                    file_path = os.path.join(patient_dir, f"入院记录-{safe_col}.txt")
-                    with open(file_path, "w", encoding="utf-8") as f:
-                        f.write(clean_content(str(row[col]))) # Apply clean_content
+                    filename = f"入院记录-{safe_col}.txt"
+                    write_text_if_changed(os.path.join(patient_dir, filename), clean_content(str(row[col]))) # Apply clean_content
+                    written[str(patient_id)].add(filename)
                     files_created += 1
 
             # 2. 出院记录
@@ -129,50 +184,29 @@ def summarize_medical_records(file_path="KOA精确导出v1.xlsx", output_dir="st
                     diagnosis_content.append(clean_content(str(row[col]))) # Apply clean_content
 
             if diagnosis_content:
-                file_path = os.path.join(patient_dir, "(合并)出院记录诊断.txt")
-                with open(file_path, "w", encoding="utf-8") as f:
-                    f.write("\n\n".join(diagnosis_content))
+                write_text_if_changed(os.path.join(patient_dir, "(合并)出院记录诊断.txt"), "\n\n".join(diagnosis_content))
+                written[str(patient_id)].add("(合并)出院记录诊断.txt")
                 files_created += 1
 
             # 2.2 其他出院记录部分单独保存
             for col in discharge_cols:
                 if col in row and pd.notna(row[col]) and str(row[col]).strip() != "":
                     safe_col = clean_filename(col)
-                    file_path = os.path.join(patient_dir, f"出院记录-{safe_col}.txt")
-                    with open(file_path, "w", encoding="utf-8") as f:
-                        f.write(clean_content(str(row[col]))) # Apply clean_content
+                    filename = f"出院记录-{safe_col}.txt"
+                    write_text_if_changed(os.path.join(patient_dir, filename), clean_content(str(row[col]))) # Apply clean_content
+                    written[str(patient_id)].add(filename)
                     files_created += 1
 
             # 3. 首次病程记录 - 每个部分单独保存
             for col in first_course_cols:
                 if col in row and pd.notna(row[col]) and str(row[col]).strip() != "":
                     safe_col = clean_filename(col)
-                    file_path = os.path.join(patient_dir, f"首次病程记录-{safe_col}.txt")
-                    with open(file_path, "w", encoding="utf-8") as f:
-                        f.write(clean_content(str(row[col]))) # Apply clean_content
+                    filename = f"首次病程记录-{safe_col}.txt"
+                    write_text_if_changed(os.path.join(patient_dir, filename), clean_content(str(row[col]))) # Apply clean_content
+                    written[str(patient_id)].add(filename)
                     files_created += 1
 
-            # 4. 日常病程记录 - 拆分处理
-            if daily_course_col in row and pd.notna(row[daily_course_col]) and str(row[daily_course_col]).strip() != "":
-                content = str(row[daily_course_col])
-                records = split_daily_course(content) # clean_content is applied within split_daily_course
-
-                if len(records) == 0:
-                    # 空记录
-                    pass
-                elif len(records) == 1:
-                    # 单个记录
-                    file_path = os.path.join(patient_dir, "日常病程记录.txt")
-                    with open(file_path, "w", encoding="utf-8") as f:
-                        f.write(records[0])
-                    files_created += 1
-                else:
-                    # 多个记录
-                    for i, record in enumerate(records, 1):
-                        file_path = os.path.join(patient_dir, f"(拆分)日常病程记录{i}.txt")
-                        with open(file_path, "w", encoding="utf-8") as f:
-                            f.write(record)
-                        files_created += 1
+            # 4. 日常病程记录 - 在循环结束后对所有患者统一向量化拆分并批量写出
 
             # 5. 其他记录（病案首页+影像+实验室检查）
             other_records_content = []
@@ -181,13 +215,29 @@ def summarize_medical_records(file_path="KOA精确导出v1.xlsx", output_dir="st
                      # Apply clean_content to the value before adding to the list
                      other_records_content.append(f"{col}: {clean_content(str(row[col]))}")
             if other_records_content:
-                with open(os.path.join(patient_dir, "其他记录.txt"), "w", encoding="utf-8") as f:
-                    # Joining with a single newline to avoid excessive blank lines if content is already clean
-                    f.write("\n".join(other_records_content))
+                # Joining with a single newline to avoid excessive blank lines if content is already clean
+                write_text_if_changed(os.path.join(patient_dir, "其他记录.txt"), "\n".join(other_records_content))
+                written[str(patient_id)].add("其他记录.txt")
                 files_created += 1 # Increment files_created for "其他记录.txt"
 
             patients_count += 1
-            print(f"已处理患者 {patient_id} 的记录")
+            logger.debug(f"已处理患者 {patient_id} 的记录")
+        progress.close()
+
+        # 4. 日常病程记录 - 所有患者一次性拆分，批量写出
+        if daily_course_col in df.columns:
+            ids = df['regno_admno']
+            valid = ids.notna() & ids.astype(str).isin(pending)
+            daily_records = split_daily_course_frame(ids[valid].astype(str), df.loc[valid, daily_course_col])
+            files_created += write_daily_course_records(daily_records, output_dir)
+            for patient_id, filename in zip(daily_records['patient_id'], daily_records['filename']):
+                written[patient_id].add(filename)
+
+        # 清理变更患者中本次不再生成的旧文件（如病程条数减少），并保存清单
+        for patient_id in pending:
+            remove_stale_files(os.path.join(output_dir, patient_id), written[patient_id])
+        save_manifest(output_dir, file_path, hashes)
+        report_changes(file_path, changes, len(skipped))
 
         print(f"\n处理完成。共处理 {patients_count} 位患者的记录，创建 {files_created} 个文件。")
 
@@ -202,4 +252,7 @@ def summarize_medical_records(file_path="KOA精确导出v1.xlsx", output_dir="st
 
 
 if __name__ == "__main__":
-    summarize_medical_records()
\ No newline at end of file
+    # 带 --profile 运行时输出性能分析结果（profiles 目录）
+    setup_logging('totxt-own')
+    with profile_stage('totxt-own', enabled=profiling_requested()):
+        summarize_medical_records()
\ No newline at end of file
@@ -1,38 +1,49 @@
+import csv
+import json
 import os
 import re
-
-def is_chinese_name(name):
-    """检查是否为2-3个中文字符的名字"""
-    pattern = r'^[\u4e00-\u9fa5]{2,3}$'
-    return bool(re.fullmatch(pattern, name))
-
-
-def is_chinese_title(line):
-    # 检查是否包含“记录”或“查房”或“术”
-    if "记录" not in line and "查房" not in line and "术" not in line:
-        return False
-
-    # 检查是否仅包含中文
-    if re.fullmatch(r'[\u4e00-\u9fa5]+', line):
-        # 仅包含中文，检查长度是否为4-15
-        return 4 <= len(line) <= 15
-    # 检查仅包含中文及中文字符
-    elif re.fullmatch(r'[\u4e00-\u9fa5，、.（）]+', line):
-        # 包含中文字符，检查长度是否不超过20
-        return 4 <= len(line) <= 20
-    return False
-
-def de_privacy_admission(content):
-    """针对入院记录的去隐私化处理"""
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.text_clean import is_chinese_name, is_chinese_title, tidy_whitespace
+from common.profiling import profile_stage, profiling_requested
+from common.logging_utils import get_logger, setup_logging, worker_logging, Progress
+from name_matcher import get_name_matcher
+from text_io import read_text
+
+logger = get_logger('De-privacization')
+
+# 每位患者需要去隐私化的文件（按顺序处理，前面文件中识别出的姓名用于后面的文件）
+PATIENT_FILES = ['入院.txt', '出院.txt', '首程.txt', '病程.txt']
+# 签名行中的姓名（如“姓名：张三”“签名：李四”）
+SIGNATURE_PATTERN = re.compile(r'.*[姓签]\s*名：\s*([^ \n]+)[ \n]')
+# 入院记录开头的隐私信息块（姓名到发病节气）
+ADMISSION_HEADER = re.compile(r'姓\s*名：.*?发病节气：.*?\n\n', flags=re.DOTALL)
+# 出院记录开头的隐私信息块（患者姓名到住院天数）
+DISCHARGE_HEADER = re.compile(r'患者姓名[:：].*?住院天数[:：].*?\n', flags=re.DOTALL)
+# 行内连续多个空白（不紧跟在换行符之后）
+WIDE_GAP = re.compile(r'(?<!\n)\s{4,}')
+# 日期行（如 2021-10-10、2021年10月10日 08:11）
+DATE_LINE = re.compile(r'^\d{4}[-./年]\d{1,2}[-./月]\d{1,2}(?:日)?(?: \d{1,2}:\d{2})?$')
+
+
+def de_privacy_admission(content, names):
+    """
+    针对入院记录的去隐私化处理
+    :param names: 该患者已识别出的姓名集合，本文件中新识别出的姓名会加入其中
+    """
     # 1. 删除开头的隐私信息块（姓名到发病节气）
-    content = re.sub(r'姓\s*名：.*?发病节气：.*?\n\n', '', content, flags=re.DOTALL)
+    content = ADMISSION_HEADER.sub('', content)
 
     # 2. 删除开头的隐私信息块（患者姓名到住院天数） - 出院记录
     # 修改为匹配英文冒号和单个换行符
-    content = re.sub(r'患者姓名[:：].*?住院天数[:：].*?\n', '', content, flags=re.DOTALL)
+    content = DISCHARGE_HEADER.sub('', content)
 
     # 预处理：将连续多个空格替换为换行符，便于行处理
-    normalized_text = re.sub(r'(?<!\n)\s{4,}', '\n', content)
+    normalized_text = WIDE_GAP.sub('\n', content)
     lines = normalized_text.splitlines()
 
     # 存储结果行
@@ -44,7 +55,7 @@ def de_privacy_admission(content):
         if not stripped_line:
             continue
         # 检查是否日期行（匹配yyyy-mm-dd格式）
-        elif re.match(r'^\d{4}[-./年]\d{1,2}[-./月]\d{1,2}(?:日)?(?: \d{1,2}:\d{2})?$', stripped_line):
+        elif DATE_LINE.match(stripped_line):
             if len(lines) > i + 1 and is_chinese_title(lines[i+1].strip()):
                 lines[i + 1] = '    '.join([line, lines[i + 1].strip()])
             else:
@@ -61,99 +72,179 @@ def de_privacy_admission(content):
     # 注意：这里保留单空格，因为原始多个空格已转为换行符
     content = '\n'.join(result_lines)
 
-    for name in names:
-        content = content.replace(name, 'NAME')
+    # 所有姓名编译为一个多模式匹配器，一次扫描完成替换
+    content = get_name_matcher(names).replace(content, 'NAME')
 
     # ====== 新增的后处理步骤 ======
     # 1. 删除所有NAME和DATE标签
     content = content.replace('NAME', '').replace('DATE', '')
 
-    # 2.1 清理多余空格
-    # 处理连续空格/制表符 (不包含换行符)
-    content = re.sub(r'[ \t]{2,}', ' ', content)
-    # 2.2 专门处理换行符周围的空格
-    content = re.sub(r'\n\s+', '\n', content)  # 行首空格
-    content = re.sub(r'\s+\n', '\n', content)  # 行尾空格
-
-    # 3. 额外修正：处理连续换行符
-    content = re.sub(r'\n{3,}', '\n\n', content)  # 保留最多两个连续换行
+    # 2. 清理多余空格：连续空格/制表符合并为一个，换行符周围的空白和连续空行合并为单个换行
+    content = tidy_whitespace(content)
 
     return content
 
 
-def process_admission_files(input_root, output_root):
-    """处理所有患者文件夹下的入院记录文件"""
-    # 遍历输入目录下的所有患者文件夹
-
-    for patient_id in os.listdir(input_root):
+def deidentify_file(file_path, names, source=None, signature_names=None):
+    """
+    读取并去隐私化单个文件（不写文件）
+    :param names: 该患者已识别出的姓名集合（原地更新）
+    :param source: 数据来源目录，用于缓存检测到的编码
+    :param signature_names: 从"姓名：""签名："等签名行中识别出的姓名集合（原地更新，供泄漏扫描区分可靠程度），
+                            None 表示不记录
+    :return: 去隐私化后的文本
+    """
+    # 只读取一次文件并检测编码，同一导出目录复用检测到的编码
+    content, _ = read_text(file_path, source=source)
+
+    # 去隐私化处理
+    signatures = SIGNATURE_PATTERN.findall(content)
+    names.update(signatures)
+    if signature_names is not None:
+        signature_names.update(signatures)
+    return de_privacy_admission(content, names)
+
+
+def deidentify_patient(patient_id, input_root, output_root):
+    """
+    对单个患者文件夹去隐私化（不依赖任何全局状态，可在多个进程中并行执行）：
+    1. 依次处理入院、出院、首程、病程四个文件，前面文件中识别出的姓名用于后面的文件
+    2. 结果写入 {output_root}/{patient_id}/ 下的同名文件
+    :return: dict，包含 patient_id、names（识别出的姓名，排序后的列表）、signature_names（其中来自签名行的姓名）、
+             files（处理的文件数）、failed（失败的文件数）、seconds（耗时）
+    """
+    start_time = time.perf_counter()
+    patient_folder = os.path.join(input_root, patient_id)
+    names = set()
+    signature_names = set()
+    files_processed = 0
+    files_failed = 0
 
-        patient_folder = os.path.join(input_root, patient_id)
+    for file in PATIENT_FILES:
+        admission_file = os.path.join(patient_folder, file)
 
-        # 确保是目录
-        if not os.path.isdir(patient_folder):
+        # 检查文件是否存在
+        if not os.path.exists(admission_file):
+            logger.warning(f'未找到文件: {admission_file}')
             continue
 
-        # 构建入院文件路径
-        global names
-        files = ['入院.txt', '出院.txt', '首程.txt', '病程.txt']
-        names = set()
-        pattern1 = r'.*[姓签]\s*名：\s*([^ \n]+)[ \n]'
-
-        for file in files:
-            # admission_file = os.path.join(patient_folder, '入院.txt')
-            admission_file = os.path.join(patient_folder, file)
-
-            # 检查文件是否存在
-            if not os.path.exists(admission_file):
-                print(f'未找到文件: {admission_file}')
-                continue
-
-            try:
-                # 尝试多种编码读取文件
-                encodings = ['utf-8', 'gbk', 'gb18030', 'latin1']
-                content = None
-                for encoding in encodings:
-                    try:
-                        with open(admission_file, 'r', encoding=encoding) as f:
-                            content = f.read()
-                        break
-                    except UnicodeDecodeError:
-                        continue
-
-                if content is None:
-                    print(f'无法解码文件: {admission_file}')
-                    continue
-
-                # 去隐私化处理
-
-                matches = re.findall(pattern1, content)
-                names.update(matches)
-
-                processed_content = de_privacy_admission(content)
-
-                # 创建输出目录
-                output_folder = os.path.join(output_root, patient_id)
-                os.makedirs(output_folder, exist_ok=True)
-
-                # 写入处理后的内容
-                output_file = os.path.join(output_folder, file)
-                with open(output_file, 'w', encoding='utf-8') as f:
-                    f.write(processed_content)
+        try:
+            processed_content = deidentify_file(admission_file, names, source=input_root, signature_names=signature_names)
+
+            # 创建输出目录
+            output_folder = os.path.join(output_root, patient_id)
+            os.makedirs(output_folder, exist_ok=True)
+
+            # 写入处理后的内容
+            output_file = os.path.join(output_folder, file)
+            with open(output_file, 'w', encoding='utf-8') as f:
+                f.write(processed_content)
+
+            files_processed += 1
+            logger.debug(f'处理完成: {patient_id}/{file}')
+        except Exception as e:
+            files_failed += 1
+            logger.error(f'处理失败: {admission_file}, 错误: {str(e)}')
+
+    return {
+        'patient_id': patient_id,
+        'names': sorted(names),
+        'signature_names': sorted(signature_names),
+        'files': files_processed,
+        'failed': files_failed,
+        'seconds': time.perf_counter() - start_time,
+    }
+
+
+def write_timing_report(results, report_file):
+    """保存每位患者的处理耗时报告（CSV），并打印总体统计和最慢的患者"""
+    with open(report_file, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['patient_id', 'files', 'names', 'seconds'])
+        for result in results:
+            writer.writerow([result['patient_id'], result['files'], len(result['names']), f"{result['seconds']:.4f}"])
+
+    if results:
+        total = sum(result['seconds'] for result in results)
+        print(f'\n去隐私化耗时：{len(results)} 位患者，累计 {total:.2f} 秒，平均 {total / len(results):.3f} 秒/位')
+        for result in sorted(results, key=lambda r: r['seconds'], reverse=True)[:5]:
+            print(f"  {result['patient_id']}: {result['seconds']:.3f} 秒（{result['files']} 个文件）")
+    print(f'耗时报告已保存: {report_file}')
+
+
+def save_patient_names(results, names_dir):
+    """
+    按患者保存去隐私化时识别出的姓名（{names_dir}/{患者ID}.json），供泄露扫描使用：
+    signature 为签名行中的姓名，guessed 为按"2~3 个汉字的整行"推测的姓名（可能是"正常""同前"等普通词语）
+    注意：该目录包含隐私信息，应与输出数据分开存放，不能随数据一起分发
+    """
+    os.makedirs(names_dir, exist_ok=True)
+    for result in results:
+        signature = set(result['signature_names'])
+        entry = {'signature': sorted(signature), 'guessed': [name for name in result['names'] if name not in signature]}
+        with open(os.path.join(names_dir, f"{result['patient_id']}.json"), 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+    print(f'已保存 {len(results)} 位患者的姓名列表: {names_dir}')
+
+
+def map_patients(worker, patient_ids, workers=None, desc='去隐私化'):
+    """
+    对每位患者执行 worker（可被 pickle 的函数），workers>1 时使用多进程并行，并显示进度（速率、剩余时间、失败文件数）
+    :param workers: 并行进程数，默认使用全部 CPU 核心；1 表示在当前进程中串行处理
+    :return: 结果列表（顺序与 patient_ids 一致）
+    """
+    workers = workers or os.cpu_count() or 1
+    results = []
+    with Progress(len(patient_ids), desc) as progress:
+        if workers == 1 or len(patient_ids) <= 1:
+            for patient_id in patient_ids:
+                results.append(worker(patient_id))
+                progress.update(failed=results[-1].get('failed', 0))
+        else:
+            print(f'使用 {workers} 个进程并行处理 {len(patient_ids)} 位患者')
+            with ProcessPoolExecutor(max_workers=workers, **worker_logging()) as executor:
+                for result in executor.map(worker, patient_ids, chunksize=4):
+                    results.append(result)
+                    progress.update(failed=result.get('failed', 0))
+    return results
+
+
+def process_admission_files(input_root, output_root, workers=None, report_file='step1-De_privacy-timing.csv',
+                            names_dir='step1-names'):
+    """
+    处理所有患者文件夹下的入院记录文件
+    :param workers: 并行进程数，默认使用全部 CPU 核心；1 表示在当前进程中串行处理
+    :param report_file: 每位患者耗时报告的保存路径（放在输出目录之外，避免被后续步骤当作患者文件夹）
+    :param names_dir: 按患者保存识别出的姓名的目录（供 leak_scanner.py 使用），None 表示不保存
+    :return: 每位患者的处理结果列表（顺序与输入目录一致）
+    """
+    # 遍历输入目录下的所有患者文件夹
+    patient_ids = [patient_id for patient_id in os.listdir(input_root)
+                   if os.path.isdir(os.path.join(input_root, patient_id))]
+    worker = partial(deidentify_patient, input_root=input_root, output_root=output_root)
+    results = map_patients(worker, patient_ids, workers)
 
-                print(f'处理完成: {patient_id}/{file}')
-            except Exception as e:
-                print(f'处理失败: {admission_file}, 错误: {str(e)}')
+    if report_file:
+        write_timing_report(results, report_file)
+    if names_dir:
+        save_patient_names(results, names_dir)
+    return results
 
 
 if __name__ == "__main__":
     # 设置路径
     input_root = 'E:\\PyCharm\\nlp\\附二数据标准化代码\\附二导出数据'  # 替换为您的原始数据目录
     output_root = 'step1-De_privacy'  # 输出目录
+    # 带 --profile 运行时输出性能分析结果（只分析主进程，需要分析去隐私化本身时以 1 个进程运行）
+    profile = profiling_requested()
+    setup_logging('De-privacization')
+    # 并行进程数（命令行第一个参数），默认使用全部 CPU 核心
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else None
 
     # 确保输出目录存在
     os.makedirs(output_root, exist_ok=True)
-    names = set()
 
     # 处理所有入院记录文件
-    process_admission_files(input_root, output_root)
+    with profile_stage('De-privacization', enabled=profile):
+        process_admission_files(input_root, output_root, workers)
     print('所有入院记录处理完成！')
\ No newline at end of file
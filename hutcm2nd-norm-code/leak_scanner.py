@@ -0,0 +1,165 @@
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.profiling import profile_stage, profiling_requested
+from name_matcher import NameMatcher
+
+# 短于该长度的"姓名"误报太多，不参与扫描
+MIN_NAME_LENGTH = 2
+# 按"2~3 个汉字的整行"推测的姓名中常见的普通词语（病历中的短句、体征、结论），不参与扫描
+STOP_WORDS = {
+    '正常', '良好', '同前', '同上', '不详', '阴性', '阳性', '否认', '未见', '未及', '未触及', '无异常', '无殊',
+    '神清', '神志清', '精神可', '纳可', '纳差', '眠可', '眠差', '二便调', '二便可', '已婚', '未婚', '已育', '未育',
+    '患者', '家属', '本人', '医师', '医生', '主任', '护士', '住院医师', '主治医师', '上级医师',
+    '好转', '治愈', '未愈', '稳定', '平稳', '缓解', '无变化', '继续观察', '出院', '入院', '转院',
+}
+
+# 工作进程中的姓名匹配器（由 init_worker 在每个进程中构建一次）
+_matcher = None
+
+
+def load_patient_names(names_dir):
+    """
+    读取去隐私化时按患者保存的姓名
+    旧版本保存的是不区分来源的姓名列表，全部视为推测的姓名（重新运行去隐私化后可区分）
+    :return: ({患者ID: 签名行中的姓名列表}, {患者ID: 推测的姓名列表})
+    """
+    signature, guessed = {}, {}
+    for filename in os.listdir(names_dir):
+        if filename.endswith('.json'):
+            patient_id = os.path.splitext(filename)[0]
+            with open(os.path.join(names_dir, filename), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            if isinstance(entry, list):
+                entry = {'guessed': entry}
+            signature[patient_id] = entry.get('signature', [])
+            guessed[patient_id] = entry.get('guessed', [])
+    return signature, guessed
+
+
+def build_name_index(patient_names, min_length=MIN_NAME_LENGTH, stop_words=()):
+    """汇总所有患者的姓名（跳过过短的姓名和 stop_words） :return: {姓名: 出现该姓名的患者ID列表}"""
+    index = {}
+    for patient_id, names in patient_names.items():
+        for name in names:
+            if len(name) >= min_length and name not in stop_words:
+                index.setdefault(name, set()).add(patient_id)
+    return {name: sorted(patients) for name, patients in index.items()}
+
+
+def list_files(root, suffix='.txt'):
+    """列出目录树中所有指定后缀的文件"""
+    paths = []
+    for dirpath, _, filenames in os.walk(root):
+        paths.extend(os.path.join(dirpath, filename) for filename in filenames if filename.endswith(suffix))
+    return paths
+
+
+def init_worker(names):
+    """工作进程初始化：构建一次全部姓名的多模式匹配器"""
+    global _matcher
+    _matcher = NameMatcher(names)
+
+
+def scan_file(path):
+    """一次线性扫描单个文件 :return: (文件路径, [(字符偏移, 姓名), ...])"""
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        text = f.read()
+    return path, [(start, name) for start, _, name in _matcher.finditer(text)]
+
+
+def scan_outputs(roots, names_dir='step1-names', report_file='leak_report.csv', workers=None, suffix='.txt'):
+    """
+    扫描输出目录树中是否残留去隐私化时识别出的姓名：
+    1. 汇总 names_dir 中所有患者的姓名，构建一个多模式匹配器
+    2. 多进程并行扫描每个文件（每个文件一次线性扫描）
+    3. 命中结果按 患者/文件/偏移 保存为 CSV，并标注该姓名是否属于同一患者；
+       签名行中的姓名记为残留（level=leak），按整行推测的姓名（去掉 STOP_WORDS）只记为疑似（level=warning）
+    :param roots: 需要扫描的目录（如 step2-Extracted、step3-tojoint），目录下第一层为患者文件夹
+    :param workers: 并行进程数，默认使用全部 CPU 核心；1 表示在当前进程中串行处理
+    :return: 命中列表，每项为 dict（level、patient_id、file、offset、name、name_patients、same_patient）
+    """
+    start_time = time.perf_counter()
+    signature, guessed = load_patient_names(names_dir)
+    name_index = build_name_index(signature)
+    guessed_index = {name: patients for name, patients in build_name_index(guessed, stop_words=STOP_WORDS).items()
+                     if name not in name_index}
+    if not name_index and not guessed_index:
+        print(f'警告: {names_dir} 中没有可用于扫描的姓名')
+        return []
+
+    files = []
+    for root in roots:
+        files.extend((root, path) for path in list_files(root, suffix))
+    paths = [path for _, path in files]
+    names = list(name_index) + list(guessed_index)
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(paths) <= 1:
+        init_worker(names)
+        scanned = [scan_file(path) for path in paths]
+    else:
+        chunksize = max(1, len(paths) // (workers * 8))
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(names,)) as executor:
+            scanned = list(executor.map(scan_file, paths, chunksize=chunksize))
+
+    hits = []
+    for (root, _), (path, matches) in zip(files, scanned):
+        relative = os.path.relpath(path, root)
+        patient_id = relative.split(os.sep)[0] if os.sep in relative else ''
+        for offset, name in matches:
+            level, patients = ('leak', name_index[name]) if name in name_index else ('warning', guessed_index[name])
+            hits.append({
+                'level': level,
+                'patient_id': patient_id,
+                'file': os.path.join(os.path.basename(os.path.normpath(root)), relative),
+                'offset': offset,
+                'name': name,
+                'name_patients': ' '.join(patients),
+                'same_patient': patient_id in patients,
+            })
+
+    elapsed = time.perf_counter() - start_time
+    print(f'扫描完成: {len(paths)} 个文件，{len(name_index)} 个签名行姓名，{len(guessed_index)} 个推测的姓名，'
+          f'用时 {elapsed:.2f} 秒')
+    leaks = [hit for hit in hits if hit['level'] == 'leak']
+    warnings = [hit for hit in hits if hit['level'] == 'warning']
+    if leaks:
+        leaked_files = len({hit['file'] for hit in leaks})
+        print(f'发现 {len(leaks)} 处姓名残留，涉及 {leaked_files} 个文件：')
+        for hit in leaks[:20]:
+            print(f"  {hit['file']} @{hit['offset']}: {hit['name']}")
+        if len(leaks) > 20:
+            print('  ...')
+    else:
+        print('未发现姓名残留。')
+    if warnings:
+        print(f'警告: {len(warnings)} 处疑似姓名（按整行推测，可能是普通词语），涉及 {len({hit["file"] for hit in warnings})} 个文件，'
+              f'请查看扫描报告中 level=warning 的记录；确认是普通词语时可加入 STOP_WORDS')
+
+    if report_file:
+        with open(report_file, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=['level', 'patient_id', 'file', 'offset', 'name', 'name_patients',
+                                                   'same_patient'])
+            writer.writeheader()
+            writer.writerows(hits)
+        print(f'扫描报告已保存: {report_file}')
+    return hits
+
+
+if __name__ == "__main__":
+    # 带 --profile 运行时输出性能分析结果（只分析主进程）
+    profile = profiling_requested()
+    # 需要扫描的目录（命令行参数），默认扫描提取结果和 LLM 标准化结果
+    roots = sys.argv[1:] or ['step2-Extracted', 'step3-tojoint']
+    roots = [root for root in roots if os.path.isdir(root)]
+
+    with profile_stage('leak_scanner', enabled=profile):
+        hits = scan_outputs(roots)
+    # 有签名行姓名残留时以非零状态退出，便于在每次运行后作为检查步骤（疑似姓名只警告）
+    sys.exit(1 if any(hit['level'] == 'leak' for hit in hits) else 0)
@@ -0,0 +1,115 @@
+import os
+import re
+from functools import lru_cache
+
+try:
+    import ahocorasick  # pyahocorasick（可选）：安装后使用 Aho-Corasick 自动机
+except ImportError:
+    ahocorasick = None
+
+
+class NameMatcher:
+    """
+    多模式姓名匹配器：将一组姓名编译一次，之后每段文本只需一次线性扫描即可找出/替换全部姓名。
+    安装了 pyahocorasick 时使用 Aho-Corasick 自动机；否则使用纯 Python 实现：
+    用姓名首字组成的字符类正则跳到候选位置，再按姓名长度（从长到短）截取子串查哈希集合，
+    每个位置的开销只与不同姓名长度的个数有关，与姓名数量无关
+    （不能用全部姓名的正则交替：sre 在每个位置逐一尝试每个姓名，2 万个姓名时扫描慢两个数量级）。
+    两种实现在重叠时都取最左、最长的匹配。
+    """
+
+    def __init__(self, names):
+        self.names = sorted({name for name in names if name}, key=lambda n: (-len(n), n))
+        self.automaton = None
+        self.first_chars = None
+        if not self.names:
+            return
+        if ahocorasick is not None:
+            self.automaton = ahocorasick.Automaton()
+            for name in self.names:
+                self.automaton.add_word(name, name)
+            self.automaton.make_automaton()
+        else:
+            self.name_set = set(self.names)
+            self.lengths = sorted({len(name) for name in self.names}, reverse=True)
+            self.first_chars = re.compile('[%s]' % ''.join(map(re.escape, sorted({name[0] for name in self.names}))))
+
+    def finditer(self, text):
+        """依次返回 (起始位置, 结束位置, 姓名)，匹配互不重叠"""
+        if self.automaton is not None:
+            for end, name in self.automaton.iter_long(text):
+                yield end - len(name) + 1, end + 1, name
+        elif self.first_chars is not None:
+            position = 0
+            while True:
+                match = self.first_chars.search(text, position)
+                if match is None:
+                    return
+                start = match.start()
+                position = start + 1
+                for length in self.lengths:
+                    name = text[start:start + length]  # 接近文本末尾时可能短于 length
+                    if name in self.name_set:
+                        position = start + len(name)
+                        yield start, position, name
+                        break
+
+    def subn(self, text, replacement):
+        """一次扫描将文本中的所有姓名替换为 replacement :return: (替换后的文本, 替换次数)"""
+        parts = []
+        last = 0
+        for start, end, _ in self.finditer(text):
+            parts.append(text[last:start])
+            parts.append(replacement)
+            last = end
+        if not parts:
+            return text, 0
+        parts.append(text[last:])
+        return ''.join(parts), len(parts) // 2
+
+    def replace(self, text, replacement):
+        """一次扫描将文本中的所有姓名替换为 replacement"""
+        return self.subn(text, replacement)[0]
+
+
+@lru_cache(maxsize=64)
+def _cached_matcher(names):
+    return NameMatcher(names)
+
+
+def get_name_matcher(names):
+    """获取姓名集合对应的匹配器（相同姓名集合复用已编译的匹配器）"""
+    return _cached_matcher(frozenset(names))
+
+
+def scrub_text(content, names, replacement=''):
+    """将文本中出现的所有姓名替换为 replacement"""
+    return get_name_matcher(names).replace(content, replacement)
+
+
+def scrub_directory(input_dir, output_dir, names, replacement='', suffix='.txt'):
+    """
+    批量去除整个目录（含子目录）中所有文本文件里的姓名，保持目录结构写到 output_dir
+    （input_dir 与 output_dir 相同时原地处理）
+    :return: (处理的文件数, 替换次数)
+    """
+    matcher = get_name_matcher(names)
+    files_processed = 0
+    replacements = 0
+    for root, _, files in os.walk(input_dir):
+        target_root = os.path.normpath(os.path.join(output_dir, os.path.relpath(root, input_dir)))
+        in_place = target_root == os.path.normpath(root)
+        os.makedirs(target_root, exist_ok=True)
+        for filename in files:
+            if not filename.endswith(suffix):
+                continue
+            with open(os.path.join(root, filename), 'r', encoding='utf-8') as f:
+                content = f.read()
+            scrubbed, hits = matcher.subn(content, replacement)
+            if hits or not in_place:
+                with open(os.path.join(target_root, filename), 'w', encoding='utf-8') as f:
+                    f.write(scrubbed)
+            files_processed += 1
+            replacements += hits
+    print(f"姓名清理完成: 处理 {files_processed} 个文件，替换 {replacements} 处")
+    return files_processed, replacements
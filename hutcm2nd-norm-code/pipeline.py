@@ -0,0 +1,125 @@
+import importlib.util
+import os
+import sys
+import time
+from functools import partial
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.manifest import write_text_if_changed
+from common.profiling import profile_stage, profiling_requested
+from common.logging_utils import get_logger, setup_logging
+from process_records import EXCLUDE_SECTIONS, extract_sections, process_course_records
+
+logger = get_logger('pipeline')
+
+
+def load_script(filename, module_name):
+    """按文件路径加载同目录下的脚本模块（脚本文件名含连字符，无法直接 import）"""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), filename)
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+deprivacy = load_script('De-privacization.py', 'de_privacization')
+
+
+def process_patient(patient_id, input_root, output_root, audit_root=None):
+    """
+    在内存中串联单个患者的去隐私化和内容提取，只写出最终的提取结果：
+    1. 依次读取并去隐私化入院、出院、首程、病程四个文件（与 De-privacization.py 相同）
+    2. 病程按时间戳拆分，其他文件按 EXCLUDE_SECTIONS 提取段落（与 process_records.py 相同）
+    3. 结果写入 {output_root}/{patient_id}/，与分两步运行时 step2-Extracted 中的文件一致
+    :param audit_root: 审计用的中间结果目录（如 step1-De_privacy），None 表示不保存去隐私化的中间文件
+    :return: dict，包含 patient_id、names、signature_names、files（生成的文件数）、failed（失败的文件数）、seconds（耗时）
+    """
+    start_time = time.perf_counter()
+    patient_folder = os.path.join(input_root, patient_id)
+    output_dir = os.path.join(output_root, patient_id)
+    os.makedirs(output_dir, exist_ok=True)
+    names = set()
+    signature_names = set()
+    files_created = 0
+    files_failed = 0
+
+    for file in deprivacy.PATIENT_FILES:
+        input_file = os.path.join(patient_folder, file)
+
+        # 检查文件是否存在
+        if not os.path.exists(input_file):
+            logger.warning(f'未找到文件: {input_file}')
+            continue
+
+        try:
+            content = deprivacy.deidentify_file(input_file, names, source=input_root,
+                                                signature_names=signature_names)
+
+            if audit_root:
+                audit_dir = os.path.join(audit_root, patient_id)
+                os.makedirs(audit_dir, exist_ok=True)
+                with open(os.path.join(audit_dir, file), 'w', encoding='utf-8') as f:
+                    f.write(content)
+
+            section = os.path.splitext(file)[0]
+            if file == '病程.txt':
+                files_created += process_course_records(content, output_dir)
+            elif section in EXCLUDE_SECTIONS:
+                write_text_if_changed(os.path.join(output_dir, file), extract_sections(content, EXCLUDE_SECTIONS[section]))
+                files_created += 1
+            logger.debug(f'处理完成: {patient_id}/{file}')
+        except Exception as e:
+            files_failed += 1
+            logger.error(f'处理失败: {input_file}, 错误: {str(e)}')
+
+    return {
+        'patient_id': patient_id,
+        'names': sorted(names),
+        'signature_names': sorted(signature_names),
+        'files': files_created,
+        'failed': files_failed,
+        'seconds': time.perf_counter() - start_time,
+    }
+
+
+def run_pipeline(input_root, output_root, audit_root=None, workers=None, report_file='step2-Extracted-timing.csv',
+                 names_dir='step1-names'):
+    """
+    对所有患者运行内存中的预处理流水线（去隐私化 + 提取），代替先后运行
+    De-privacization.py 和 process_records.py，省去中间目录的一次写入和读取
+    :param audit_root: 需要保留去隐私化中间结果以供审计时指定目录，默认不保存
+    :param workers: 并行进程数，默认使用全部 CPU 核心；1 表示在当前进程中串行处理
+    :param names_dir: 按患者保存识别出的姓名的目录（供 leak_scanner.py 使用），None 表示不保存
+    :return: 每位患者的处理结果列表
+    """
+    if not os.path.isdir(input_root):
+        print(f"错误: 输入目录不存在 {input_root}")
+        return []
+
+    patient_ids = [patient_id for patient_id in os.listdir(input_root)
+                   if os.path.isdir(os.path.join(input_root, patient_id))]
+    worker = partial(process_patient, input_root=input_root, output_root=output_root, audit_root=audit_root)
+    results = deprivacy.map_patients(worker, patient_ids, workers, desc='预处理')
+
+    if report_file:
+        deprivacy.write_timing_report(results, report_file)
+    if names_dir:
+        deprivacy.save_patient_names(results, names_dir)
+    return results
+
+
+if __name__ == "__main__":
+    input_root = 'E:\\PyCharm\\nlp\\附二数据标准化代码\\附二导出数据'  # 原始数据目录
+    output_root = 'step2-Extracted'  # 最终提取结果目录（LLM 处理阶段的输入）
+    audit_root = None  # 需要审计去隐私化结果时设为 'step1-De_privacy'
+    # 带 --profile 运行时输出性能分析结果（只分析主进程，需要分析处理本身时以 1 个进程运行）
+    profile = profiling_requested()
+    setup_logging('pipeline')
+    # 并行进程数（命令行第一个参数），默认使用全部 CPU 核心
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else None
+
+    os.makedirs(output_root, exist_ok=True)
+    with profile_stage('pipeline', enabled=profile):
+        run_pipeline(input_root, output_root, audit_root, workers)
+    print("处理完成！所有文件已保存到:", output_root)
@@ -1,25 +1,128 @@
+import mmap
 import os
 import re
+import sys
 from datetime import datetime
+from functools import lru_cache
+from itertools import chain
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.manifest import write_text_if_changed
+from common.course_splitter import split_records
+from common.profiling import profile_stage, profiling_requested
+from common.logging_utils import get_logger, setup_logging, Progress
+
+logger = get_logger('process_records')
+
+# 病程记录时间戳格式（common.course_splitter.TIMESTAMP_FORMATS），例如：2021.10.10 08:11 主治医师查房记录
+COURSE_FORMAT = 'dot_title'
+# 同一格式的字节形式，用于在内存映射的文件中直接查找，按通用换行规则 \r 和 \n 都视为行尾
+COURSE_HEADER = re.compile(rb'[0-9]{4}\.[0-9]{2}\.[0-9]{2} [0-9]{2}:[0-9]{2} [^\r\n]+')
+# 时间戳中的 ":MM " 部分：以字面量开头，可以快速定位候选位置，再回退 13 个字节校验完整时间戳
+COURSE_HEADER_COLON = re.compile(rb':[0-9]{2} [^\r\n]')
+COURSE_HEADER_COLON_OFFSET = 13
+
+# 段落标题与内容之间的冒号（中文或英文，取最先出现的一个）
+SECTION_COLON = re.compile('[：:]')
+# 标题中只保留汉字
+NON_CJK = re.compile(r'[^\u4e00-\u9fff]')
+
+# 各类文件中需要排除的段落（标题包含其中任一关键词即排除）
+EXCLUDE_SECTIONS = {
+    '入院': [
+        '问诊', "既往史", '个人史', '婚育史', '月经史', '家族史', '体格检查'
+    ],
+    '首程': [
+        '体格检查', '中医鉴别诊断', '西医鉴别诊断', '病例分型'
+    ],
+    '出院': ['医师签名']
+}
+
+# 按标题关键词处理段落内容的规则，按顺序依次应用：(标题关键词, 操作, 参数)
+# cut：删除参数标记及其之后的内容
+# keep_tail：另外单独保留从参数标记开始的内容（即使该段落被排除）
+# drop_exam：删除体格检查/体查到专科检查之前的内容；没有体格检查时从参数标记（如生命体征 T:）开始删除
+SECTION_RULES = [
+    ('病史', 'cut', '既往'),
+    ('体格检查', 'keep_tail', '专科检查'),
+    ('入院情况', 'drop_exam', 'T:'),
+    ('入院情况', 'cut', '既往'),
+    ('出院情况', 'drop_exam', None),  # 出院情况中可能也有体格检查
+]
 
 
 def split_daily_course(content):
     """根据时间戳拆分病程记录"""
     # 匹配时间戳模式，例如：2021.10.10 08:11 主治医师查房记录
-    pattern = re.compile(r'\d{4}\.\d{2}\.\d{2} \d{2}:\d{2} .+')
-    matches = list(pattern.finditer(content))
+    return split_records(content, COURSE_FORMAT)
+
+
+def iter_course_headers(buffer):
+    """
+    依次返回每个病程时间戳的起始字节位置，结果与 COURSE_HEADER.finditer 一致：
+    先查找 ":MM " 字面量，再校验其前面的完整时间戳，匹配后从该行行尾继续查找
+    （UTF-8 中文文本的字节数约为字符数的 3 倍，逐字节尝试匹配数字开头的模式较慢）
+    """
+    min_start = search_from = 0
+    while True:
+        colon = COURSE_HEADER_COLON.search(buffer, search_from)
+        if colon is None:
+            return
+        start = colon.start() - COURSE_HEADER_COLON_OFFSET
+        header = COURSE_HEADER.match(buffer, start) if start >= min_start else None
+        if header is None:
+            search_from = colon.start() + 1
+            continue
+        yield start
+        min_start = search_from = header.end()
+
+
+def iter_course_ranges(buffer):
+    """
+    在字节缓冲区（如内存映射的文件）中查找病程时间戳，依次返回每条记录的 (起始字节, 结束字节)
+    每条记录从时间戳开始，到下一个时间戳之前结束；第一个时间戳之前的内容丢弃
+    """
+    start = None
+    for header_start in iter_course_headers(buffer):
+        if start is not None:
+            yield start, header_start
+        start = header_start
+    if start is not None:
+        yield start, len(buffer)
+
+
+def split_course_file(input_file):
+    """
+    流式拆分病程文件：内存映射整个文件，按字节范围逐条解码返回记录，
+    不需要同时在内存中保存整篇文本及其切片（换行和首尾空白的处理与按文本读取后拆分一致）
+    """
+    if os.path.getsize(input_file) == 0:
+        return
+    with open(input_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        for start, end in iter_course_ranges(buffer):
+            record = buffer[start:end].decode('utf-8')
+            yield record.replace('\r\n', '\n').replace('\r', '\n').strip()
+
 
-    records = []
-    for i in range(len(matches)):
-        start = matches[i].start()
-        if i < len(matches) - 1:
-            end = matches[i + 1].start()
-        else:
-            end = len(content)
-        record = content[start:end].strip()
-        records.append(record)
+def process_course_file(input_file, patient_dir):
+    """流式处理病程文件并逐条保存（预读一条以确定是单个记录还是需要拆分编号）"""
+    records = split_course_file(input_file)
+    first = next(records, None)
+    if first is None:
+        # 空记录
+        return 0
+    second = next(records, None)
+    if second is None:
+        # 单个记录
+        write_text_if_changed(os.path.join(patient_dir, "病程记录.txt"), first)
+        return 1
 
-    return records
+    # 多个记录
+    files_created = 0
+    for i, record in enumerate(chain([first, second], records), 1):
+        write_text_if_changed(os.path.join(patient_dir, f"(拆分)病程记录{i}.txt"), record)
+        files_created += 1
+    return files_created
 
 
 def process_course_records(content, patient_dir):
@@ -32,115 +135,116 @@ def process_course_records(content, patient_dir):
         pass
     elif len(records) == 1:
         # 单个记录
-        file_path = os.path.join(patient_dir, "病程记录.txt")
-        with open(file_path, "w", encoding="utf-8") as f:
-            f.write(records[0])
+        write_text_if_changed(os.path.join(patient_dir, "病程记录.txt"), records[0])
         files_created += 1
     else:
         # 多个记录
         for i, record in enumerate(records, 1):
-            file_path = os.path.join(patient_dir, f"(拆分)病程记录{i}.txt")
-            with open(file_path, "w", encoding="utf-8") as f:
-                f.write(record)
+            write_text_if_changed(os.path.join(patient_dir, f"(拆分)病程记录{i}.txt"), record)
             files_created += 1
 
     return files_created
 
 
+def cut_from(line, marker):
+    """删除 marker 及其之后的内容 :return: (处理后的行, 额外保留的内容)"""
+    idx = line.find(marker)
+    return (line[:idx] if idx != -1 else line), None
+
+
+def keep_tail(line, marker):
+    """行本身不变，另外保留从 marker 开始的内容 :return: (行, 额外保留的内容或 None)"""
+    idx = line.find(marker)
+    return line, (line[idx:] if idx != -1 else None)
+
+
+def drop_exam(line, fallback=None):
+    """删除体格检查部分（到专科检查之前），没有体格检查时从 fallback 开始删除 :return: (处理后的行, None)"""
+    # 同时出现"体格检查"和"体查"时取靠后的一个
+    start = max(line.find('体格检查'), line.find('体查'))
+    if start == -1 and fallback is not None:
+        start = line.find(fallback)
+    if start == -1:
+        return line, None
+    end = line.find('专科检查')
+    return (line[:start] + line[end:] if end > start else line[:start]), None
+
+
+RULE_ACTIONS = {
+    'cut': cut_from,
+    'keep_tail': keep_tail,
+    'drop_exam': drop_exam,
+}
+
+
+@lru_cache(maxsize=None)
+def compile_keywords(keywords):
+    """将关键词元组编译为一个正则（一次扫描判断标题是否包含任一关键词），空元组返回 None"""
+    if not keywords:
+        return None
+    return re.compile('|'.join(map(re.escape, keywords)))
+
+
+def extract_sections(content, excludes, rules=SECTION_RULES):
+    """
+    逐行切分段落并提取所需内容（不涉及文件读写，可用于任意中心的文本）：
+    1. 含冒号的行视为段落标题行，冒号前的汉字为标题；排除规则对该行及其后的续行生效，直到下一个标题行
+    2. 标题包含 excludes 中任一关键词的段落被排除
+    3. 按 rules 中与标题匹配的规则依次处理标题行内容
+    :param excludes: 需要排除的段落关键词列表（如 EXCLUDE_SECTIONS['入院']）
+    :param rules: (标题关键词, 操作, 参数) 列表，操作见 RULE_ACTIONS
+    :return: 提取后的文本
+    """
+    exclude_pattern = compile_keywords(tuple(excludes))
+    extracted_contents = []
+    allow = True
+
+    for line in content.split('\n'):
+        colon = SECTION_COLON.search(line)
+        if colon is not None:
+            title = NON_CJK.sub('', line[:colon.start()])
+            allow = exclude_pattern is None or exclude_pattern.search(title) is None
+
+            for keyword, action, param in rules:
+                if keyword in title:
+                    line, extra = RULE_ACTIONS[action](line, param)
+                    if extra is not None:
+                        extracted_contents.append(extra)
+
+        if allow:
+            extracted_contents.append(line)
+
+    return '\n'.join(extracted_contents)
+
+
 def extract_sections_from_file(input_file, output_dir, excludes):
     """提取文件内容并处理病程记录"""
     try:
+        # 如果是病程记录文件，流式拆分处理并返回（不整篇读入内存）
+        if os.path.basename(input_file) == "病程.txt":
+            files_created = process_course_file(input_file, output_dir)
+            logger.debug(f"成功处理病程记录，生成 {files_created} 个文件")
+            return True
+
         # 读取原始文件内容
         with open(input_file, 'r', encoding='utf-8') as f:
             content = f.read()
 
-        # 如果是病程记录文件，直接处理并返回
-        if os.path.basename(input_file) == "病程.txt":
-            files_created = process_course_records(content, output_dir)
-            print(f"成功处理病程记录，生成 {files_created} 个文件")
-            return True
-
-        lines = content.split('\n')
         # 提取所需内容
-        extracted_contents = []
-        allow = True
-
-        # 遍历所有内容，寻找冒号
-        for line in lines:
-            idx1 = line.find('：')
-            idx2 = line.find(':')
-            if idx1 != -1 and idx2 != -1:
-                idx = min(idx1, idx2)
-            elif idx1 == -1:
-                idx = idx2
-            elif idx2 == -1:
-                idx = idx1
-            else:
-                idx = -1
-
-            if idx != -1:
-                title = re.sub(r'[^\u4e00-\u9fff]', '', line[:idx])
-
-                allow = True
-                for exclude in excludes:
-                    if exclude in title:
-                        allow = False
-                        break
-
-                if '病史' in title:
-                    tail_idx = line.find('既往')
-                    if tail_idx != -1:
-                        line = line[:tail_idx]
-
-                if '体格检查' in title:
-                    tail_idx = line.find('专科检查')
-                    if tail_idx != -1:
-                        extracted_contents.append(line[tail_idx:])
-
-                if '入院情况' in title:
-                    # 先尝试查找"体格检查"
-                    s = max(line.find('体格检查'), line.find('体查'))
-                    e = line.find('专科检查')
-
-                    if s != -1:
-                        # 如果有"体格检查"，按原逻辑处理
-                        line = line[:s] + line[e:] if e > s else line[:s]
-                    else:
-                        # 如果没有"体格检查"，尝试查找"T: "
-                        t_pos = line.find('T:')
-                        if t_pos != -1:
-                            # 如果找到"T: "，删除从"T: "开始到"专科检查"之前的内容
-                            line = line[:t_pos] + line[e:] if e > t_pos else line[:t_pos]
-
-                if '入院情况' in title:
-                    tail_idx = line.find('既往')
-                    if tail_idx != -1:
-                        line = line[:tail_idx]
-
-                if '出院情况' in title:         # 出院情况中可能也有体格检查
-                    s = max(line.find('体格检查'), line.find('体查'))
-                    e = line.find('专科检查')
-                    if s != -1:
-                        line = line[:s] + line[e:] if e > s else line[:s]
-
-            if allow:
-                extracted_contents.append(line)
-
-        # 合并所有提取的内容
-        result = '\n'.join(extracted_contents)
+        result = extract_sections(content, excludes)
 
         # 确保输出目录存在
         os.makedirs(output_dir, exist_ok=True)
         # 写入输出文件
+        # 内容未变化时不重写，LLM 阶段据修改时间只处理变化的部分
         output_file = os.path.join(output_dir, os.path.basename(input_file))
-        with open(output_file, 'w', encoding='utf-8') as f:
-            f.write(result)
+        write_text_if_changed(output_file, result)
 
-        print(f"成功处理: {input_file}")
+        logger.debug(f"成功处理: {input_file}")
         return True
 
     except Exception as e:
-        print(f"处理文件 {input_file} 时出错: {str(e)}")
+        logger.error(f"处理文件 {input_file} 时出错: {str(e)}")
         return False
 
 
@@ -151,18 +255,10 @@ def process_directory(input_dir, output_dir):
         print(f"错误: 输入目录不存在 {input_dir}")
         return
 
-    exclude_sections = {
-        '入院': [
-            '问诊', "既往史", '个人史', '婚育史', '月经史', '家族史', '体格检查'
-        ],
-        '首程': [
-            '体格检查', '中医鉴别诊断', '西医鉴别诊断', '病例分型'
-        ],
-        '出院': ['医师签名']
-    }
-
     # 遍历目录中的所有文件
-    for dir_name in os.listdir(input_dir):
+    dir_names = os.listdir(input_dir)
+    progress = Progress(len(dir_names), '拆分提取')
+    for dir_name in dir_names:
         input_dir_path = os.path.join(input_dir, dir_name)
         output_dir_path = os.path.join(output_dir, dir_name)
 
@@ -170,15 +266,18 @@ def process_directory(input_dir, output_dir):
         os.makedirs(output_dir_path, exist_ok=True)
 
         # 首先处理病程.txt文件
+        failed = 0
         course_file = os.path.join(input_dir_path, '病程.txt')
         if os.path.exists(course_file):
-            extract_sections_from_file(course_file, output_dir_path, [])
+            failed += not extract_sections_from_file(course_file, output_dir_path, [])
 
         # 处理其他文件
-        for filename, excludes in exclude_sections.items():
+        for filename, excludes in EXCLUDE_SECTIONS.items():
             input_path = os.path.join(input_dir_path, f'{filename}.txt')
             if os.path.exists(input_path):
-                extract_sections_from_file(input_path, output_dir_path, excludes)
+                failed += not extract_sections_from_file(input_path, output_dir_path, excludes)
+        progress.update(failed=failed)
+    progress.close()
 
 
 # 使用示例
@@ -189,6 +288,8 @@ if __name__ == "__main__":
     # 确保输出目录存在
     os.makedirs(output_dir, exist_ok=True)
 
-    # 处理整个目录
-    process_directory(input_dir, output_dir)
+    # 处理整个目录（带 --profile 运行时输出性能分析结果）
+    setup_logging('process_records')
+    with profile_stage('process_records', enabled=profiling_requested()):
+        process_directory(input_dir, output_dir)
     print("处理完成！所有文件已保存到:", output_dir)
\ No newline at end of file
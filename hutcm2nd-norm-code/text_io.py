@@ -0,0 +1,91 @@
+import codecs
+import os
+
+# 带 BOM 的文件直接按 BOM 确定编码
+BOMS = [
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+# 不是合法 UTF-8 时依次尝试的编码（与原来逐个试读的顺序一致，latin1 总能解码）
+FALLBACK_ENCODINGS = ['gbk', 'gb18030', 'latin1']
+# 使用缓存的编码前，用于排除 UTF-8 的校验字节数
+SNIFF_BYTES = 4096
+# 可以作为整个目录编码缓存的编码（BOM 编码只对单个文件有效，latin1 只是兜底）
+CACHEABLE_ENCODINGS = ('utf-8', 'gbk', 'gb18030')
+
+# {数据来源目录: 编码}，同一中心导出的文件编码相同
+_folder_encodings = {}
+
+
+def bom_encoding(data):
+    """根据 BOM 判断编码，没有 BOM 时返回 None"""
+    for bom, encoding in BOMS:
+        if data.startswith(bom):
+            return encoding
+    return None
+
+
+def looks_like_utf8(data, limit=SNIFF_BYTES):
+    """
+    增量校验开头 limit 字节是否为合法 UTF-8（截断在多字节字符中间不算错误）
+    :return: True（含非 ASCII 字符且合法）、False（不合法）、None（纯 ASCII，无法判断）
+    """
+    head = data[:limit]
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    try:
+        decoder.decode(head, final=len(data) <= limit)
+    except UnicodeDecodeError:
+        return False
+    return None if head.isascii() else True
+
+
+def universal_newlines(text):
+    """换行统一为 \n（与文本模式 open 的行为一致），Windows 导出的 \r\n 文件才能被按 \n 编写的正则匹配"""
+    return text.replace('\r\n', '\n').replace('\r', '\n')
+
+
+def detect_and_decode(data, hint=None):
+    """
+    检测编码并解码：BOM -> 缓存的编码（已排除 UTF-8 时）-> UTF-8 -> GBK/GB18030 -> latin1
+    :return: (文本, 实际使用的编码)
+    """
+    encoding = bom_encoding(data)
+    if encoding:
+        return data.decode(encoding), encoding
+
+    if hint and hint != 'utf-8' and looks_like_utf8(data) is False:
+        try:
+            return data.decode(hint), hint
+        except UnicodeDecodeError:
+            pass
+
+    for encoding in ['utf-8'] + FALLBACK_ENCODINGS:
+        try:
+            return data.decode(encoding), encoding
+        except UnicodeDecodeError:
+            continue
+
+
+def decode_bytes(data, hint=None):
+    """
+    解码文件内容并统一换行（按字节读取不经过文本模式的换行转换，需自行处理 \r\n）
+    :return: (文本, 实际使用的编码)
+    """
+    text, encoding = detect_and_decode(data, hint)
+    return universal_newlines(text), encoding
+
+
+def read_text(file_path, source=None):
+    """
+    只读取一次文件字节并检测编码后解码
+    :param source: 数据来源目录（缓存键），默认为文件所在目录
+    :return: (文本, 编码)
+    """
+    with open(file_path, 'rb') as f:
+        data = f.read()
+    key = source or os.path.dirname(file_path)
+    text, encoding = decode_bytes(data, _folder_encodings.get(key))
+    if encoding in CACHEABLE_ENCODINGS:
+        _folder_encodings[key] = encoding
+    return text, encoding
@@ -1,16 +1,18 @@
 import os
-import requests
 import re
-import time
 import sys  # 添加sys模块用于命令行参数
 import math  # 添加math模块用于计算分片
 
-# 修改：导入API_TOKENS（列表）代替API_TOKEN
-from config import API_TOKENS, INPUT_DIR, OUTPUT_DIR, REQUEST_METHOD, PROMPT_DIR
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.boilerplate import load_or_learn_boilerplate, report_boilerplate
+from common.profiling import profiling_requested, start_profiling, finish_profiling
+from common.logging_utils import setup_logging
+from common.input_index import list_patients
+from common.normalizer import load_prompts, make_backend, normalize_directory
+from common.near_duplicate import NearDuplicateIndex, report_near_duplicates
 
-# 确保输出目录存在
-if not os.path.exists(OUTPUT_DIR):
-    os.makedirs(OUTPUT_DIR)
+# 修改：导入API_TOKENS（列表）代替API_TOKEN
+from config import API_TOKENS, INPUT_DIR, OUTPUT_DIR, REQUEST_METHOD, PROMPT_DIR, BOILERPLATE_FILE, NEAR_DUPLICATE_THRESHOLD
 
 # 定义文件类型与提示词的映射关系（17种-静态匹配）
 PROMPT_MAPPING = {
@@ -20,185 +22,84 @@ PROMPT_MAPPING = {
 }
 # 动态匹配日常病程记录文件名的正则表达式
 DAILY_COURSE_PATTERN = re.compile(r'^(\(拆分\))?病程记录(\d+)?\.txt$')
+# 所有日常病程记录使用同一个提示词
+DAILY_PROMPT = "病程记录提示词.txt"
+
+# API调用参数（接口地址和延迟可通过环境变量覆盖，例如对接本地模拟服务做基准测试）
+API_URL = os.environ.get('LLM_API_URL', "https://api.siliconflow.cn/v1/chat/completions")
+API_DELAY = float(os.environ.get('LLM_API_DELAY', 0.5))  # API调用之间的秒延迟
+CONCURRENCY = int(os.environ.get('LLM_CONCURRENCY', 1))  # 每个实例同时进行的请求数（接口限速允许时可调大）
+
+
+def run_instance(instance_index, profile=False):
+    """
+    处理分配给第 instance_index 个实例（使用第 instance_index 个API密钥）的患者
+    处理逻辑在 common/normalizer.py 中，其他程序或笔记本可直接导入 normalize / normalize_directory，
+    在同一进程中反复调用（复用已读取的提示词和接口连接）
+    :return: 处理统计（见 normalize_directory）
+    """
+    total_instances = len(API_TOKENS)
+    print(f"当前实例索引: {instance_index}/{total_instances - 1}")
+    print(f"使用的API密钥: ...{API_TOKENS[instance_index][-6:]}")
+    profile_state = start_profiling(f"LLM批处理-实例{instance_index}", profile)
+    try:
+        # 逐个患者/文件的记录为 DEBUG 级别，只写入 logs/ 下本实例的 JSONL 日志（设置 LOG_LEVEL=DEBUG 时同时显示在终端）
+        setup_logging(f"LLM批处理-实例{instance_index}")
+
+        # 确保输出目录存在
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
+
+        # ============================== 获取并分配患者文件夹 ==============================
+        all_patient_dirs = list_patients(INPUT_DIR)
+
+        total_patients = len(all_patient_dirs)
+        patients_per_instance = math.ceil(total_patients / total_instances)
+        start_index = instance_index * patients_per_instance
+        end_index = min(start_index + patients_per_instance, total_patients)
+
+        print(f"总患者数: {total_patients} | 本实例处理: {start_index}-{end_index - 1}")
+
+        # ============================== 模板行过滤 ==============================
+        # 按段落类型删除在全部输入中高频出现的模板行（签名栏、固定标题等），减少发送给模型的 token
+        boilerplate = load_or_learn_boilerplate(INPUT_DIR, BOILERPLATE_FILE) if BOILERPLATE_FILE else {}
+        boilerplate_counts = {}  # 各段落类型的删除统计
+
+        # ============================== 主处理 ==============================
+        prompts = load_prompts(PROMPT_DIR, PROMPT_MAPPING, DAILY_COURSE_PATTERN, DAILY_PROMPT)
+        backend = make_backend(REQUEST_METHOD, API_TOKENS[instance_index], API_URL)
+        # 近似重复复用（出院医嘱、诊疗计划等常常只差日期或数值）
+        near_duplicates = NearDuplicateIndex(NEAR_DUPLICATE_THRESHOLD) if NEAR_DUPLICATE_THRESHOLD else None
+        # 修改：只处理分配范围内的患者文件夹
+        stats = normalize_directory(INPUT_DIR, OUTPUT_DIR, prompts, backend, all_patient_dirs[start_index:end_index],
+                                    concurrency=CONCURRENCY, delay=API_DELAY,
+                                    boilerplate=boilerplate, boilerplate_counts=boilerplate_counts,
+                                    skip_reply='空',  # 模型返回'空'表示该段落没有需要提取的内容，不保存
+                                    near_duplicates=near_duplicates, desc=f"实例{instance_index}")
+
+        report_boilerplate(boilerplate_counts)
+        report_near_duplicates(near_duplicates)
+    finally:
+        finish_profiling(profile_state)
+    print("\n所有患者病历处理完成！")
+    return stats
+
+
+if __name__ == "__main__":
+    # 用法：python txttojointtoLLM-own-Batchprocessing.py 实例索引 [--profile]
+    # 带 --profile 运行时输出本实例的性能分析结果（需在解析实例索引之前去掉该开关）
+    profile = profiling_requested()
+    if len(sys.argv) < 2:
+        print("请指定实例索引（0到总实例数-1）")
+        sys.exit(1)
 
-# API调用参数
-API_DELAY = 0.5  # API调用之间的秒延迟
-MAX_RETRIES = 5
-BASE_RETRY_DELAY = 1  # 第一次重试的秒数
-
-# ============================== 新增部分：命令行参数处理 ==============================
-if len(sys.argv) < 2:
-    print("请指定实例索引（0到总实例数-1）")
-    sys.exit(1)
-
-try:
-    INSTANCE_INDEX = int(sys.argv[1])
-    TOTAL_INSTANCES = len(API_TOKENS)
+    try:
+        instance_index = int(sys.argv[1])
+    except ValueError as e:
+        print(f"参数错误: {e}")
+        sys.exit(1)
 
-    if INSTANCE_INDEX < 0 or INSTANCE_INDEX >= TOTAL_INSTANCES:
-        print(f"错误：实例索引必须在0到{TOTAL_INSTANCES - 1}之间")
+    if instance_index < 0 or instance_index >= len(API_TOKENS):
+        print(f"错误：实例索引必须在0到{len(API_TOKENS) - 1}之间")
         sys.exit(1)
 
-    print(f"当前实例索引: {INSTANCE_INDEX}/{TOTAL_INSTANCES - 1}")
-    print(f"使用的API密钥: ...{API_TOKENS[INSTANCE_INDEX][-6:]}")
-
-except Exception as e:
-    print(f"参数错误: {e}")
-    sys.exit(1)
-
-# ============================== 新增部分：获取并分配患者文件夹 ==============================
-# 获取所有患者文件夹并排序
-all_patient_dirs = sorted([
-    d for d in os.listdir(INPUT_DIR)
-    if os.path.isdir(os.path.join(INPUT_DIR, d))
-])
-
-total_patients = len(all_patient_dirs)
-patients_per_instance = math.ceil(total_patients / TOTAL_INSTANCES)
-start_index = INSTANCE_INDEX * patients_per_instance
-end_index = min(start_index + patients_per_instance, total_patients)
-
-print(f"总患者数: {total_patients} | 本实例处理: {start_index}-{end_index - 1}")
-
-# ============================== 主处理循环 ==============================
-# 修改：只处理分配范围内的患者文件夹
-for idx in range(start_index, end_index):
-    patient_dir_name = all_patient_dirs[idx]
-    patient_path = os.path.join(INPUT_DIR, patient_dir_name)
-
-    # 创建对应的输出目录
-    output_patient_dir = os.path.join(OUTPUT_DIR, patient_dir_name)
-    if not os.path.exists(output_patient_dir):
-        os.makedirs(output_patient_dir)
-
-    print(f"\n处理患者 {idx + 1}/{total_patients}: {patient_dir_name}")
-
-    # 处理患者文件夹中的每个文件
-    for filename in os.listdir(patient_path):
-        file_path = os.path.join(patient_path, filename)
-        if not os.path.isfile(file_path):
-            continue  # 跳过非文件项
-
-        # 确定输出文件路径，检查是否已经处理
-        output_filename = f"{os.path.splitext(filename)[0]}_response.txt"
-        output_file_path = os.path.join(output_patient_dir, output_filename)
-
-        # --- 优化：缓存结果 ---
-        if os.path.exists(output_file_path):
-            print(f"✓ {filename} 已处理")
-            continue  # 跳到下一个文件
-
-        # 根据文件名获取对应的提示词
-        # 优先检查是否是日常病程记录（动态文件名）
-        if DAILY_COURSE_PATTERN.match(filename):
-            prompt_file = "病程记录提示词.txt"  # 所有日常病程记录使用同一个提示词
-        else:
-            # 其他文件使用静态映射
-            prompt_file = PROMPT_MAPPING.get(filename)
-
-        if not prompt_file:
-            print(f"未找到 {filename} 的提示词映射，跳过处理")
-            continue
-
-        # Read prompt file
-        prompt_path = os.path.join(PROMPT_DIR, prompt_file)
-        if not os.path.exists(prompt_path):
-            print(f"提示词文件 {prompt_path} 不存在，跳过处理")
-            continue
-
-        with open(prompt_path, 'r', encoding='utf-8') as prompt_f:
-            prompt = prompt_f.read().strip()
-
-        # 读取病历文件内容
-        with open(file_path, 'r', encoding='utf-8') as record_file:
-            file_content = record_file.read()
-
-        # 组合提示词和文件内容
-        content = prompt + "\n\n" + file_content
-        message_content = ""  # 为重试循环初始化message_content
-
-        # --- 优化：具有指数回退的重试机制 ---
-        for attempt in range(MAX_RETRIES):
-            try:
-                if REQUEST_METHOD == 'siliconflow':
-                    payload = {
-                        "model": "deepseek-ai/DeepSeek-R1",
-                        "messages": [{"role": "user", "content": content}],
-                        "stream": False,
-                        "max_tokens": 16384,    # 输出的最大长度
-                        "temperature": 0.1,
-                        "top_p": 0.95,
-                        "top_k": 20,
-                        "frequency_penalty": 0.0,
-                        "response_format": {"type": "text"}
-                    }
-                    headers = {
-                        # 修改：使用当前实例的API密钥
-                        "Authorization": f"Bearer {API_TOKENS[INSTANCE_INDEX]}",
-                        "Content-Type": "application/json"
-                    }
-                    response = requests.post(
-                        "https://api.siliconflow.cn/v1/chat/completions",
-                        json=payload,
-                        headers=headers
-                    )
-                    print(response)
-                    response.raise_for_status()  # 引发HTTP错误异常
-                    response_data = response.json()
-                    message_content = response_data['choices'][0]['message']['content']
-                    break  # 成功, 打破重试循环
-
-                elif REQUEST_METHOD == 'deepseek':
-                    from openai import OpenAI
-
-                    # 修改：使用当前实例的API密钥
-                    client = OpenAI(
-                        api_key=API_TOKENS[INSTANCE_INDEX],
-                        base_url="https://api.deepseek.com"
-                    )
-                    response = client.chat.completions.create(
-                        model="deepseek-chat",
-                        messages=[{"role": "user", "content": content}],
-                        stream=False,
-                        timeout=30  # 添加超时设置
-                    )
-                    message_content = response.choices[0].message.content
-                    break  # 成功, 打破重试循环
-
-            except requests.exceptions.RequestException as e:
-                print(f"API request failed for {filename} (Attempt {attempt + 1}/{MAX_RETRIES}): {e}")
-                if attempt < MAX_RETRIES - 1:
-                    wait_time = BASE_RETRY_DELAY * (2 ** attempt)
-                    print(f"Retrying in {wait_time:.2f} seconds...")
-                    time.sleep(wait_time)
-                else:
-                    print(f"Max retries reached for {filename}. Skipping this file.")
-                    message_content = ""  # 如果所有重试都失败，则设置为空
-                    break  # 退出重试循环
-            except Exception as e:  # 捕获其他潜在错误，如JSON解析
-                print(f"An unexpected error occurred for {filename} (Attempt {attempt + 1}/{MAX_RETRIES}): {e}")
-                if attempt < MAX_RETRIES - 1:
-                    wait_time = BASE_RETRY_DELAY * (2 ** attempt)
-                    print(f"Retrying in {wait_time:.2f} seconds...")
-                    time.sleep(wait_time)
-                else:
-                    print(f"Max retries reached for {filename} due to unexpected error. Skipping this file.")
-                    message_content = ""
-                    break
-
-        # 如果重试后message_content为空，则跳过保存
-        if not message_content:
-            continue
-
-        # 保存处理结果
-        message_content = message_content.lstrip()  # 关键修改：清除前导空格
-        if message_content != '空':
-            with open(output_file_path, 'w', encoding='utf-8') as output_file:
-                output_file.write(message_content)  # 写入已清理的内容
-
-        print(f"✓ {filename} 处理完成 → {output_filename}")
-
-        # ---优化：引入延迟---
-        time.sleep(API_DELAY)
-
-print("\n所有患者病历处理完成！")
\ No newline at end of file
+    run_instance(instance_index, profile)
\ No newline at end of file